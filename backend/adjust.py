@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+
+# 支持的复权方式：前复权、后复权、不复权
+ADJUST_MODES = ('qfq', 'hfq', 'none')
+
+# 复权时需要调整的价格列（成交量、成交额、涨跌幅等保持不变）
+PRICE_COLUMNS = ('开盘', '收盘', '最高', '最低', '涨跌额')
+
+# 复权因子表中每次除权除息的因子列
+FACTOR_COL = '复权因子'
+
+
+def factors_from_hfq(hfq_factors):
+    """
+    将数据源提供的累计后复权因子转换为每次除权除息的因子
+
+    累计因子 = 截至该日所有除权除息因子的连乘，因此相邻两行之比即为当次的因子。
+    只保存每次事件的因子后，新增一次分红只会新增一行，历史行保持不变。
+
+    参数:
+    hfq_factors: pandas Series, 以除权除息日为索引的累计后复权因子
+
+    返回:
+    pandas DataFrame, 以除权除息日为索引，包含'复权因子'列
+    """
+    hfq_factors = hfq_factors.astype(np.float64).sort_index()
+    hfq_factors = hfq_factors[~hfq_factors.index.duplicated(keep='last')]
+    values = hfq_factors.to_numpy()
+    ratios = np.empty(len(values))
+    if len(values) > 0:
+        ratios[0] = values[0]
+        ratios[1:] = values[1:] / values[:-1]
+    return pd.DataFrame({FACTOR_COL: ratios}, index=hfq_factors.index.rename('日期'))
+
+
+def cumulative_factors(factors, index):
+    """
+    每根K线对应的累计后复权因子
+
+    对除权除息因子做一次累乘，再按K线日期查找不晚于该日的最近一次事件，全部为向量化计算。
+
+    参数:
+    factors: pandas DataFrame, factors_from_hfq的结果
+    index: pandas.DatetimeIndex, K线日期
+
+    返回:
+    tuple: (numpy.ndarray 每根K线的累计因子, float 最新的累计因子)
+    """
+    if factors is None or len(factors) == 0:
+        return np.ones(len(index)), 1.0
+    cumulative = np.cumprod(factors[FACTOR_COL].to_numpy(dtype=np.float64))
+    positions = factors.index.searchsorted(index, side='right') - 1
+    # 第一次事件之前的K线因子为1
+    per_bar = np.where(positions >= 0, cumulative[np.maximum(positions, 0)], 1.0)
+    return per_bar, cumulative[-1]
+
+
+def adjust_prices(bars, factors, adjust='qfq'):
+    """
+    由不复权K线和复权因子计算复权价格
+
+    - 后复权（hfq）：价格 × 累计因子，历史价格保持不变，最新价格随分红送股增大
+    - 前复权（qfq）：价格 × 累计因子 / 最新累计因子，最新价格等于实际价格
+    - 不复权（none）：原始价格
+
+    参数:
+    bars: pandas DataFrame, 以日期为索引的不复权K线
+    factors: pandas DataFrame 或 None, factors_from_hfq的结果
+    adjust: str, 'qfq'、'hfq' 或 'none'
+
+    返回:
+    pandas DataFrame, 复权后的K线（新的DataFrame，不修改bars）
+    """
+    if adjust not in ADJUST_MODES:
+        raise ValueError(f"不支持的复权方式: {adjust}")
+    if adjust == 'none':
+        return bars
+    per_bar, latest = cumulative_factors(factors, bars.index)
+    if adjust == 'qfq':
+        per_bar = per_bar / latest
+    columns = [col for col in PRICE_COLUMNS if col in bars.columns]
+    adjusted = bars.copy()
+    adjusted[columns] = bars[columns].to_numpy(dtype=np.float64) * per_bar[:, np.newaxis]
+    return adjusted
@@ -1,44 +1,343 @@
+import copy
+import hashlib
+from collections.abc import Mapping
+
 import pandas as pd
 import numpy as np
 
+import strategies
+from strategies import INTERMEDIATE_COLUMNS
+
+
+# 风险离场类型（回测数据'离场'列的取值）
+EXIT_NONE = 0
+EXIT_STOP_LOSS = 1
+EXIT_TAKE_PROFIT = 2
+EXIT_TRAILING_STOP = 3
+
+# 紧凑回测数据中保留float64的列：资金精确到分、成交量和成交额数值较大，float32只有约7位有效数字
+FLOAT64_COLUMNS = ('总资金', '可用资金', '持仓价值', '交易成本', '成交量', '成交额')
+
+
+class BacktestResults(Mapping):
+    """
+    回测绩效指标
+    
+    各指标以Python float保存在__slots__属性中，同时实现只读映射接口，
+    可以继续按中文指标名访问（results['夏普比率']、results.items()），与dict的用法兼容。
+    """
+    
+    # 指标名 -> 属性名
+    FIELDS = {
+        '初始资金': 'initial_capital',
+        '最终资金': 'final_capital',
+        '累计收益率': 'total_return',
+        '年化收益率': 'annual_return',
+        '最大回撤': 'max_drawdown',
+        '夏普比率': 'sharpe_ratio',
+        '胜率': 'win_rate',
+        '盈亏比': 'profit_loss_ratio',
+    }
+    __slots__ = tuple(FIELDS.values())
+    
+    def __init__(self, initial_capital: float, final_capital: float, total_return: float, annual_return: float,
+                 max_drawdown: float, sharpe_ratio: float, win_rate: float, profit_loss_ratio: float):
+        self.initial_capital = float(initial_capital)
+        self.final_capital = float(final_capital)
+        self.total_return = float(total_return)
+        self.annual_return = float(annual_return)
+        self.max_drawdown = float(max_drawdown)
+        self.sharpe_ratio = float(sharpe_ratio)
+        self.win_rate = float(win_rate)
+        self.profit_loss_ratio = float(profit_loss_ratio)
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, self.FIELDS[key])
+        except KeyError:
+            raise KeyError(key) from None
+    
+    def __iter__(self):
+        return iter(self.FIELDS)
+    
+    def __len__(self):
+        return len(self.FIELDS)
+    
+    def to_dict(self):
+        """转换为 指标名 -> 数值 的dict"""
+        return {key: getattr(self, name) for key, name in self.FIELDS.items()}
+    
+    def __repr__(self):
+        return f"BacktestResults({self.to_dict()})"
+
+
+class EngineState:
+    """
+    回测账户与绩效指标的延续状态
+    
+    每次BacktestEngine.run结束后更新。分块回测时下一个分块从该状态继续，
+    因此绩效指标只依赖这些累加量，不需要把全部历史K线保留在内存中。
+    
+    参数:
+    initial_capital: float, 初始资金
+    """
+    
+    def __init__(self, initial_capital=100000):
+        self.initial_capital = initial_capital
+        # 账户
+        self.held = 0
+        self.available = float(initial_capital)
+        self.total = float(initial_capital)
+        self.last_price = None
+        # 止损/止盈：当前持仓的开仓成交价和开仓后的最高价（持仓跨分块时延续）
+        self.entry_price = None
+        self.peak_price = None
+        # 基准与策略净值（1 + 累计收益率）
+        self.benchmark_nav = 1.0
+        self.strategy_nav = 1.0
+        # 回撤：历史最高累计收益率与最大回撤
+        self.peak_return = np.nan
+        self.max_drawdown = np.nan
+        # 策略收益率的样本数、均值和离差平方和（用于合并计算标准差）
+        self.n_bars = 0
+        self.n_returns = 0
+        self.mean_return = 0.0
+        self.m2_return = 0.0
+        # 信号K线的盈亏统计
+        self.signal_bars = 0
+        self.profitable_bars = 0
+        self.profit_sum = 0.0
+        self.loss_sum = 0.0
+    
+    @property
+    def started(self):
+        """是否已经处理过K线"""
+        return self.n_bars > 0
+    
+    def update_returns(self, strategy_returns, cumulative_returns, signals):
+        """
+        合并一段K线的收益率统计
+        
+        参数:
+        strategy_returns: numpy.ndarray, 策略收益率（首根K线为NaN）
+        cumulative_returns: numpy.ndarray, 策略累计收益率
+        signals: numpy.ndarray, 信号序列
+        """
+        self.n_bars += len(strategy_returns)
+        
+        # 最大回撤：(累计收益率 - 历史最高) / (1 + 历史最高)
+        running_max = np.fmax.accumulate(np.r_[self.peak_return, cumulative_returns])[1:]
+        drawdown = (cumulative_returns - running_max) / (1 + running_max)
+        if len(running_max) > 0:
+            self.peak_return = running_max[-1]
+        if not np.isnan(drawdown).all():
+            self.max_drawdown = np.fmin(self.max_drawdown, np.nanmin(drawdown))
+        
+        # 收益率均值和离差平方和，按分块合并（Chan等人的并行方差公式）
+        valid = strategy_returns[~np.isnan(strategy_returns)]
+        if len(valid) > 0:
+            count = len(valid)
+            mean = valid.sum() / count
+            m2 = ((mean - valid) ** 2).sum()
+            if self.n_returns == 0:
+                self.mean_return, self.m2_return = mean, m2
+            else:
+                total_count = self.n_returns + count
+                delta = mean - self.mean_return
+                self.mean_return += delta * count / total_count
+                self.m2_return += m2 + delta ** 2 * self.n_returns * count / total_count
+            self.n_returns += count
+        
+        # 胜率和盈亏比
+        # 简化计算：假设每次信号都是一笔完整的交易（买入后卖出）
+        trade_returns = strategy_returns[signals != 0]
+        self.signal_bars += len(trade_returns)
+        profitable = trade_returns[trade_returns > 0]
+        self.profitable_bars += len(profitable)
+        self.profit_sum += profitable.sum()
+        self.loss_sum += trade_returns[trade_returns < 0].sum()
+    
+    def results(self, periods_per_year=252):
+        """
+        由累加量计算绩效指标
+        
+        参数:
+        periods_per_year: int, 每年K线数量
+        
+        返回:
+        BacktestResults: 回测结果
+        """
+        total_return = self.strategy_nav - 1 if self.n_bars > 1 else np.nan
+        
+        # 年化收益率
+        if self.n_bars > 0:
+            annual_return = (1 + total_return) ** (periods_per_year / self.n_bars) - 1
+        else:
+            annual_return = 0
+        
+        # 夏普比率（假设无风险利率为0）
+        sharpe_ratio = 0
+        if self.n_returns > 1:
+            annualized_volatility = np.sqrt(self.m2_return / (self.n_returns - 1)) * np.sqrt(periods_per_year)
+            if annualized_volatility > 0:
+                sharpe_ratio = annual_return / annualized_volatility
+        
+        # 胜率和盈亏比
+        if self.signal_bars > 0:
+            win_rate = self.profitable_bars / self.signal_bars
+            loss_sum = abs(self.loss_sum)
+            profit_loss_ratio = self.profit_sum / loss_sum if loss_sum > 0 else 0
+        else:
+            win_rate = 0
+            profit_loss_ratio = 0
+        
+        return BacktestResults(
+            initial_capital=self.initial_capital,
+            final_capital=self.total,
+            total_return=total_return,
+            annual_return=annual_return,
+            max_drawdown=self.max_drawdown,
+            sharpe_ratio=sharpe_ratio,
+            win_rate=win_rate,
+            profit_loss_ratio=profit_loss_ratio,
+        )
+
+
+class EngineSnapshot:
+    """
+    回测结束时的紧凑引擎快照，结束日期延长后用于从断点继续回测（见BacktestEngine.resume）
+    
+    只保存累加量和最后一根K线的账户状态、计算新增K线指标所需的末尾K线窗口和账户变化记录，
+    大小只与指标窗口和交易次数有关，不保存输出列、价格和信号数据本身。
+    
+    参数:
+    state: EngineState, 回测结束时的状态（副本）
+    window: pandas DataFrame, 末尾的输入K线（指标预热数据，见strategies.warmup_bars）
+    ledger: dict, 列名 -> numpy.ndarray, 账户发生变化的K线位置（'位置'）及该K线的持仓数量、
+        可用资金、交易成本（和离场类型），用于还原快照之前K线的账户列
+    end: pandas.Timestamp, 快照覆盖的最后一根K线的时间
+    columns: list, 计算摘要的价格列（价格列，使用止损止盈时还有最高/最低/开盘价）
+    digest: str, 已回测K线的价格摘要
+    config: dict, 引擎参数和交易逻辑，参数不同时快照不可用
+    """
+    
+    def __init__(self, state, window, ledger, end, columns, digest, config):
+        self.state = state
+        self.window = window
+        self.ledger = ledger
+        self.end = end
+        self.columns = columns
+        self.digest = digest
+        self.config = config
+    
+    def __len__(self):
+        return self.state.n_bars
+    
+    def matches(self, data):
+        """
+        快照覆盖的K线在data中是否没有变化（前复权价格因新的分红送股整体调整时不一致）
+        
+        参数:
+        data: pandas DataFrame, 当前的价格数据
+        
+        返回:
+        bool
+        """
+        n_done = len(self)
+        return (0 < n_done <= len(data) and data.index[n_done - 1] == self.end
+                and _price_digest(data[self.columns].iloc[:n_done]) == self.digest)
+
+
+def _price_digest(prices):
+    """价格数据（含日期索引）的摘要"""
+    row_hashes = pd.util.hash_pandas_object(prices, index=True).to_numpy()
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()
+
 
 class BacktestEngine:
     """
     通用回测引擎，支持多种交易策略
     
+    引擎只读取输入数据，不会复制或修改传入的DataFrame，
+    回测过程中只为输出列分配内存，因此多个请求可以共享同一份缓存的价格数据。
+    
     参数:
-    data: pandas DataFrame, 包含股票价格和交易信号
+    data: pandas DataFrame, 包含股票价格（以及交易信号，未单独传入signals时）
     initial_capital: float, 初始资金
     signal_col: str, 信号列名称，默认'信号'
     price_col: str, 价格列名称，默认'收盘'
     transaction_cost: float, 交易成本（佣金+印花税），默认0.001（0.1%）
     slippage: float, 滑点，默认0.0005（0.05%）
+    signals: pandas DataFrame 或 None, 策略函数返回的信号/指标数据，与data共用日期索引
+        （从快照继续回测时可以只包含末尾新增的K线，见resume）
+    periods_per_year: int, 每年K线数量，日线为252，分钟线见data.bars_per_year
+    stop_loss: float 或 None, 止损比例，最低价跌破 开仓价*(1-stop_loss) 时全部卖出
+    take_profit: float 或 None, 止盈比例，最高价突破 开仓价*(1+take_profit) 时全部卖出
+    trailing_stop: float 或 None, 移动止损比例，最低价跌破 开仓后最高价*(1-trailing_stop) 时全部卖出
+    
+    止损止盈以持仓从无到有时的买入成交价为开仓价，按K线内的最高/最低价判断是否触发，
+    在触发价成交（开盘即跳空越过触发价时按开盘价成交）；同一根K线同时触及止损和止盈时按止损处理。
     """
     
+    # 止损止盈使用的K线内价格列
+    high_col = '最高'
+    low_col = '最低'
+    open_col = '开盘'
+    
     def __init__(self, data, initial_capital=100000, signal_col='信号', price_col='收盘', 
-                transaction_cost=0.001, slippage=0.0005):
-        self.data = data.copy()
+                transaction_cost=0.001, slippage=0.0005, signals=None, periods_per_year=252,
+                stop_loss=None, take_profit=None, trailing_stop=None):
+        self.data = data
+        self.signals = signals
         self.initial_capital = initial_capital
         self.signal_col = signal_col
         self.price_col = price_col
         self.transaction_cost = transaction_cost
         self.slippage = slippage
+        self.periods_per_year = periods_per_year
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.trailing_stop = trailing_stop
         
         # 验证数据
         self._validate_data()
         
         # 初始化回测结果
-        self.backtest_data = None
+        self.output = None
+        self._backtest_data = None
         self.results = {}
+        self.state = None
+        # 最近一次完整回测的交易逻辑参数（分段回测时为None，不能生成快照）
+        self._run_config = None
     
     def _validate_data(self):
         """验证输入数据的完整性"""
-        required_cols = [self.price_col, self.signal_col]
-        for col in required_cols:
-            if col not in self.data.columns:
-                raise ValueError(f"数据中缺少必要列: {col}")
+        if self.price_col not in self.data.columns:
+            raise ValueError(f"数据中缺少必要列: {self.price_col}")
+        if self.signals is not None:
+            if self.signal_col not in self.signals.columns:
+                raise ValueError(f"信号数据中缺少必要列: {self.signal_col}")
+            # 从快照继续回测时信号数据可以只包含末尾新增的K线（见resume）
+            if not self.signals.index.equals(self.data.index[len(self.data) - len(self.signals):]):
+                raise ValueError("信号数据与价格数据的日期索引不一致")
+        elif self.signal_col not in self.data.columns:
+            raise ValueError(f"数据中缺少必要列: {self.signal_col}")
+        if self.has_exits:
+            for col in (self.high_col, self.low_col):
+                if col not in self.data.columns:
+                    raise ValueError(f"使用止损止盈时数据中缺少必要列: {col}")
     
-    def run(self, trade_logic='full', trade_param=None):
+    @property
+    def has_exits(self):
+        """是否设置了止损/止盈/移动止损"""
+        return bool(self.stop_loss or self.take_profit or self.trailing_stop)
+    
+    def _signal_series(self):
+        """信号列（优先取自单独传入的信号数据）"""
+        source = self.signals if self.signals is not None else self.data
+        return source[self.signal_col]
+    
+    def run(self, trade_logic='full', trade_param=None, state=None):
         """
         执行回测
         
@@ -51,74 +350,440 @@ class BacktestEngine:
             - 'full': 无需参数
             - 'fixed': {'quantity': int} - 固定交易数量
             - 'percent': {'percent': float} - 交易资金百分比(0-1)
+        state: EngineState 或 None, 前一段回测结束时的状态；传入时从该状态继续回测，
+            返回的绩效指标覆盖之前所有分段
         
         返回:
         dict: 回测结果
         """
-        # 初始化回测数据
-        self.backtest_data = self.data.copy()
+        if self.signals is not None and len(self.signals) != len(self.data):
+            raise ValueError("信号数据只包含部分K线，只能用于从快照继续回测")
+        self._run_config = self._config(trade_logic, trade_param) if state is None else None
+        if state is None:
+            state = EngineState(self.initial_capital)
+        self.state = state
         
-        # 计算基础指标
-        self._calculate_base_metrics()
+        # 只读取输入列，输出列单独分配
+        prices = self.data[self.price_col].to_numpy(dtype=np.float64)
+        signals = self._signal_series().to_numpy()
+        self.output = pd.DataFrame(index=self.data.index)
         
-        # 初始化账户
-        self._initialize_account()
+        # 计算基础指标
+        self._calculate_base_metrics(prices, state)
         
         # 执行回测循环
-        for i in range(1, len(self.backtest_data)):
-            self._process_trade(i, trade_logic, trade_param)
+        previous_total = state.total if state.started else np.nan
+        account = self._simulate(prices, signals, trade_logic, trade_param, state)
+        for col, values in account.items():
+            self.output[col] = values
+        
+        # 计算回测指标（风险离场视为卖出信号）
+        if '离场' in account:
+            signals = np.where(account['离场'] != EXIT_NONE, -1, signals)
+        self._calculate_backtest_metrics(signals, previous_total, state)
+        
+        # 完整回测数据在首次访问backtest_data时才拼接
+        self._backtest_data = None
+        
+        return self.results
+    
+    def _config(self, trade_logic, trade_param):
+        """影响回测结果的参数（快照必须在相同参数下使用）"""
+        return {
+            'initial_capital': self.initial_capital, 'price_col': self.price_col,
+            'transaction_cost': self.transaction_cost, 'slippage': self.slippage,
+            'periods_per_year': self.periods_per_year, 'stop_loss': self.stop_loss,
+            'take_profit': self.take_profit, 'trailing_stop': self.trailing_stop,
+            'trade_logic': trade_logic, 'trade_param': trade_param,
+        }
+    
+    def _digest_columns(self):
+        """快照摘要覆盖的价格列（日期、价格及止损止盈使用的价格）"""
+        columns = [self.price_col]
+        if self.has_exits:
+            columns += [col for col in (self.high_col, self.low_col, self.open_col) if col in self.data.columns]
+        return columns
+    
+    def snapshot(self, window=0):
+        """
+        保存回测结束时的快照（完整回测或resume之后可用）
+        
+        参数:
+        window: int, 保存的末尾K线数，继续回测时用于计算新增K线的指标（见strategies.warmup_bars）
+        
+        返回:
+        EngineSnapshot
+        """
+        if self._run_config is None or len(self.output) == 0:
+            raise ValueError("只有完整回测之后才能保存快照")
+        n_bars = len(self.output)
+        columns = self._digest_columns()
+        return EngineSnapshot(copy.copy(self.state), self.data.iloc[max(n_bars - window, 0):].copy(), self._ledger(),
+                              self.output.index[-1], columns, _price_digest(self.data[columns]), self._run_config)
+    
+    def _ledger(self):
+        """账户发生变化的K线（首根K线、持仓或可用资金变化、有交易成本或离场）及其账户列"""
+        quantity = self.output['持仓数量'].to_numpy()
+        cash = self.output['可用资金'].to_numpy()
+        changed = self.output['交易成本'].to_numpy() != 0
+        changed[0] = True
+        changed[1:] |= (quantity[1:] != quantity[:-1]) | (cash[1:] != cash[:-1])
+        if '离场' in self.output.columns:
+            changed |= self.output['离场'].to_numpy() != EXIT_NONE
+        positions = np.flatnonzero(changed)
+        ledger = {'位置': positions}
+        for col in ('持仓数量', '可用资金', '交易成本', '离场'):
+            if col in self.output.columns:
+                ledger[col] = self.output[col].to_numpy()[positions]
+        return ledger
+    
+    def _restore_output(self, snapshot):
+        """
+        由快照的账户变化记录和价格向量化还原快照覆盖K线的输出列（不重新模拟，不需要信号）
+        
+        账户列在两次变化之间保持不变，持仓价值和收益率按与run相同的公式计算，结果与完整回测逐位一致。
+        """
+        n_done = len(snapshot)
+        ledger = snapshot.ledger
+        prices = self.data[self.price_col].to_numpy(dtype=np.float64)[:n_done]
+        output = pd.DataFrame(index=self.data.index[:n_done])
+        
+        daily_returns = self._pct_change(prices, np.nan)
+        output['日收益率'] = daily_returns
+        output['基准累计收益率'] = self._cumulative(daily_returns, 1.0)[0]
+        
+        # 每根K线对应的最近一次账户变化
+        positions = ledger['位置']
+        last_change = np.searchsorted(positions, np.arange(n_done), side='right') - 1
+        quantity = ledger['持仓数量'][last_change]
+        cash = ledger['可用资金'][last_change]
+        position_value = quantity * prices
+        total = position_value + cash
+        costs = np.zeros(n_done)
+        costs[positions] = ledger['交易成本']
+        output['持仓数量'] = quantity
+        output['持仓价值'] = position_value
+        output['可用资金'] = cash
+        output['总资金'] = total
+        output['交易成本'] = costs
+        if '离场' in ledger:
+            exit_codes = np.zeros(n_done, dtype=np.int8)
+            exit_codes[positions] = ledger['离场']
+            output['离场'] = exit_codes
+        
+        strategy_returns = self._pct_change(total, np.nan)
+        output['策略收益率'] = strategy_returns
+        output['策略累计收益率'] = self._cumulative(strategy_returns, 1.0)[0]
+        return output
+    
+    def _new_signals(self, n_done):
+        """快照之后新增K线的信号数据（signals可以只包含新增的K线），未单独传入signals时为None"""
+        if self.signals is None:
+            return None
+        if len(self.signals) < len(self.data) - n_done:
+            raise ValueError("信号数据没有覆盖快照之后新增的全部K线")
+        return self.signals.iloc[len(self.signals) - (len(self.data) - n_done):]
+    
+    def resume(self, snapshot, trade_logic='full', trade_param=None):
+        """
+        从之前的快照继续回测：只模拟快照之后新增的K线，绩效累加量在快照的基础上合并，
+        结果与完整回测一致（收益率均值和标准差分段合并，只有浮点舍入上的差别）
         
-        # 计算回测指标
-        self._calculate_backtest_metrics()
+        data需要包含快照覆盖的全部K线且这些K线的价格没有变化，例如同一配置只把结束日期延后；
+        signals可以只包含新增的K线（用快照的window预热指标计算），此时backtest_data中
+        快照之前K线的信号和指标列为空。快照之前K线的输出列由账户变化记录还原。
         
+        参数:
+        snapshot: EngineSnapshot, 之前相同参数的回测快照
+        trade_logic: str, 交易逻辑类型，见run
+        trade_param: dict, 交易逻辑参数
+        
+        返回:
+        dict: 回测结果
+        
+        异常:
+        ValueError: 快照与当前数据或参数不一致（此时应调用run完整回测）
+        """
+        config = self._config(trade_logic, trade_param)
+        n_done = len(snapshot)
+        if snapshot.config != config:
+            raise ValueError("快照的回测参数与当前参数不一致")
+        if n_done == 0 or n_done > len(self.data):
+            raise ValueError("快照的K线数与当前数据不一致")
+        if snapshot.columns != self._digest_columns() or not snapshot.matches(self.data):
+            raise ValueError("快照之前的K线数据已发生变化")
+        
+        state = copy.copy(snapshot.state)
+        output = self._restore_output(snapshot)
+        if n_done < len(self.data):
+            # 新增K线与分块回测相同，从快照状态继续
+            tail = BacktestEngine(
+                self.data.iloc[n_done:], signals=self._new_signals(n_done),
+                signal_col=self.signal_col, **{key: value for key, value in config.items()
+                                               if key not in ('trade_logic', 'trade_param')}
+            )
+            tail.run(trade_logic=trade_logic, trade_param=trade_param, state=state)
+            output = pd.concat([output, tail.output])
+        
+        self.state = state
+        self.output = output
+        self.results = state.results(self.periods_per_year)
+        self._backtest_data = None
+        self._run_config = config
         return self.results
     
-    def _calculate_base_metrics(self):
+    @property
+    def backtest_data(self):
+        """
+        完整回测数据（价格、信号与输出列，保持原始精度），首次访问时拼接，未执行回测时为None
+        
+        只需要图表或输出数据时使用compact_data，不会生成完整的float64副本。
+        """
+        if self._backtest_data is None and self.output is not None:
+            self._backtest_data = self._assemble_backtest_data()
+        return self._backtest_data
+    
+    def _assemble_backtest_data(self, compact=False):
+        """
+        将价格、信号与输出列拼接为回测数据
+        
+        参数:
+        compact: bool, 是否在拼接前对各部分分别做compact_frame的裁剪和类型转换
+        """
+        frames = [self.data]
+        if self.signals is not None:
+            frames.append(self.signals.drop(columns=self.data.columns.intersection(self.signals.columns)))
+        frames.append(self.output)
+        if compact:
+            frames = [compact_frame(frame, self.signal_col) for frame in frames]
+        return pd.concat(frames, axis=1, copy=False)
+    
+    def compact_data(self):
+        """
+        紧凑的回测数据（用于生成图表和输出），见compact_frame
+        
+        直接由输入和输出列分别裁剪、转换后拼接，不经过完整的backtest_data。
+        
+        返回:
+        pandas DataFrame, 与backtest_data行数和列顺序相同
+        """
+        if self.output is None:
+            raise ValueError("尚未执行回测")
+        return self._assemble_backtest_data(compact=True)
+    
+    @staticmethod
+    def _pct_change(values, previous):
+        """与pandas pct_change一致的逐K线涨跌幅，首根K线相对previous计算（previous为NaN时结果为NaN）"""
+        returns = np.empty(len(values))
+        if len(values) > 0:
+            returns[0] = values[0] / previous - 1
+            returns[1:] = values[1:] / values[:-1] - 1
+        return returns
+    
+    @staticmethod
+    def _cumulative(returns, nav):
+        """
+        从净值nav开始连乘(1 + 收益率)，与pandas cumprod一致跳过NaN
+        
+        返回:
+        tuple: (累计收益率序列, 最新净值)
+        """
+        missing = np.isnan(returns)
+        products = np.cumprod(np.r_[nav, np.where(missing, 1.0, 1 + returns)])
+        cumulative = products[1:] - 1
+        cumulative[missing] = np.nan
+        return cumulative, products[-1]
+    
+    def _calculate_base_metrics(self, prices, state):
         """计算基础指标"""
+        previous_price = state.last_price if state.last_price is not None else np.nan
+        
         # 日收益率
-        self.backtest_data['日收益率'] = self.backtest_data[self.price_col].pct_change()
+        daily_returns = self._pct_change(prices, previous_price)
+        self.output['日收益率'] = daily_returns
         
         # 基准收益率（买入持有）
-        self.backtest_data['基准累计收益率'] = (1 + self.backtest_data['日收益率']).cumprod() - 1
-    
-    def _initialize_account(self):
-        """初始化账户信息"""
-        # 持仓数量使用整数类型
-        self.backtest_data['持仓数量'] = 0
-        # 资金相关列使用浮点数类型
-        self.backtest_data['持仓价值'] = 0.0
-        self.backtest_data['可用资金'] = 0.0
-        self.backtest_data['总资金'] = 0.0
-        self.backtest_data['交易成本'] = 0.0
-    
-        # 设置初始资金（转换为浮点数）
-        first_date = self.backtest_data.index[0]
-        self.backtest_data.loc[first_date, '可用资金'] = float(self.initial_capital)
-        self.backtest_data.loc[first_date, '总资金'] = float(self.initial_capital)
-    
-    def _process_trade(self, i, trade_logic, trade_param):
-        """处理每笔交易"""
-        prev_row = self.backtest_data.iloc[i-1]
-        curr_row = self.backtest_data.iloc[i]
-        
-        # 当前价格（考虑滑点）
-        current_price = curr_row[self.price_col]
-        
-        # 复制前一天的持仓和资金
-        self.backtest_data.loc[curr_row.name, '持仓数量'] = prev_row['持仓数量']
-        self.backtest_data.loc[curr_row.name, '可用资金'] = prev_row['可用资金']
-        self.backtest_data.loc[curr_row.name, '交易成本'] = 0
-        
-        # 更新持仓价值和总资金
-        self._update_account_values(curr_row.name, current_price)
-        
-        # 获取当前信号
-        signal = curr_row[self.signal_col]
+        benchmark, state.benchmark_nav = self._cumulative(daily_returns, state.benchmark_nav)
+        self.output['基准累计收益率'] = benchmark
+        
+        if len(prices) > 0:
+            state.last_price = prices[-1]
+    
+    def _simulate(self, prices, signals, trade_logic, trade_param, state):
+        """
+        逐K线模拟账户变化
+        
+        参数:
+        prices: numpy.ndarray, 价格序列
+        signals: numpy.ndarray, 信号序列（1买入，-1卖出，0不操作）
+        state: EngineState, 账户状态（就地更新）
+        
+        返回:
+        dict: 列名 -> numpy.ndarray, 持仓数量、持仓价值、可用资金、总资金和交易成本，
+            设置了止损止盈时还包含离场类型
+        """
+        n = len(prices)
+        quantity = np.zeros(n, dtype=np.int64)
+        position_value = np.zeros(n)
+        cash = np.zeros(n)
+        total = np.zeros(n)
+        costs = np.zeros(n)
+        account = {'持仓数量': quantity, '持仓价值': position_value, '可用资金': cash,
+                   '总资金': total, '交易成本': costs}
+        has_exits = self.has_exits
+        if has_exits:
+            exit_codes = np.zeros(n, dtype=np.int8)
+            account['离场'] = exit_codes
+        if n == 0:
+            return account
+        
+        # 使用Python标量循环，避免逐行访问DataFrame
+        price_list = prices.tolist()
+        signal_list = signals.tolist()
+        held = state.held
+        available = state.available
+        start = 0
+        if not state.started:
+            # 设置初始资金，第一根K线不交易
+            cash[0] = float(self.initial_capital)
+            total[0] = float(self.initial_capital)
+            start = 1
+        
+        # 止损止盈：每次开仓时用数组扫描一次找出首个触发的K线，循环中只比较下标
+        exit_bar = None
+        if has_exits:
+            path = self._price_path()
+            entry_price, peak_price = state.entry_price, state.peak_price
+            scan_from = start
+            if held > 0 and entry_price is not None:
+                exit_bar, exit_price, exit_code = self._scan_exit(path, start, entry_price, peak_price)
+        
+        for i in range(start, n):
+            exit_cost = 0.0
+            if i == exit_bar:
+                held, available, exit_cost = self._exit_position(held, available, exit_price)
+                exit_codes[i] = exit_code
+                exit_bar = entry_price = None
+            was_flat = held == 0
+            held, available, cost = self._process_trade(
+                held, available, price_list[i], signal_list[i], trade_logic, trade_param
+            )
+            if has_exits:
+                if held == 0:
+                    exit_bar = entry_price = None
+                elif was_flat:
+                    # 新开仓：以买入成交价为开仓价，从下一根K线开始检查
+                    entry_price = peak_price = price_list[i] * (1 + self.slippage)
+                    scan_from = i + 1
+                    exit_bar, exit_price, exit_code = self._scan_exit(path, scan_from, entry_price, peak_price)
+            quantity[i] = held
+            cash[i] = available
+            costs[i] = cost + exit_cost
+            position_value[i] = held * price_list[i]
+            total[i] = position_value[i] + available
+        
+        if has_exits:
+            # 持仓延续到下一分块时保存开仓价和开仓后的最高价
+            if held > 0 and entry_price is not None:
+                highs = path[0][scan_from:]
+                if len(highs) > 0:
+                    peak_price = max(peak_price, float(np.nanmax(highs)))
+                state.entry_price, state.peak_price = entry_price, peak_price
+            else:
+                state.entry_price = state.peak_price = None
+        
+        state.held = held
+        state.available = cash[-1]
+        state.total = total[-1]
+        return account
+    
+    def _price_path(self):
+        """止损止盈使用的 (最高价, 最低价, 开盘价) 数组，缺少开盘价时开盘价为None"""
+        highs = self.data[self.high_col].to_numpy(dtype=np.float64)
+        lows = self.data[self.low_col].to_numpy(dtype=np.float64)
+        opens = self.data[self.open_col].to_numpy(dtype=np.float64) if self.open_col in self.data.columns else None
+        return highs, lows, opens
+    
+    def _scan_exit(self, path, start, entry_price, peak_price, block=64):
+        """
+        从start开始查找持仓首次触及止损/止盈/移动止损的K线
+        
+        按块向后扫描（块长度逐次翻倍），持仓很快离场时只需检查少量K线。
+        移动止损线由开仓后截至前一根K线的最高价决定，避免使用同一根K线内先后顺序未知的高低价。
+        
+        参数:
+        path: tuple, _price_path的返回值
+        start: int, 开始检查的位置
+        entry_price: float, 开仓价
+        peak_price: float, start之前的开仓后最高价
+        block: int, 初始扫描块长度
+        
+        返回:
+        tuple: (触发位置, 成交价, 离场类型)，未触发时为 (None, None, EXIT_NONE)
+        """
+        highs, lows, opens = path
+        n = len(highs)
+        stop_level = entry_price * (1 - self.stop_loss) if self.stop_loss else -np.inf
+        take_level = entry_price * (1 + self.take_profit) if self.take_profit else np.inf
+        
+        a = start
+        while a < n:
+            b = min(a + block, n)
+            high = highs[a:b]
+            level = np.full(b - a, stop_level)
+            trailing = None
+            if self.trailing_stop:
+                peaks = np.fmax.accumulate(np.r_[peak_price, high[:-1]])
+                trailing = peaks * (1 - self.trailing_stop)
+                level = np.maximum(level, trailing)
+                peak_price = max(peak_price, float(np.nanmax(high))) if not np.isnan(high).all() else peak_price
+            stop_hit = lows[a:b] <= level
+            take_hit = high >= take_level
+            hits = np.flatnonzero(stop_hit | take_hit)
+            if len(hits) > 0:
+                j = hits[0]
+                bar = a + j
+                open_price = opens[bar] if opens is not None else np.nan
+                gap = not np.isnan(open_price)
+                if take_hit[j] and (not stop_hit[j] or (gap and open_price >= take_level)):
+                    return bar, max(open_price, take_level) if gap else take_level, EXIT_TAKE_PROFIT
+                code = EXIT_TRAILING_STOP if trailing is not None and trailing[j] > stop_level else EXIT_STOP_LOSS
+                return bar, min(open_price, level[j]) if gap else level[j], code
+            a = b
+            block *= 2
+        return None, None, EXIT_NONE
+    
+    def _exit_position(self, held, available, exit_price):
+        """
+        风险离场：按触发价全部卖出
+        
+        返回:
+        tuple: (持仓数量, 可用资金, 交易成本)
+        """
+        sell_price = exit_price * (1 - self.slippage)
+        cost = held * sell_price * self.transaction_cost
+        available += held * sell_price - cost
+        return 0, available, cost
+    
+    def _process_trade(self, held, available, current_price, signal, trade_logic, trade_param):
+        """
+        处理每笔交易
+        
+        参数:
+        held: int, 前一根K线的持仓数量
+        available: float, 前一根K线的可用资金
+        current_price: float, 当前价格
+        signal: int, 当前信号
+        
+        返回:
+        tuple: (持仓数量, 可用资金, 交易成本)
+        """
+        cost = 0.0
         
         # 检查买入信号
-        if signal == 1 and self.backtest_data.loc[curr_row.name, '可用资金'] > 0:
+        if signal == 1 and available > 0:
             # 根据交易逻辑计算买入数量
-            buy_quantity = self._calculate_buy_quantity(self.backtest_data.loc[curr_row.name], current_price, trade_logic, trade_param)
+            buy_quantity = self._calculate_buy_quantity(available, current_price, trade_logic, trade_param)
             
             if buy_quantity > 0:
                 # 计算实际交易价格（考虑滑点）
@@ -126,33 +791,29 @@ class BacktestEngine:
                 # 计算交易成本
                 cost = buy_quantity * buy_price * self.transaction_cost
                 # 更新账户
-                self.backtest_data.loc[curr_row.name, '持仓数量'] += buy_quantity
-                self.backtest_data.loc[curr_row.name, '可用资金'] -= (buy_quantity * buy_price) + cost
-                self.backtest_data.loc[curr_row.name, '交易成本'] += cost
-                # 重新计算总资金和仓位
-                self._update_account_values(curr_row.name, current_price)
+                held += buy_quantity
+                available -= (buy_quantity * buy_price) + cost
         
         # 处理卖出信号
-        elif signal == -1 and self.backtest_data.loc[curr_row.name, '持仓数量'] > 0:
+        elif signal == -1 and held > 0:
             # 根据交易逻辑计算卖出数量
-            sell_quantity = self._calculate_sell_quantity(self.backtest_data.loc[curr_row.name], trade_logic, trade_param)
+            sell_quantity = self._calculate_sell_quantity(held, trade_logic, trade_param)
             if sell_quantity > 0:
                 # 计算实际交易价格（考虑滑点）
                 sell_price = current_price * (1 - self.slippage)
                 # 计算交易成本
                 cost = sell_quantity * sell_price * self.transaction_cost
                 # 更新账户
-                self.backtest_data.loc[curr_row.name, '持仓数量'] -= sell_quantity
-                self.backtest_data.loc[curr_row.name, '可用资金'] += (sell_quantity * sell_price) - cost
-                self.backtest_data.loc[curr_row.name, '交易成本'] += cost
-                # 重新计算总资金和仓位
-                self._update_account_values(curr_row.name, current_price)
+                held -= sell_quantity
+                available += (sell_quantity * sell_price) - cost
+        
+        return held, available, cost
     
-    def _calculate_buy_quantity(self, prev_row, current_price, trade_logic, trade_param):
+    def _calculate_buy_quantity(self, available_cash, current_price, trade_logic, trade_param):
         """计算买入数量"""
         if trade_logic == 'full':
             # 全仓买入
-            available_funds = prev_row['可用资金']
+            available_funds = available_cash
             buy_quantity = int(available_funds / (current_price * (1 + self.slippage) * (1 + self.transaction_cost)))
         elif trade_logic == 'fixed' and trade_param and 'quantity' in trade_param:
             # 固定数量买入
@@ -160,95 +821,41 @@ class BacktestEngine:
         elif trade_logic == 'percent' and trade_param and 'percent' in trade_param:
             # 百分比买入
             percent = trade_param['percent']
-            available_funds = prev_row['可用资金'] * percent
+            available_funds = available_cash * percent
             buy_quantity = int(available_funds / (current_price * (1 + self.slippage) * (1 + self.transaction_cost)))
         else:
             buy_quantity = 0
         
         return max(0, buy_quantity)
     
-    def _calculate_sell_quantity(self, prev_row, trade_logic, trade_param):
+    def _calculate_sell_quantity(self, held_quantity, trade_logic, trade_param):
         """计算卖出数量"""
         if trade_logic == 'full':
             # 全仓卖出
-            sell_quantity = prev_row['持仓数量']
+            sell_quantity = held_quantity
         elif trade_logic == 'fixed' and trade_param and 'quantity' in trade_param:
             # 固定数量卖出
-            sell_quantity = min(prev_row['持仓数量'], trade_param['quantity'])
+            sell_quantity = min(held_quantity, trade_param['quantity'])
         elif trade_logic == 'percent' and trade_param and 'percent' in trade_param:
             # 百分比卖出
             percent = trade_param['percent']
-            sell_quantity = int(prev_row['持仓数量'] * percent)
+            sell_quantity = int(held_quantity * percent)
         else:
             sell_quantity = 0
         
         return max(0, sell_quantity)
     
-    def _update_account_values(self, index, current_price):
-        """更新账户价值"""
-        position_quantity = self.backtest_data.loc[index, '持仓数量']
-        available_cash = self.backtest_data.loc[index, '可用资金']
-        
-        position_value = position_quantity * current_price
-        total_capital = position_value + available_cash
-        
-        self.backtest_data.loc[index, '持仓价值'] = position_value
-        self.backtest_data.loc[index, '总资金'] = total_capital
-    
-    def _calculate_backtest_metrics(self):
+    def _calculate_backtest_metrics(self, signals, previous_total, state):
         """计算回测指标"""
         # 策略收益率
-        self.backtest_data['策略收益率'] = self.backtest_data['总资金'].pct_change()
-        self.backtest_data['策略累计收益率'] = (1 + self.backtest_data['策略收益率']).cumprod() - 1
-        
-        # 计算核心指标
-        self.results['初始资金'] = self.initial_capital
-        self.results['最终资金'] = self.backtest_data['总资金'].iloc[-1]
-        self.results['累计收益率'] = self.backtest_data['策略累计收益率'].iloc[-1]
-        
-        # 年化收益率（假设一年252个交易日）
-        total_days = len(self.backtest_data)
-        if total_days > 0:
-            self.results['年化收益率'] = (1 + self.results['累计收益率']) ** (252 / total_days) - 1
-        else:
-            self.results['年化收益率'] = 0
-        
-        # 最大回撤
-        cumulative_returns = self.backtest_data['策略累计收益率']
-        running_max = cumulative_returns.cummax()
-        drawdown = (cumulative_returns - running_max) / (1 + running_max)
-        self.results['最大回撤'] = drawdown.min()
+        strategy_returns = self._pct_change(self.output['总资金'].to_numpy(), previous_total)
+        cumulative_returns, state.strategy_nav = self._cumulative(strategy_returns, state.strategy_nav)
+        self.output['策略收益率'] = strategy_returns
+        self.output['策略累计收益率'] = cumulative_returns
         
-        # 夏普比率（假设无风险利率为0）
-        strategy_returns = self.backtest_data['策略收益率'].dropna()
-        if len(strategy_returns) > 0:
-            annualized_return = self.results['年化收益率']
-            annualized_volatility = strategy_returns.std() * np.sqrt(252)
-            if annualized_volatility > 0:
-                self.results['夏普比率'] = annualized_return / annualized_volatility
-            else:
-                self.results['夏普比率'] = 0
-        else:
-            self.results['夏普比率'] = 0
-        
-        # 胜率和盈亏比
-        trades = self.backtest_data[self.backtest_data['信号'] != 0]
-        if len(trades) > 0:
-            # 简化计算：假设每次信号都是一笔完整的交易（买入后卖出）
-            # 这里仅作为示例，实际计算需要更复杂的逻辑
-            profitable_trades = len(trades[trades['策略收益率'] > 0])
-            self.results['胜率'] = profitable_trades / len(trades)
-            
-            # 计算盈亏比
-            profit_sum = trades[trades['策略收益率'] > 0]['策略收益率'].sum()
-            loss_sum = abs(trades[trades['策略收益率'] < 0]['策略收益率'].sum())
-            if loss_sum > 0:
-                self.results['盈亏比'] = profit_sum / loss_sum
-            else:
-                self.results['盈亏比'] = 0
-        else:
-            self.results['胜率'] = 0
-            self.results['盈亏比'] = 0
+        # 合并到累加量后计算核心指标
+        state.update_returns(strategy_returns, cumulative_returns, signals)
+        self.results = state.results(self.periods_per_year)
     
     def print_results(self):
         """打印回测结果"""
@@ -300,3 +907,224 @@ class BacktestEngine:
             '回测数据': self.backtest_data,
             '绩效指标': self.results
         }
+
+
+def compact_frame(data, signal_col='信号'):
+    """
+    紧凑的回测数据
+    
+    去掉策略计算的中间列和文本列（如股票代码），价格、指标和收益率转为float32，
+    信号和离场类型转为int8，持仓数量转为int32，资金、成交量和成交额保持float64。
+    
+    参数:
+    data: pandas DataFrame, 完整回测数据（BacktestEngine.backtest_data）
+    signal_col: str, 信号列名称
+    
+    返回:
+    pandas DataFrame, 与data行数相同
+    """
+    drop = [col for col in data.columns if col in INTERMEDIATE_COLUMNS or data[col].dtype == object]
+    data = data.drop(columns=drop)
+    dtypes = {}
+    for col, dtype in data.dtypes.items():
+        if dtype == np.float64 and col not in FLOAT64_COLUMNS:
+            dtypes[col] = np.float32
+        elif col in (signal_col, '离场'):
+            dtypes[col] = np.int8
+        elif col == '持仓数量' and (len(data) == 0 or data[col].max() <= np.iinfo(np.int32).max):
+            dtypes[col] = np.int32
+    return data.astype(dtypes)
+
+
+def iter_chunked_backtest(chunks, strategy, strategy_params=None, warmup=0, trade_logic='full',
+                          trade_param=None, **engine_kwargs):
+    """
+    分块回测的生成器版本：每回测完一个分块产出一次该分块的引擎（见run_chunked_backtest）
+    
+    引擎的results为截至该分块的累计绩效指标，backtest_data只包含该分块的K线，
+    产出后不再被引用，调用方处理完即可释放。
+    
+    返回:
+    生成器, 逐个产出已完成回测的BacktestEngine
+    """
+    strategy_params = strategy_params or {}
+    state = EngineState(engine_kwargs.get('initial_capital', 100000))
+    tail = None
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        # 拼接上一分块末尾的K线作为指标预热数据，只保留当前分块的信号
+        frame = pd.concat([tail, chunk]) if tail is not None else chunk
+        signals = strategy(frame, **strategy_params).iloc[len(frame) - len(chunk):]
+        
+        engine = BacktestEngine(chunk, signals=signals, **engine_kwargs)
+        engine.run(trade_logic=trade_logic, trade_param=trade_param, state=state)
+        yield engine
+        
+        tail = frame.iloc[-warmup:] if warmup > 0 else None
+
+
+def run_chunked_backtest(chunks, strategy, strategy_params=None, warmup=0, trade_logic='full',
+                         trade_param=None, on_chunk=None, **engine_kwargs):
+    """
+    分块回测：逐块生成信号并回测，账户和绩效指标状态跨分块延续
+    
+    适用于多年分钟线等无法一次性读入内存的数据，内存占用只与单个分块大小有关。
+    
+    参数:
+    chunks: 可迭代对象, 按时间顺序产出价格DataFrame（如data.iter_intraday_data）
+    strategy: 策略函数，如strategies.moving_average_crossover_strategy
+    strategy_params: dict 或 None, 策略参数
+    warmup: int, 计算指标需要的历史K线数（见strategies.warmup_bars），
+        上一分块末尾的warmup根K线会拼接到当前分块之前用于计算信号
+    trade_logic: str, 交易逻辑类型，见BacktestEngine.run
+    trade_param: dict, 交易逻辑参数
+    on_chunk: 回调函数 或 None, 接收每个分块的完整回测数据（例如写入文件），
+        不传时分块结果处理完即丢弃
+    engine_kwargs: BacktestEngine的其他参数（initial_capital、periods_per_year等）
+    
+    返回:
+    tuple: (回测结果dict, EngineState)
+    """
+    state = EngineState(engine_kwargs.get('initial_capital', 100000))
+    results = state.results(engine_kwargs.get('periods_per_year', 252))
+    for engine in iter_chunked_backtest(chunks, strategy, strategy_params, warmup, trade_logic, trade_param,
+                                        **engine_kwargs):
+        results, state = engine.results, engine.state
+        if on_chunk is not None:
+            on_chunk(engine.backtest_data)
+    
+    return results, state
+
+
+def metrics_backend(backend=None):
+    """
+    绩效指标的计算后端：与信号相同由QUANT_BACKEND选择（见strategies.SIGNAL_BACKEND），
+    选择polars但未安装时退回pandas
+
+    返回:
+    str: 'pandas' 或 'polars'
+    """
+    if (backend or strategies.SIGNAL_BACKEND) != 'polars':
+        return 'pandas'
+    import polars_backend
+    if polars_backend.available():
+        return 'polars'
+    print("未安装polars，使用pandas计算绩效指标")
+    return 'pandas'
+
+
+def polars_results(total, signal_matrix, initial_capital=100000, periods_per_year=252, exit_matrix=None):
+    """
+    用polars_backend.backtest_results对多条回测一次分组聚合计算绩效指标，结果与BacktestEngine.run一致
+
+    参数:
+    total: array-like, (回测数 × K线数) 的总资金矩阵
+    signal_matrix: array-like, (回测数 × K线数) 的信号矩阵
+    initial_capital: float, 初始资金
+    periods_per_year: int, 每年K线数量
+    exit_matrix: array-like 或 None, (回测数 × K线数) 的离场类型，风险离场视为卖出信号
+
+    返回:
+    list[BacktestResults]: 每条回测的绩效指标
+    """
+    import polars_backend
+    total = np.atleast_2d(np.asarray(total, dtype=np.float64))
+    n_series, n = total.shape
+    frame = pd.DataFrame({
+        '回测': np.repeat(np.arange(n_series), n),
+        '总资金': total.ravel(),
+        '信号': np.atleast_2d(np.asarray(signal_matrix)).ravel(),
+    })
+    if exit_matrix is not None:
+        frame['离场'] = np.atleast_2d(np.asarray(exit_matrix)).ravel()
+    stats = polars_backend.backtest_results(frame, initial_capital, periods_per_year, by='回测')
+    return [BacktestResults(*row) for row in stats[list(BacktestResults.FIELDS)].itertuples(index=False)]
+
+
+def run_backtest_batch(data, signal_matrix, trade_logic='full', trade_param=None, backend=None, **engine_kwargs):
+    """
+    同一份价格数据上批量回测多组信号（如多个策略对比），不支持止损止盈
+    
+    持仓和资金只在信号K线上变化：每组信号只逐个处理非零信号所在的K线，
+    其余K线由前向填充得到；持仓价值、总资金和收益率在 (信号组数 × K线数) 的矩阵上一次计算。
+    结果与对每组信号分别运行BacktestEngine完全一致。
+    
+    参数:
+    data: pandas DataFrame, 价格数据（只读）
+    signal_matrix: array-like, (信号组数 × K线数) 的信号矩阵（1买入，-1卖出，0不操作）
+    trade_logic: str, 交易逻辑类型，见BacktestEngine.run
+    trade_param: dict, 交易逻辑参数
+    backend: str 或 None, 绩效指标的计算后端，见metrics_backend
+    engine_kwargs: BacktestEngine的其他参数（initial_capital、transaction_cost、slippage、periods_per_year等）
+    
+    返回:
+    tuple: (list[BacktestResults] 每组信号的回测结果, numpy.ndarray 总资金矩阵, numpy.ndarray 基准累计收益率)
+    """
+    if engine_kwargs.get('stop_loss') or engine_kwargs.get('take_profit') or engine_kwargs.get('trailing_stop'):
+        raise ValueError("批量回测不支持止损止盈，请使用BacktestEngine")
+    signal_matrix = np.asarray(signal_matrix)
+    if signal_matrix.ndim == 1:
+        signal_matrix = signal_matrix[np.newaxis, :]
+    n_series, n = signal_matrix.shape
+    if n != len(data):
+        raise ValueError(f"信号长度({n})与价格数据长度({len(data)})不一致")
+    
+    # 借用一个引擎实例完成参数校验和单笔交易处理，保证与逐组回测的计算一致
+    engine = BacktestEngine(data, signals=pd.DataFrame({'信号': np.zeros(n, dtype=np.int64)}, index=data.index),
+                            **engine_kwargs)
+    prices = data[engine.price_col].to_numpy(dtype=np.float64)
+    initial_capital = float(engine.initial_capital)
+    
+    held = np.zeros((n_series, n), dtype=np.int64)
+    cash = np.full((n_series, n), initial_capital)
+    costs = np.zeros((n_series, n))
+    price_list = prices.tolist()
+    bar_index = np.arange(n)
+    for s in range(n_series):
+        signal_list = signal_matrix[s].tolist()
+        quantity, available = 0, initial_capital
+        # 账户发生变化的K线及变化后的持仓和资金（第一根K线不交易）
+        change_bars, held_values, cash_values = [0], [0], [initial_capital]
+        for i in (np.flatnonzero(signal_matrix[s, 1:]) + 1).tolist():
+            quantity, available, cost = engine._process_trade(
+                quantity, available, price_list[i], signal_list[i], trade_logic, trade_param
+            )
+            if cost or quantity != held_values[-1] or available != cash_values[-1]:
+                change_bars.append(i)
+                held_values.append(quantity)
+                cash_values.append(available)
+                costs[s, i] = cost
+        if n > 0:
+            positions = np.searchsorted(change_bars, bar_index, side='right') - 1
+            held[s] = np.asarray(held_values, dtype=np.int64)[positions]
+            cash[s] = np.asarray(cash_values)[positions]
+    
+    position_value = held * prices
+    total = position_value + cash
+    if n > 0:
+        total[:, 0] = initial_capital
+    
+    # 所有信号组的收益率和累计收益率一次计算
+    returns = np.full((n_series, n), np.nan)
+    if n > 1:
+        returns[:, 1:] = total[:, 1:] / total[:, :-1] - 1
+    nav = np.cumprod(np.where(np.isnan(returns), 1.0, 1 + returns), axis=1)
+    cumulative = nav - 1
+    cumulative[np.isnan(returns)] = np.nan
+    benchmark, _ = BacktestEngine._cumulative(BacktestEngine._pct_change(prices, np.nan), 1.0)
+    
+    if metrics_backend(backend) == 'polars':
+        return polars_results(total, signal_matrix, initial_capital, engine.periods_per_year), total, benchmark
+    results = []
+    for s in range(n_series):
+        state = EngineState(initial_capital)
+        state.update_returns(returns[s], cumulative[s], signal_matrix[s])
+        if n > 0:
+            state.held = int(held[s, -1])
+            state.available = cash[s, -1]
+            state.total = total[s, -1]
+            state.strategy_nav = nav[s, -1]
+            state.last_price = prices[-1]
+        results.append(state.results(engine.periods_per_year))
+    return results, total, benchmark
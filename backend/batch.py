@@ -0,0 +1,315 @@
+"""
+批量回测命令行工具
+
+用法:
+    python batch.py campaign.json --output results/nightly --workers 4 [--curves]
+
+回测任务清单（JSON）示例:
+    {
+        "symbols": ["000001", "600519"],
+        "strategies": [
+            {"id": 1, "params": [{"short_window": 20, "long_window": 60}, {"short_window": 50, "long_window": 200}]},
+            {"id": 2}
+        ],
+        "date_ranges": [{"start_date": "20200101", "end_date": "20231231"}],
+        "period": "daily",
+        "adjust": "qfq",
+        "trade_logic": "full",
+        "benchmark": "csi300",
+        "engine": {"initial_capital": 100000, "transaction_cost": 0.001, "slippage": 0.0005}
+    }
+
+任务为 股票 × 策略参数 × 时间范围 的全部组合。结果按批写入输出目录下的Parquet文件，
+每写完一批就在journal.jsonl中记录已完成的任务，中断后以相同参数重新运行会跳过已完成的任务。
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from backtest import BacktestEngine, EXIT_NONE, metrics_backend, polars_results
+from benchmark import benchmark_metrics
+from data import get_stock_data, bars_per_year
+from strategies import STRATEGY_FUNCTIONS, compute_signals
+
+
+# 每累计多少个完成的任务写一次Parquet文件
+DEFAULT_FLUSH_EVERY = 200
+
+JOURNAL_FILE = "journal.jsonl"
+METRICS_DIR = "metrics"
+CURVES_DIR = "curves"
+
+# 保存净值曲线时写入的列
+CURVE_COLUMNS = ['总资金', '策略累计收益率', '基准累计收益率']
+
+
+def load_campaign(path):
+    """读取回测任务清单"""
+    with open(path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    for field in ("symbols", "strategies"):
+        if not spec.get(field):
+            raise ValueError(f"任务清单缺少字段: {field}")
+    for strategy in spec["strategies"]:
+        if strategy.get("id") not in STRATEGY_FUNCTIONS:
+            raise ValueError(f"无效的策略ID: {strategy.get('id')}")
+    return spec
+
+
+def task_id(task):
+    """任务的稳定标识（任务内容及其回测设置的哈希），用于断点续跑"""
+    payload = json.dumps(task, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def effective_settings(spec):
+    """
+    任务清单中影响回测结果的公共设置（未指定的取默认值）
+
+    设置会写入每个任务并参与任务ID的计算，修改周期、复权方式、引擎参数等之后
+    以相同输出目录续跑时，旧结果不会被当作已完成的任务跳过。
+    """
+    return {
+        "period": spec.get("period", "daily"),
+        "adjust": spec.get("adjust", "qfq"),
+        "engine": spec.get("engine", {}),
+        "trade_logic": spec.get("trade_logic", "full"),
+        "trade_param": spec.get("trade_param"),
+        "benchmark": spec.get("benchmark"),
+    }
+
+
+def expand_tasks(spec):
+    """
+    展开任务清单
+
+    返回:
+    list[dict]: 每个任务包含symbol、strategy_id、params、start_date、end_date和settings（见effective_settings）
+    """
+    date_ranges = spec.get("date_ranges") or [{}]
+    settings = effective_settings(spec)
+    tasks = []
+    for symbol, date_range, strategy in itertools.product(spec["symbols"], date_ranges, spec["strategies"]):
+        for params in strategy.get("params") or [{}]:
+            tasks.append({
+                "symbol": symbol,
+                "strategy_id": strategy["id"],
+                "params": params,
+                "start_date": date_range.get("start_date"),
+                "end_date": date_range.get("end_date"),
+                "settings": settings,
+            })
+    return tasks
+
+
+def _run_group(symbol, start_date, end_date, tasks, spec, save_curves):
+    """
+    工作进程：同一股票和时间范围的任务共用一次数据获取
+
+    返回:
+    list[tuple]: (任务ID, 指标行dict 或 None, 净值曲线DataFrame 或 None, 错误信息 或 None)
+    """
+    period = spec.get("period", "daily")
+    try:
+        data = get_stock_data(symbol=symbol, start_date=start_date, end_date=end_date,
+                              period=period, adjust=spec.get("adjust", "qfq"))
+    except Exception as e:
+        return [(task_id(task), None, None, f"获取股票数据失败: {e}") for task in tasks]
+
+    engine_kwargs = {"periods_per_year": bars_per_year(period), **spec.get("engine", {})}
+    outcomes = []
+    equity, signal_rows, exit_rows = [], [], []
+    for task in tasks:
+        tid = task_id(task)
+        try:
+            signals = compute_signals(data, task["strategy_id"], **task["params"])
+            engine = BacktestEngine(data, signals=signals, **engine_kwargs)
+            results = engine.run(trade_logic=spec.get("trade_logic", "full"), trade_param=spec.get("trade_param"))
+        except Exception as e:
+            outcomes.append((tid, None, None, str(e)))
+            continue
+        row = {
+            "任务ID": tid,
+            "股票代码": symbol,
+            "策略ID": task["strategy_id"],
+            "策略参数": json.dumps(task["params"], sort_keys=True, ensure_ascii=False),
+            "开始日期": start_date,
+            "结束日期": end_date,
+            **{key: float(value) for key, value in results.items()},
+        }
+        equity.append(engine.output['总资金'].to_numpy())
+        signal_rows.append(signals['信号'].to_numpy())
+        exit_rows.append(engine.output['离场'].to_numpy() if '离场' in engine.output else np.full(len(data), EXIT_NONE))
+        curve = None
+        if save_curves:
+            curve = engine.compact_data()[CURVE_COLUMNS].reset_index()
+            curve.insert(0, "任务ID", tid)
+        outcomes.append((tid, row, curve, None))
+
+    # QUANT_BACKEND=polars时同组所有任务的绩效指标在一次polars分组聚合中计算
+    if equity and metrics_backend() == 'polars':
+        polars_rows = polars_results(equity, signal_rows, engine_kwargs.get("initial_capital", 100000),
+                                     engine_kwargs["periods_per_year"], exit_rows)
+        successful = [row for _, row, _, error in outcomes if error is None]
+        for row, results in zip(successful, polars_rows):
+            row.update({key: float(value) for key, value in results.items()})
+
+    # 同组所有任务相对基准的指标一次性计算
+    benchmark = spec.get("benchmark")
+    if benchmark and equity:
+        try:
+            relative = benchmark_metrics(equity, data.index, benchmark, engine_kwargs["periods_per_year"])
+        except Exception as e:
+            print(f"计算基准指标失败: {e}")
+        else:
+            successful = [row for _, row, _, error in outcomes if error is None]
+            for i, row in enumerate(successful):
+                row.update({key: float(values[i]) for key, values in relative.items()})
+    return outcomes
+
+
+class _Journal:
+    """
+    完成记录：每写完一个Parquet分片追加一行 {"part": 文件名, "tasks": [任务ID, ...]}
+
+    分片先写入、再记录，因此进程在两者之间崩溃时，未记录的分片会在下次运行时删除，
+    对应的任务重新执行，结果不会重复。
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, JOURNAL_FILE)
+        self.completed = set()
+        parts = set()
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 最后一行可能在写入时中断
+                        continue
+                    parts.add(entry["part"])
+                    self.completed.update(entry["tasks"])
+        self.next_part = 0
+        for directory in (METRICS_DIR, CURVES_DIR):
+            path = os.path.join(output_dir, directory)
+            os.makedirs(path, exist_ok=True)
+            for name in os.listdir(path):
+                if name not in parts:
+                    os.remove(os.path.join(path, name))
+        if parts:
+            self.next_part = max(int(name.split("-")[1].split(".")[0]) for name in parts) + 1
+
+    def record(self, part, tasks):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"part": part, "tasks": tasks}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed.update(tasks)
+
+
+def _flush(journal, rows, curves):
+    """将一批结果写入Parquet分片并记录到journal"""
+    if not rows:
+        return
+    part = f"part-{journal.next_part:05d}.parquet"
+    journal.next_part += 1
+    pd.DataFrame(rows).to_parquet(os.path.join(journal.output_dir, METRICS_DIR, part), index=False)
+    if curves:
+        pd.concat(curves, ignore_index=True).to_parquet(os.path.join(journal.output_dir, CURVES_DIR, part), index=False)
+    journal.record(part, [row["任务ID"] for row in rows])
+    print(f"已写入 {part}，共 {len(rows)} 个任务")
+
+
+def run_campaign(spec, output_dir, workers=None, save_curves=False, flush_every=DEFAULT_FLUSH_EVERY):
+    """
+    执行批量回测
+
+    参数:
+    spec: dict, 回测任务清单（见模块说明）
+    output_dir: str, 输出目录
+    workers: int 或 None, 进程数，默认CPU核数
+    save_curves: bool, 是否保存净值曲线
+    flush_every: int, 每累计多少个完成的任务写一次Parquet文件
+
+    返回:
+    dict: 任务总数、本次完成数、跳过数（之前已完成）和失败数
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    journal = _Journal(output_dir)
+    tasks = expand_tasks(spec)
+    pending = [task for task in tasks if task_id(task) not in journal.completed]
+    print(f"共 {len(tasks)} 个任务，已完成 {len(tasks) - len(pending)} 个，待执行 {len(pending)} 个")
+
+    # 同一股票和时间范围的任务分到同一组，只获取一次数据
+    groups = {}
+    for task in pending:
+        groups.setdefault((task["symbol"], task["start_date"], task["end_date"]), []).append(task)
+
+    rows, curves = [], []
+    done = failed = 0
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [pool.submit(_run_group, *key, group, spec, save_curves) for key, group in groups.items()]
+        for future in as_completed(futures):
+            for tid, row, curve, error in future.result():
+                if error is not None:
+                    failed += 1
+                    print(f"任务失败 {tid}: {error}")
+                    continue
+                rows.append(row)
+                if curve is not None:
+                    curves.append(curve)
+                done += 1
+            if len(rows) >= flush_every:
+                _flush(journal, rows, curves)
+                rows, curves = [], []
+    except KeyboardInterrupt:
+        # Ctrl+C：取消尚未开始的任务组，不再等待整个队列执行完
+        print("批量回测被中断，取消尚未开始的任务")
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    finally:
+        pool.shutdown()
+        # 中断时也写入已经完成的结果
+        _flush(journal, rows, curves)
+
+    summary = {"total": len(tasks), "completed": done, "skipped": len(tasks) - len(pending), "failed": failed}
+    print(f"批量回测结束: {summary}")
+    return summary
+
+
+def read_results(output_dir, curves=False):
+    """读取批量回测的指标（curves=True时读取净值曲线）"""
+    directory = os.path.join(output_dir, CURVES_DIR if curves else METRICS_DIR)
+    parts = sorted(name for name in os.listdir(directory) if name.endswith(".parquet"))
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat([pd.read_parquet(os.path.join(directory, name)) for name in parts], ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量回测")
+    parser.add_argument("campaign", help="回测任务清单（JSON文件）")
+    parser.add_argument("--output", required=True, help="输出目录，中断后使用相同目录重新运行即可续跑")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认CPU核数")
+    parser.add_argument("--curves", action="store_true", help="同时保存净值曲线")
+    parser.add_argument("--flush-every", type=int, default=DEFAULT_FLUSH_EVERY, help="每多少个任务写一次Parquet文件")
+    args = parser.parse_args()
+
+    spec = load_campaign(args.campaign)
+    run_campaign(spec, args.output, workers=args.workers, save_curves=args.curves, flush_every=args.flush_every)
+
+
+if __name__ == "__main__":
+    main()
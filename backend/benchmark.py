@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from data import get_index_data, BENCHMARK_INDICES
+from metrics import relative_metrics
+
+
+# 已对齐到交易日历的基准收盘价缓存：同一指数和同一交易日历只对齐一次
+_ALIGNED_MAX_ENTRIES = 64
+_aligned_cache = OrderedDict()
+_aligned_lock = threading.Lock()
+
+
+def is_valid_benchmark(benchmark):
+    """是否为支持的基准：BENCHMARK_INDICES中的名称或6位指数代码"""
+    return benchmark in BENCHMARK_INDICES or (len(benchmark) == 6 and benchmark.isdigit())
+
+
+def _calendar_key(benchmark, calendar):
+    index_code = BENCHMARK_INDICES.get(benchmark, benchmark)
+    return index_code, calendar[0], calendar[-1], len(calendar), hash(calendar.asi8.tobytes())
+
+
+def aligned_benchmark(benchmark, calendar):
+    """
+    将基准指数收盘价对齐到策略的交易日历
+
+    个股停牌日不在交易日历中，因此按交易日历取指数收盘价后，相邻两根K线之间的指数收益率
+    覆盖与个股相同的持有区间。对齐结果按 (指数, 交易日历) 缓存，多个请求共用。
+
+    参数:
+    benchmark: str, 指数名称（如'csi300'）或指数代码
+    calendar: pandas.DatetimeIndex, 策略的日线交易日历
+
+    返回:
+    numpy.ndarray, 与calendar等长的指数收盘价，指数数据开始之前为NaN（只读）
+    """
+    if len(calendar) == 0:
+        return np.array([], dtype=np.float64)
+    key = _calendar_key(benchmark, calendar)
+    with _aligned_lock:
+        cached = _aligned_cache.get(key)
+        if cached is not None:
+            _aligned_cache.move_to_end(key)
+            return cached
+
+    index_data = get_index_data(benchmark, start_date=calendar[0].strftime("%Y%m%d"),
+                                end_date=calendar[-1].strftime("%Y%m%d"))
+    closes = index_data['收盘'].to_numpy(dtype=np.float64)
+    positions = index_data.index.searchsorted(calendar.normalize(), side='right') - 1
+    aligned = np.where(positions >= 0, closes[np.maximum(positions, 0)], np.nan)
+    aligned.setflags(write=False)
+
+    with _aligned_lock:
+        _aligned_cache[key] = aligned
+        _aligned_cache.move_to_end(key)
+        while len(_aligned_cache) > _ALIGNED_MAX_ENTRIES:
+            _aligned_cache.popitem(last=False)
+    return aligned
+
+
+def benchmark_metrics(equity, calendar, benchmark='csi300', periods_per_year=252):
+    """
+    计算一条或多条净值曲线相对基准指数的阿尔法、贝塔、跟踪误差和信息比率
+
+    参数:
+    equity: array-like, (曲线数 × K线数) 的总资金矩阵，一维输入视为单条曲线
+    calendar: pandas.DatetimeIndex, 净值曲线的交易日历
+    benchmark: str, 指数名称或代码
+    periods_per_year: int, 每年K线数量
+
+    返回:
+    dict, 指标名 -> numpy.ndarray（长度为曲线数），见metrics.relative_metrics
+    """
+    return relative_metrics(equity, aligned_benchmark(benchmark, calendar), periods_per_year)
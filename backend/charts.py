@@ -1,20 +1,43 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 from io import BytesIO
 import base64
 
-# 设置全局中文字体
-plt.rcParams['font.family'] = ['SimHei', 'Georgia', 'Cambria', 'serif']
-plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+import metrics
+from lazy import LazyModule
+from downsample import StreamingDownsampler, downsample_backtest_data, multi_series_indices
+from resample import MONTH_END
 
+# 图表尺寸（英寸）与分辨率，净值曲线默认降采样到图片像素宽度
+FIGURE_SIZE = (12, 6)
+FIGURE_DPI = 150
+CHART_WIDTH_PX = FIGURE_SIZE[0] * FIGURE_DPI
 
-def generate_equity_curve(data):
+# matplotlib在第一次生成图表（或prewarm）时才导入，字体设置也在每次绘图时进行
+plt = LazyModule('matplotlib.pyplot')
+
+
+def prewarm():
+    """
+    预热图表依赖：导入matplotlib并绘制一张含中文的小图，
+    让字体查找和字体缓存在第一个回测请求之前完成
+    """
+    plt.rcParams['font.family'] = ['SimHei', 'Georgia', 'Cambria', 'serif']
+    plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+    fig, ax = plt.subplots(figsize=(1, 1))
+    ax.set_title('净值')
+    ax.plot([0, 1], [0, -1])
+    fig.savefig(BytesIO(), format='png', dpi=10)
+    plt.close(fig)
+
+
+def generate_equity_curve(data, max_points=CHART_WIDTH_PX):
     """
     生成净值曲线图表
     
     参数:
     data: pandas DataFrame, 包含回测数据，必须有'策略累计收益率'和'基准累计收益率'列
+    max_points: int 或 None, 绘制的最大点数，默认为图片像素宽度；None表示绘制全部点
     
     返回:
     str, Base64编码的PNG图片
@@ -34,20 +57,24 @@ def generate_equity_curve(data):
     plt.rcParams['axes.spines.bottom'] = True
     plt.rcParams['axes.linewidth'] = 0.5
     
-    # 创建图表
-    fig, ax = plt.subplots(figsize=(12, 6))
-    
-    # 绘制净值曲线
-    ax.plot(data.index, 1 + data['策略累计收益率'], label='策略净值', linewidth=2, color='#0066cc')
-    ax.plot(data.index, 1 + data['基准累计收益率'], label='基准净值', linewidth=2, color='#666666', linestyle='--')
-    
-    # 计算回撤
+    # 计算回撤（基于全量数据，降采样前计算以保证回撤区间准确）
     cumulative_returns = data['策略累计收益率']
     running_max = cumulative_returns.cummax()
     drawdown = (cumulative_returns - running_max) / (1 + running_max)
     
+    # 降采样：保留每段回撤的最低点和所有交易点
+    plot_data = data.assign(_历史最高=running_max, _回撤=drawdown)
+    plot_data = downsample_backtest_data(plot_data, max_points, value_col='策略累计收益率')
+    
+    # 创建图表
+    fig, ax = plt.subplots(figsize=FIGURE_SIZE)
+    
+    # 绘制净值曲线
+    ax.plot(plot_data.index, 1 + plot_data['策略累计收益率'], label='策略净值', linewidth=2, color='#0066cc')
+    ax.plot(plot_data.index, 1 + plot_data['基准累计收益率'], label='基准净值', linewidth=2, color='#666666', linestyle='--')
+    
     # 绘制回撤阴影区域
-    ax.fill_between(data.index, 1 + cumulative_returns, 1 + running_max, where=(drawdown < 0), 
+    ax.fill_between(plot_data.index, 1 + plot_data['策略累计收益率'], 1 + plot_data['_历史最高'], where=(plot_data['_回撤'] < 0), 
                    color='#ffcccc', alpha=0.5, label='回撤')
     
     # 设置标题和标签
@@ -63,7 +90,7 @@ def generate_equity_curve(data):
     
     # 将图表转换为Base64编码的PNG
     buffer = BytesIO()
-    plt.savefig(buffer, format='png', dpi=150)
+    plt.savefig(buffer, format='png', dpi=FIGURE_DPI)
     buffer.seek(0)
     image_base64 = base64.b64encode(buffer.read()).decode('utf-8')
     plt.close()
@@ -85,7 +112,7 @@ def generate_heatmap(data):
     plt.style.use('default')
     
     # 计算月度收益率
-    monthly_returns = data['策略收益率'].resample('ME').sum()
+    monthly_returns = data['策略收益率'].resample(MONTH_END).sum()
     
     # 构建月度收益矩阵
     monthly_returns_df = monthly_returns.to_frame()
@@ -94,6 +121,8 @@ def generate_heatmap(data):
     
     # 创建透视表
     heatmap_data = monthly_returns_df.pivot(index='year', columns='month', values='策略收益率')
+    # 回测区间不足12个月时补齐缺失月份
+    heatmap_data = heatmap_data.reindex(columns=range(1, 13))
     
     # 月份标签
     month_labels = ['1月', '2月', '3月', '4月', '5月', '6月', '7月', '8月', '9月', '10月', '11月', '12月']
@@ -102,7 +131,7 @@ def generate_heatmap(data):
     plt.rcParams['font.family'] = ['SimHei', 'Georgia', 'Cambria', 'serif']
     plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
     # 创建图表
-    fig, ax = plt.subplots(figsize=(12, 6))
+    fig, ax = plt.subplots(figsize=FIGURE_SIZE)
     
     # 绘制热力图
     im = ax.imshow(heatmap_data, cmap='RdYlGn', aspect='auto', vmin=-0.1, vmax=0.1)
@@ -137,7 +166,7 @@ def generate_heatmap(data):
     
     # 将图表转换为Base64编码的PNG
     buffer = BytesIO()
-    plt.savefig(buffer, format='png', dpi=150)
+    plt.savefig(buffer, format='png', dpi=FIGURE_DPI)
     buffer.seek(0)
     image_base64 = base64.b64encode(buffer.read()).decode('utf-8')
     plt.close()
@@ -173,12 +202,13 @@ def generate_sharpe_ratio_chart(data):
     # 计算滚动夏普比率（252天）
     window = 252
     daily_returns = data['策略收益率'].dropna()
-    rolling_mean = daily_returns.rolling(window=window).mean()
-    rolling_std = daily_returns.rolling(window=window).std()
-    rolling_sharpe = rolling_mean / rolling_std * np.sqrt(252)  # 年化
+    rolling_sharpe = pd.Series(
+        metrics.rolling_sharpe(daily_returns.to_numpy(), window)[0],  # 年化
+        index=daily_returns.index
+    )
     
     # 创建图表
-    fig, ax = plt.subplots(figsize=(12, 6))
+    fig, ax = plt.subplots(figsize=FIGURE_SIZE)
     
     # 绘制滚动夏普比率
     ax.plot(rolling_sharpe.index, rolling_sharpe, label='滚动夏普比率', linewidth=2, color='#0066cc')
@@ -199,9 +229,101 @@ def generate_sharpe_ratio_chart(data):
     
     # 将图表转换为Base64编码的PNG
     buffer = BytesIO()
-    plt.savefig(buffer, format='png', dpi=150)
+    plt.savefig(buffer, format='png', dpi=FIGURE_DPI)
+    buffer.seek(0)
+    image_base64 = base64.b64encode(buffer.read()).decode('utf-8')
+    plt.close()
+    
+    return f"data:image/png;base64,{image_base64}"
+
+
+def generate_comparison_chart(index, nav_matrix, labels, benchmark_nav=None, max_points=CHART_WIDTH_PX):
+    """
+    生成多策略净值对比图表（所有策略的净值曲线叠加在同一张图上）
+    
+    参数:
+    index: pandas.DatetimeIndex, 日期
+    nav_matrix: numpy.ndarray, (策略数 × K线数) 的净值矩阵
+    labels: list[str], 每条曲线的图例名称
+    benchmark_nav: numpy.ndarray 或 None, 基准净值
+    max_points: int 或 None, 绘制的最大点数，默认为图片像素宽度；None表示绘制全部点
+    
+    返回:
+    str, Base64编码的PNG图片
+    """
+    # 设置WSJ风格
+    plt.style.use('default')
+    # 重新设置中文字体
+    plt.rcParams['font.family'] = ['SimHei', 'Georgia', 'Cambria', 'serif']
+    plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+    plt.rcParams['axes.grid'] = True
+    plt.rcParams['axes.grid.axis'] = 'y'
+    plt.rcParams['grid.linestyle'] = '--'
+    plt.rcParams['grid.alpha'] = 0.7
+    plt.rcParams['axes.spines.top'] = False
+    plt.rcParams['axes.spines.right'] = False
+    plt.rcParams['axes.spines.left'] = True
+    plt.rcParams['axes.spines.bottom'] = True
+    plt.rcParams['axes.linewidth'] = 0.5
+    
+    # 所有曲线使用同一组降采样点
+    indices = multi_series_indices(nav_matrix, max_points)
+    dates = index[indices]
+    
+    fig, ax = plt.subplots(figsize=FIGURE_SIZE)
+    for label, nav in zip(labels, nav_matrix):
+        ax.plot(dates, nav[indices], label=label, linewidth=1.5)
+    if benchmark_nav is not None:
+        ax.plot(dates, benchmark_nav[indices], label='基准净值', linewidth=2, color='#666666', linestyle='--')
+    
+    # 设置标题和标签
+    ax.set_title('策略净值对比', fontsize=16, fontweight='bold', loc='left')
+    ax.set_ylabel('净值', fontsize=12)
+    ax.set_xlabel('日期', fontsize=12)
+    ax.legend(loc='best', frameon=False)
+    
+    # 调整布局
+    plt.tight_layout()
+    
+    # 将图表转换为Base64编码的PNG
+    buffer = BytesIO()
+    plt.savefig(buffer, format='png', dpi=FIGURE_DPI)
     buffer.seek(0)
     image_base64 = base64.b64encode(buffer.read()).decode('utf-8')
     plt.close()
     
     return f"data:image/png;base64,{image_base64}"
+
+
+class ChunkedChartData:
+    """
+    分块回测（如多年分钟线）的图表数据
+
+    净值曲线按分块流式降采样，热力图只保留每个月的收益率之和，内存占用与K线总数无关。
+
+    参数:
+    max_points: int, 净值曲线的绘制点数，默认为图片像素宽度
+    """
+
+    def __init__(self, max_points=CHART_WIDTH_PX):
+        self.max_points = max_points
+        self._curve = StreamingDownsampler(max_points, value_col='策略累计收益率')
+        self._monthly = []
+
+    def add(self, chunk):
+        """
+        加入一个分块的回测数据
+
+        参数:
+        chunk: pandas DataFrame, 分块的回测数据，必须有'策略收益率'、'策略累计收益率'和'基准累计收益率'列
+        """
+        self._curve.add(chunk)
+        self._monthly.append(chunk['策略收益率'].resample(MONTH_END).sum())
+
+    def equity_curve(self):
+        """净值曲线图表，见generate_equity_curve"""
+        return generate_equity_curve(self._curve.result(), max_points=self.max_points)
+
+    def heatmap(self):
+        """月度收益热力图，见generate_heatmap（跨分块的月份在其中合并）"""
+        return generate_heatmap(pd.concat(self._monthly).to_frame('策略收益率'))
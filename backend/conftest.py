@@ -0,0 +1,64 @@
+"""
+pytest公共设置
+
+测试使用临时目录中的本地K线存储、共享缓存和性能分析目录，不读写 backend/data_cache/，
+也不访问网络：需要行情数据的接口测试通过api_client替换main.get_stock_data。
+"""
+import os
+import tempfile
+
+_TEST_DIR = tempfile.mkdtemp(prefix="quant-test-")
+os.environ["QUANT_DATA_DIR"] = _TEST_DIR
+os.environ["QUANT_CACHE_PATH"] = os.path.join(_TEST_DIR, "shared_cache.sqlite3")
+os.environ["QUANT_PROFILE_DIR"] = os.path.join(_TEST_DIR, "profiles")
+os.environ["QUANT_PREWARM"] = "0"
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def make_prices(n_bars=1500, seed=0, start='2015-01-01'):
+    """模拟日线（开高低收、成交量、成交额）"""
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, n_bars)))
+    open_ = close * np.exp(rng.normal(0, 0.005, n_bars))
+    return pd.DataFrame({
+        '开盘': open_,
+        '收盘': close,
+        '最高': np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, n_bars)),
+        '最低': np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n_bars)),
+        '成交量': rng.uniform(1e5, 1e6, n_bars),
+        '成交额': rng.uniform(1e6, 1e7, n_bars),
+    }, index=pd.bdate_range(start, periods=n_bars, name='日期'))
+
+
+@pytest.fixture
+def price_data():
+    return make_prices()
+
+
+@pytest.fixture
+def api_client(monkeypatch, price_data):
+    """
+    接口测试客户端：行情数据来自price_data（按请求的开始/结束日期截取，没有复权因子），
+    每个测试开始前清空共享缓存和进程内价格缓存
+    """
+    from fastapi.testclient import TestClient
+
+    import data
+    import main
+    import streaming
+    from shared_cache import shared_cache
+
+    def fake_get_stock_data(symbol="000001", start_date=None, end_date=None, **kwargs):
+        start = pd.Timestamp(start_date) if start_date else None
+        end = pd.Timestamp(end_date) if end_date else None
+        return price_data.loc[start:end]
+
+    shared_cache.clear()
+    data.clear_cache()
+    monkeypatch.setattr(main, "get_stock_data", fake_get_stock_data)
+    monkeypatch.setattr(main, "factor_version", lambda *args, **kwargs: None)
+    monkeypatch.setattr(streaming, "factor_version", lambda *args, **kwargs: None)
+    return TestClient(main.app)
@@ -1,44 +1,129 @@
+import hashlib
 import pandas as pd
 import numpy as np
-import akshare as ak
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
+from lazy import LazyModule
+from adjust import ADJUST_MODES, adjust_prices, factors_from_hfq
+from shared_cache import shared_cache
+from store import BarStore
 
-def get_stock_data(symbol="000001", start_date=None, end_date=None, days=365*5):
+
+# akshare导入较慢（约0.5秒），第一次拉取数据时才导入
+ak = LazyModule('akshare')
+
+
+# 开启copy-on-write：缓存的价格数据在多个请求、策略和回测引擎之间共享，任何修改都只作用于副本。
+# API、批量回测和流式推送都通过本模块读取价格数据，在这里设置可以覆盖所有入口。
+pd.set_option("mode.copy_on_write", True)
+
+
+# 进程内价格数据缓存：相同股票和日期范围的请求共享同一个DataFrame。
+# 策略和回测引擎都不会修改价格数据，调用方需要修改时应自行复制。
+_CACHE_MAX_ENTRIES = 32
+_frame_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+# 进程内复权因子缓存：股票代码 -> (检查日期, 复权因子表, 因子摘要)，每天最多检查一次数据源
+_factor_cache = {}
+
+
+# 结束日期不早于今天的数据在共享缓存中的有效期（秒），历史区间的数据不会变化，长期有效
+RECENT_DATA_TTL = 3600
+
+
+# 支持的分钟线周期（分钟）
+INTRADAY_PERIODS = ('1', '5', '15', '60')
+
+
+class FactorUnavailableError(Exception):
+    """复权因子拉取失败且本地没有保存的因子，暂时无法计算复权价格"""
+
+# 每年K线数量：一年252个交易日，A股每个交易日交易4小时（240分钟）
+BARS_PER_YEAR = {
+    'daily': 252,
+    '60': 252 * 4,
+    '15': 252 * 16,
+    '5': 252 * 48,
+    '1': 252 * 240,
+}
+
+# 不复权K线、复权因子和分钟线的本地存储
+_bar_store = BarStore()
+
+# 复权因子表在本地存储中的周期名
+FACTOR_PERIOD = 'factor'
+
+# 指数日线在本地存储中的周期名
+INDEX_PERIOD = 'index'
+
+# 常用基准指数：名称 -> 指数代码
+BENCHMARK_INDICES = {
+    'csi300': '000300',
+    'csi500': '000905',
+}
+
+
+def bars_per_year(period='daily'):
     """
-    获取股票数据
-    
+    每年K线数量，用于年化收益率、波动率和夏普比率
+
     参数:
-    symbol: str, 股票代码，默认"000001"（平安银行）
-    start_date: str, 开始日期，格式：YYYYMMDD
-    end_date: str, 结束日期，格式：YYYYMMDD
-    days: int, 数据天数，默认5年（当未指定开始日期时使用）
-    
-    返回:
-    pandas DataFrame, 包含股票价格数据
+    period: str, K线周期，'daily' 或 '1'/'5'/'15'/'60'（分钟）
     """
-    # 计算开始和结束日期
-    if not end_date:
-        end_date = datetime.now().strftime("%Y%m%d")
-    if not start_date:
-        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y%m%d")
-    
-    # 转换日期格式为YYYY-MM-DD，因为ak.stock_zh_a_hist可能期望这种格式
-    start_date_formatted = datetime.strptime(start_date, "%Y%m%d").strftime("%Y-%m-%d")
-    end_date_formatted = datetime.strptime(end_date, "%Y%m%d").strftime("%Y-%m-%d")
-    
-    # 使用akshare获取A股日线数据
-    print(f"正在获取股票数据: {symbol}, 时间范围: {start_date} ({start_date_formatted}) 到 {end_date} ({end_date_formatted})")
-    
-    # 确保股票代码格式正确，移除可能的后缀
-    clean_symbol = symbol.replace('.ss', '').replace('.sz', '')
-    print(f"清理后的股票代码: {clean_symbol}")
-    
+    if period not in BARS_PER_YEAR:
+        raise ValueError(f"不支持的K线周期: {period}")
+    return BARS_PER_YEAR[period]
+
+
+def _get_cached_frame(key):
+    with _cache_lock:
+        frame = _frame_cache.get(key)
+        if frame is not None:
+            _frame_cache.move_to_end(key)
+        return frame
+
+
+def _set_cached_frame(key, frame):
+    with _cache_lock:
+        _frame_cache[key] = frame
+        _frame_cache.move_to_end(key)
+        while len(_frame_cache) > _CACHE_MAX_ENTRIES:
+            _frame_cache.popitem(last=False)
+
+
+def cache_ttl(end_date):
+    """
+    共享缓存有效期：结束日期早于今天时不过期，否则为RECENT_DATA_TTL
+
+    参数:
+    end_date: str 或 None, 结束日期，格式：YYYYMMDD
+    """
+    if end_date and end_date < datetime.now().strftime("%Y%m%d"):
+        return None
+    return RECENT_DATA_TTL
+
+
+def clear_cache():
+    """清空进程内价格数据和复权因子缓存"""
+    with _cache_lock:
+        _frame_cache.clear()
+        _factor_cache.clear()
+
+
+def _fetch_daily(clean_symbol, start, end):
+    """从akshare拉取不复权日线，返回以'日期'为索引的DataFrame"""
+    start_date_formatted = start.strftime("%Y-%m-%d")
+    end_date_formatted = end.strftime("%Y-%m-%d")
+    print(f"正在获取不复权日线数据: {clean_symbol}, 时间范围: {start_date_formatted} 到 {end_date_formatted}")
     # 尝试使用不同的方法获取数据
     try:
         # 方法1：直接使用股票代码
         print("尝试方法1：直接使用股票代码")
-        data = ak.stock_zh_a_hist(symbol=clean_symbol, start_date=start_date_formatted, end_date=end_date_formatted, adjust="qfq")
+        data = ak.stock_zh_a_hist(symbol=clean_symbol, start_date=start_date_formatted, end_date=end_date_formatted, adjust="")
     except Exception as e1:
         print(f"方法1失败: {e1}")
         try:
@@ -47,27 +132,337 @@ def get_stock_data(symbol="000001", start_date=None, end_date=None, days=365*5):
             stock_info = ak.stock_zh_a_spot_em()
             stock_code = stock_info[stock_info['代码'] == clean_symbol]['代码'].iloc[0]
             print(f"通过搜索获取的股票代码: {stock_code}")
-            data = ak.stock_zh_a_hist(symbol=stock_code, start_date=start_date_formatted, end_date=end_date_formatted, adjust="qfq")
+            data = ak.stock_zh_a_hist(symbol=stock_code, start_date=start_date_formatted, end_date=end_date_formatted, adjust="")
         except Exception as e2:
             print(f"方法2失败: {e2}")
             try:
                 # 方法3：使用akshare的另一个API
                 print("尝试方法3：使用stock_zh_a_daily API")
-                data = ak.stock_zh_a_daily(symbol=clean_symbol, start_date=start_date_formatted, end_date=end_date_formatted, adjust="qfq")
+                data = ak.stock_zh_a_daily(symbol=clean_symbol, start_date=start_date_formatted, end_date=end_date_formatted, adjust="")
             except Exception as e3:
                 print(f"方法3失败: {e3}")
                 # 所有方法都失败，重新抛出原始异常
                 raise Exception(f"获取股票数据失败，尝试了多种方法: {e1}, {e2}, {e3}")
     
+    if data is None or len(data) == 0:
+        return pd.DataFrame()
     # 转换日期格式并设置为索引
     data['日期'] = pd.to_datetime(data['日期'])
     data.set_index('日期', inplace=True)
     
     # 按照日期升序排序
-    data = data.sort_index()
+    return data.sort_index()
+
+
+def _exchange_symbol(clean_symbol):
+    """新浪接口使用的带交易所前缀的股票代码，如sh600000、sz000001"""
+    if clean_symbol.startswith(('6', '9')):
+        return f"sh{clean_symbol}"
+    if clean_symbol.startswith(('4', '8')):
+        return f"bj{clean_symbol}"
+    return f"sz{clean_symbol}"
+
+
+def _ensure_factors(clean_symbol):
+    """
+    每天最多拉取一次复权因子表（只有几十行），与已保存的因子按日期合并，
+    新的分红送股只会新增因子行，不需要重新拉取K线
+
+    拉取失败时抛出异常，不记录拉取区间（下次请求重新拉取）
+    """
+    today = pd.Timestamp(datetime.now().date())
+    with shared_cache.lock(f"bars:{clean_symbol}:{FACTOR_PERIOD}"):
+        coverage = _bar_store.coverage(clean_symbol, FACTOR_PERIOD)
+        if coverage is not None and coverage[1] >= today:
+            return
+        try:
+            raw = ak.stock_zh_a_daily(symbol=_exchange_symbol(clean_symbol), adjust="hfq-factor")
+            hfq = pd.Series(raw['hfq_factor'].to_numpy(), index=pd.to_datetime(raw['date']))
+            factors = factors_from_hfq(hfq)
+        except Exception as e:
+            raise Exception(f"获取复权因子失败: {e}") from e
+        _bar_store.write(clean_symbol, FACTOR_PERIOD, factors,
+                         start=factors.index.min() if len(factors) > 0 else today, end=today)
+
+
+def _load_factors(clean_symbol):
+    """
+    复权因子表及其摘要（进程内每天只检查一次数据源）
+
+    拉取失败时使用本地已保存的因子（不记为当天已检查，下次请求重试），本地也没有时抛出FactorUnavailableError。
+
+    返回:
+    tuple: (pandas DataFrame 复权因子表, str 因子摘要)
+    """
+    today = datetime.now().date()
+    with _cache_lock:
+        cached = _factor_cache.get(clean_symbol)
+    if cached is not None and cached[0] == today:
+        return cached[1], cached[2]
+    try:
+        _ensure_factors(clean_symbol)
+        checked = True
+    except Exception as e:
+        print(f"{e}，使用本地保存的复权因子")
+        checked = False
+    factors = _bar_store.read(clean_symbol, FACTOR_PERIOD)
+    if not checked and _bar_store.coverage(clean_symbol, FACTOR_PERIOD) is None:
+        raise FactorUnavailableError(f"没有{clean_symbol}的复权因子，暂时无法计算复权价格")
+    row_hashes = pd.util.hash_pandas_object(factors, index=True).to_numpy()
+    digest = hashlib.sha1(row_hashes.tobytes()).hexdigest()[:16]
+    if checked:
+        with _cache_lock:
+            _factor_cache[clean_symbol] = (today, factors, digest)
+    return factors, digest
+
+
+def factor_version(symbol="000001", adjust='qfq', period='daily'):
+    """
+    复权价格的版本（复权因子表摘要），新的分红送股会改变版本
+
+    前复权的历史价格在每次除权后整体变化，由复权价格计算的信号和回测结果的缓存键都应包含版本，
+    除权后不再使用旧的结果。
+
+    参数:
+    symbol: str, 股票代码
+    adjust: str, 复权方式
+    period: str, K线周期
+
+    返回:
+    str 或 None, 不复权和分钟线（不复权价格）返回None
+    """
+    if adjust not in ADJUST_MODES:
+        raise ValueError(f"不支持的复权方式: {adjust}")
+    if period != 'daily' or adjust == 'none':
+        return None
+    return _load_factors(symbol.replace('.ss', '').replace('.sz', ''))[1]
+
+
+def _load_daily(clean_symbol, start, end, adjust, factors=None):
+    """读取本地存储的不复权日线（缺失部分先拉取），并按复权因子表计算复权价格"""
+    # 今天的日线可能尚未收盘，不记为已拉取，下次请求时重新拉取
+    _ensure_bars(clean_symbol, 'daily', start, end, lambda s, e: _fetch_daily(clean_symbol, s, e),
+                 covered_until=pd.Timestamp(datetime.now().date()) - pd.Timedelta(days=1))
+    bars = _bar_store.read(clean_symbol, 'daily', start, end)
+    if len(bars) == 0:
+        raise Exception(f"未获取到股票数据: {clean_symbol}")
+    return adjust_prices(bars, factors, adjust)
+
+
+def get_stock_data(symbol="000001", start_date=None, end_date=None, days=365*5, period='daily', adjust='qfq'):
+    """
+    获取股票数据
+    
+    日线以不复权价格和复权因子表分别保存在本地存储中，复权价格在读取时计算，
+    分红送股只需要拉取新的因子，不需要重新下载全部历史K线。
+    
+    参数:
+    symbol: str, 股票代码，默认"000001"（平安银行）
+    start_date: str, 开始日期，格式：YYYYMMDD
+    end_date: str, 结束日期，格式：YYYYMMDD
+    days: int, 数据天数，默认5年（当未指定开始日期时使用）
+    period: str, K线周期，'daily'（日线，默认）或 '1'/'5'/'15'/'60'（分钟线）
+    adjust: str, 日线复权方式，'qfq'（前复权，默认）、'hfq'（后复权）或 'none'（不复权）；分钟线为不复权价格
+    
+    返回:
+    pandas DataFrame, 包含股票价格数据（与其他请求共享，只读）
+    """
+    if period != 'daily':
+        return get_intraday_data(symbol, start_date=start_date, end_date=end_date, period=period)
+    if adjust not in ADJUST_MODES:
+        raise ValueError(f"不支持的复权方式: {adjust}")
+    
+    # 计算开始和结束日期
+    if not end_date:
+        end_date = datetime.now().strftime("%Y%m%d")
+    if not start_date:
+        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y%m%d")
+    
+    print(f"正在获取股票数据: {symbol}, 时间范围: {start_date} 到 {end_date}, 复权方式: {adjust}")
+    
+    # 确保股票代码格式正确，移除可能的后缀
+    clean_symbol = symbol.replace('.ss', '').replace('.sz', '')
+    print(f"清理后的股票代码: {clean_symbol}")
+    
+    # 复权价格的缓存键包含复权因子摘要，新的分红送股之后不再命中旧的前复权价格
+    factors = version = None
+    if adjust != 'none':
+        factors, version = _load_factors(clean_symbol)
+    cache_key = (clean_symbol, start_date, end_date, adjust, version)
+    cached = _get_cached_frame(cache_key)
+    if cached is not None:
+        print(f"命中价格数据缓存，共 {len(cached)} 条记录")
+        return cached
+    
+    start = pd.Timestamp(datetime.strptime(start_date, "%Y%m%d"))
+    end = pd.Timestamp(datetime.strptime(end_date, "%Y%m%d"))
+    # 进程内未命中时读取共享缓存，都未命中时只有一个工作进程访问数据源
+    data = shared_cache.get_or_compute(
+        'prices', cache_key,
+        lambda: _load_daily(clean_symbol, start, end, adjust, factors),
+        ttl=cache_ttl(end_date)
+    )
     
     print(f"成功获取股票数据，共 {len(data)} 条记录")
+    _set_cached_frame(cache_key, data)
+    return data
+
+
+def _fetch_index(index_code, start, end):
+    """从akshare拉取指数日线，返回以'日期'为索引的DataFrame"""
+    print(f"正在获取指数数据: {index_code}, 时间范围: {start.date()} 到 {end.date()}")
+    data = ak.index_zh_a_hist(symbol=index_code, period="daily",
+                              start_date=start.strftime("%Y%m%d"), end_date=end.strftime("%Y%m%d"))
+    if data is None or len(data) == 0:
+        return pd.DataFrame()
+    data['日期'] = pd.to_datetime(data['日期'])
+    data.set_index('日期', inplace=True)
+    return data.sort_index()
+
+
+def get_index_data(index="csi300", start_date=None, end_date=None, days=365*5):
+    """
+    获取指数日线数据（与个股日线相同的本地存储和缓存路径）
+
+    参数:
+    index: str, 指数名称（见BENCHMARK_INDICES，如'csi300'）或指数代码（如'000300'）
+    start_date: str, 开始日期，格式：YYYYMMDD
+    end_date: str, 结束日期，格式：YYYYMMDD
+    days: int, 数据天数，默认5年（当未指定开始日期时使用）
+
+    返回:
+    pandas DataFrame, 以'日期'为索引的指数日线（与其他请求共享，只读）
+    """
+    index_code = BENCHMARK_INDICES.get(index, index)
+    if not end_date:
+        end_date = datetime.now().strftime("%Y%m%d")
+    if not start_date:
+        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y%m%d")
+
+    cache_key = (INDEX_PERIOD, index_code, start_date, end_date)
+    cached = _get_cached_frame(cache_key)
+    if cached is not None:
+        return cached
+
+    start = pd.Timestamp(datetime.strptime(start_date, "%Y%m%d"))
+    end = pd.Timestamp(datetime.strptime(end_date, "%Y%m%d"))
+
+    def _load():
+        _ensure_bars(index_code, INDEX_PERIOD, start, end, lambda s, e: _fetch_index(index_code, s, e),
+                     covered_until=pd.Timestamp(datetime.now().date()) - pd.Timedelta(days=1))
+        data = _bar_store.read(index_code, INDEX_PERIOD, start, end)
+        if len(data) == 0:
+            raise Exception(f"未获取到指数数据: {index_code}")
+        return data
+
+    data = shared_cache.get_or_compute('prices', cache_key, _load, ttl=cache_ttl(end_date))
+    print(f"成功获取指数数据 {index_code}，共 {len(data)} 条记录")
+    _set_cached_frame(cache_key, data)
     return data
 
 
+def _intraday_range(start_date, end_date, days):
+    """将YYYYMMDD日期转换为分钟线的时间范围（结束日期包含当天全部K线，且不超过当前时间）"""
+    now = pd.Timestamp(datetime.now())
+    end = pd.Timestamp(datetime.strptime(end_date, "%Y%m%d")) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1) if end_date else now
+    start = pd.Timestamp(datetime.strptime(start_date, "%Y%m%d")) if start_date else end.normalize() - pd.Timedelta(days=days)
+    return start, min(end, now)
+
 
+def _fetch_intraday(clean_symbol, period, start, end):
+    """从akshare拉取分钟线（不复权），返回以'日期'为索引的DataFrame"""
+    print(f"正在获取分钟线数据: {clean_symbol}, 周期: {period}分钟, 时间范围: {start} 到 {end}")
+    data = ak.stock_zh_a_hist_min_em(
+        symbol=clean_symbol,
+        start_date=start.strftime("%Y-%m-%d %H:%M:%S"),
+        end_date=end.strftime("%Y-%m-%d %H:%M:%S"),
+        period=period,
+        adjust=""
+    )
+    if data is None or len(data) == 0:
+        return pd.DataFrame()
+    # 与日线保持一致，时间列统一命名为'日期'并设置为索引
+    data = data.rename(columns={'时间': '日期'})
+    data['日期'] = pd.to_datetime(data['日期'])
+    data.set_index('日期', inplace=True)
+    return data.sort_index()
+
+
+def _has_weekday_session(start, end):
+    """时间段内是否有工作日的交易时段（收盘15:00之前开始），没有时取数为空属于正常情况"""
+    days = pd.bdate_range(start.normalize(), end.normalize())
+    return bool((days + pd.Timedelta(hours=15) > start).any())
+
+
+def _ensure_bars(clean_symbol, period, start, end, fetch, covered_until=None):
+    """
+    只拉取本地存储尚未覆盖的时间段并写入存储（多个工作进程之间互斥）
+
+    参数:
+    fetch: 可调用对象, 接收 (开始时间, 结束时间)，返回该时间段的K线
+    covered_until: pandas.Timestamp 或 None, 记为已拉取的最晚时间（之后的数据下次仍会重新拉取）
+    """
+    with shared_cache.lock(f"bars:{clean_symbol}:{period}"):
+        coverage = _bar_store.coverage(clean_symbol, period)
+        if coverage is None:
+            missing = [(start, end)]
+        else:
+            missing = []
+            if start < coverage[0]:
+                missing.append((start, coverage[0]))
+            if end > coverage[1]:
+                missing.append((coverage[1], end))
+        for segment_start, segment_end in missing:
+            data = fetch(segment_start, segment_end)
+            if len(data) == 0 and _has_weekday_session(segment_start, segment_end):
+                # 包含工作日却没有取到数据（接口异常或限流），不记为已拉取，下次重新拉取
+                print(f"未获取到{clean_symbol}在 {segment_start} 到 {segment_end} 的K线，不记录拉取区间")
+                continue
+            if covered_until is not None:
+                segment_end = min(segment_end, covered_until)
+            _bar_store.write(clean_symbol, period, data, start=segment_start, end=segment_end)
+
+
+def iter_intraday_data(symbol="000001", start_date=None, end_date=None, period='5', days=30):
+    """
+    按月分块读取分钟线数据（缺失部分会先拉取并写入本地存储）
+
+    参数:
+    symbol: str, 股票代码
+    start_date: str, 开始日期，格式：YYYYMMDD
+    end_date: str, 结束日期，格式：YYYYMMDD
+    period: str, 分钟线周期，'1'/'5'/'15'/'60'
+    days: int, 未指定开始日期时的数据天数
+
+    返回:
+    生成器, 每次产出一个月的分钟线DataFrame
+    """
+    if period not in INTRADAY_PERIODS:
+        raise ValueError(f"不支持的分钟线周期: {period}")
+    clean_symbol = symbol.replace('.ss', '').replace('.sz', '')
+    start, end = _intraday_range(start_date, end_date, days)
+    _ensure_bars(clean_symbol, period, start, end, lambda s, e: _fetch_intraday(clean_symbol, period, s, e))
+    yield from _bar_store.iter_chunks(clean_symbol, period, start, end)
+
+
+def get_intraday_data(symbol="000001", start_date=None, end_date=None, period='5', days=30):
+    """
+    获取分钟线数据（一次性读入内存，长历史请使用iter_intraday_data分块处理）
+
+    返回:
+    pandas DataFrame, 以'日期'（K线时间）为索引的分钟线数据（与其他请求共享，只读）
+    """
+    clean_symbol = symbol.replace('.ss', '').replace('.sz', '')
+    cache_key = (clean_symbol, start_date, end_date, period)
+    cached = _get_cached_frame(cache_key)
+    if cached is not None:
+        print(f"命中分钟线数据缓存，共 {len(cached)} 条记录")
+        return cached
+
+    chunks = list(iter_intraday_data(symbol, start_date, end_date, period=period, days=days))
+    if not chunks:
+        raise Exception(f"未获取到分钟线数据: {symbol}, 周期: {period}分钟")
+    data = pd.concat(chunks)
+    print(f"成功获取分钟线数据，共 {len(data)} 条记录")
+    _set_cached_frame(cache_key, data)
+    return data
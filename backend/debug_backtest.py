@@ -44,14 +44,14 @@ def debug_backtest():
                 
                 try:
                     # 生成交易信号
-                    data_with_signals = strategy['func'](data)
+                    signals = strategy['func'](data)
                     
                     # 检查信号数量
-                    buy_signals = (data_with_signals['信号'] == 1).sum()
-                    sell_signals = (data_with_signals['信号'] == -1).sum()
+                    buy_signals = (signals['信号'] == 1).sum()
+                    sell_signals = (signals['信号'] == -1).sum()
                     print(f"买入信号数量: {buy_signals}")
                     print(f"卖出信号数量: {sell_signals}")
-                    print(f"信号列统计:\n{data_with_signals['信号'].describe()}")
+                    print(f"信号列统计:\n{signals['信号'].describe()}")
                     
                     # 检查是否有信号
                     if buy_signals == 0 and sell_signals == 0:
@@ -61,7 +61,8 @@ def debug_backtest():
                     
                     # 创建回测引擎实例
                     backtest_engine = BacktestEngine(
-                        data_with_signals,
+                        data,
+                        signals=signals,
                         initial_capital=100000,
                         transaction_cost=0.001,
                         slippage=0.0005
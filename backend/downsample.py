@@ -0,0 +1,304 @@
+import numpy as np
+import pandas as pd
+
+
+def _bucket_edges(n_points, n_buckets):
+    """将区间 [1, n_points-1) 均匀划分为 n_buckets 个桶，返回桶边界"""
+    return np.linspace(1, n_points - 1, n_buckets + 1).astype(np.int64)
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets降采样，返回保留点的位置
+
+    参数:
+    x: array-like, 横坐标（单调递增，日期可先转为整数）
+    y: array-like, 纵坐标
+    n_out: int, 目标点数（至少为3）
+
+    返回:
+    numpy.ndarray, 升序排列的保留点位置
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n_points = len(y)
+    if n_out >= n_points or n_out < 3:
+        return np.arange(n_points)
+
+    # 首尾两点固定保留，中间划分为 n_out-2 个桶
+    edges = _bucket_edges(n_points, n_out - 2)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n_points - 1
+
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # 下一个桶的平均点作为三角形的第三个顶点
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+        else:
+            next_start, next_end = n_points - 1, n_points
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        area = np.abs(
+            (x[previous] - avg_x) * (bucket_y - y[previous])
+            - (x[previous] - bucket_x) * (avg_y - y[previous])
+        )
+        previous = start + int(np.nanargmax(area)) if np.isfinite(area).any() else start
+        indices[bucket + 1] = previous
+
+    return indices
+
+
+def minmax_indices(y, n_buckets):
+    """
+    每个桶保留最小值和最大值所在的点，能够完整保留价格的尖峰和低谷
+
+    参数:
+    y: array-like, 纵坐标
+    n_buckets: int, 桶数量（输出点数约为 2 * n_buckets + 2）
+
+    返回:
+    numpy.ndarray, 升序排列的保留点位置
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n_points = len(y)
+    if 2 * n_buckets + 2 >= n_points or n_buckets < 1:
+        return np.arange(n_points)
+
+    edges = _bucket_edges(n_points, n_buckets)
+    bucket_size = int(np.diff(edges).max())
+    # 将每个桶填充为等长的二维矩阵，一次性求出每个桶的最值位置
+    offsets = edges[:-1, np.newaxis] + np.arange(bucket_size)
+    valid = offsets < edges[1:, np.newaxis]
+    offsets = np.minimum(offsets, n_points - 1)
+    values = y[offsets]
+    argmin = np.where(valid, values, np.inf).argmin(axis=1)
+    argmax = np.where(valid, values, -np.inf).argmax(axis=1)
+    rows = np.arange(n_buckets)
+    picked = np.concatenate(([0, n_points - 1], offsets[rows, argmin], offsets[rows, argmax]))
+    return np.unique(picked)
+
+
+def drawdown_trough_indices(equity):
+    """
+    每段回撤（从前高回落到重新创出新高）中净值最低点的位置
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    if len(equity) == 0:
+        return np.array([], dtype=np.int64)
+    running_max = np.fmax.accumulate(equity)
+    underwater = equity < running_max
+    # 每段回撤的编号：每创出一次新高，编号加1
+    episode = np.cumsum(~underwater)
+    positions = np.flatnonzero(underwater)
+    if len(positions) == 0:
+        return positions
+    # 同一段回撤内历史最高点不变，数值最小处即回撤最深处
+    order = np.lexsort((equity[positions], episode[positions]))
+    sorted_episodes = episode[positions][order]
+    first = np.r_[True, sorted_episodes[1:] != sorted_episodes[:-1]]
+    return np.sort(positions[order][first])
+
+
+def _base_indices(x, y, n_out, method):
+    """不考虑强制保留点时的降采样结果，点数不超过n_out（n_out小于3时只保留首尾两点）"""
+    n_points = len(y)
+    if n_out >= n_points:
+        return np.arange(n_points)
+    if n_out < 3:
+        return np.array([0, n_points - 1], dtype=np.int64)[:max(n_out, 1)]
+    if method == 'lttb':
+        return lttb_indices(x, y, n_out)
+    # 每个桶最多保留2个点，另加首尾两点
+    return minmax_indices(y, max(1, n_out // 2 - 1))
+
+
+def _thin_positions(positions, budget, n_points, priority=None):
+    """
+    将位置均匀分到budget个桶中，每个桶只保留优先级最高（priority最小）的一个位置
+
+    参数:
+    positions: array-like, 升序排列的位置
+    budget: int, 最多保留的位置数
+    n_points: int, 序列总长度
+    priority: array-like 或 None, 与positions对应的优先级，数值越小越优先；None时保留桶内第一个位置
+
+    返回:
+    numpy.ndarray, 升序排列的保留位置（数量不超过budget）
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    if len(positions) <= budget:
+        return positions
+    if budget < 1:
+        return positions[:0]
+    priority = np.zeros(len(positions)) if priority is None else np.asarray(priority, dtype=np.float64)
+    buckets = positions * budget // max(n_points, 1)
+    order = np.lexsort((priority, buckets))
+    sorted_buckets = buckets[order]
+    first = np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]]
+    return np.sort(positions[order][first])
+
+
+def downsample_indices(x, y, target_points, method='lttb', keep=None, keep_priority=None):
+    """
+    计算降采样后保留的点，并保留指定位置（如交易点、回撤低点）
+
+    强制保留的点占用目标点数中的名额，结果不超过target_points个点：
+    强制保留点最多占一半名额，超出时按桶抽稀（每个桶保留keep_priority最小的点），其余名额用于降采样。
+
+    参数:
+    x: array-like, 横坐标
+    y: array-like, 纵坐标
+    target_points: int, 目标点数（通常等于图表像素宽度）
+    method: str, 'lttb' 或 'minmax'
+    keep: array-like 或 None, 需要保留的位置
+    keep_priority: array-like 或 None, 与keep对应的优先级，数值越小越优先
+
+    返回:
+    numpy.ndarray, 升序排列的保留点位置
+    """
+    if method not in ('lttb', 'minmax'):
+        raise ValueError(f"不支持的降采样方法: {method}")
+    n_points = len(y)
+    if target_points >= n_points:
+        return np.arange(n_points)
+    if keep is None or len(keep) == 0:
+        return _base_indices(x, y, target_points, method)
+    keep = np.asarray(keep, dtype=np.int64)
+    order = np.argsort(keep, kind='stable')
+    keep = keep[order]
+    if keep_priority is not None:
+        keep_priority = np.asarray(keep_priority, dtype=np.float64)[order]
+    keep = _thin_positions(keep, target_points // 2, n_points, keep_priority)
+    return np.union1d(_base_indices(x, y, target_points - len(keep), method), keep)
+
+
+def multi_series_indices(y_matrix, target_points, method='lttb'):
+    """
+    多条曲线共用横坐标时的降采样（如多策略净值对比）：每条曲线分得相同的点数，取保留点的并集
+
+    每条曲线分得 target_points // 曲线数 个点，并集不超过target_points；
+    曲线很多、每条分不到3个点时只保留首尾两点。
+
+    参数:
+    y_matrix: array-like, (曲线数 × 点数) 的纵坐标矩阵
+    target_points: int 或 None, 目标点数，None表示保留全部点
+    method: str, 'lttb' 或 'minmax'
+
+    返回:
+    numpy.ndarray, 升序排列的保留点位置
+    """
+    y_matrix = np.atleast_2d(np.asarray(y_matrix, dtype=np.float64))
+    n_curves, n_points = y_matrix.shape
+    if target_points is None or n_points <= target_points or n_curves == 0:
+        return np.arange(n_points)
+    x = np.arange(n_points, dtype=np.float64)
+    per_curve = target_points // n_curves
+    if per_curve < 3:
+        return np.array([0, n_points - 1], dtype=np.int64)[:max(target_points, 1)]
+    indices = [downsample_indices(x, y, per_curve, method=method) for y in y_matrix]
+    return np.unique(np.concatenate(indices))
+
+
+def _trade_indices(data, signal_col='信号', position_col='持仓数量'):
+    """实际发生交易的位置（持仓数量变化），没有持仓列时退化为信号非零的位置"""
+    if position_col in data.columns:
+        positions = data[position_col].to_numpy()
+        return np.flatnonzero(np.diff(positions, prepend=positions[:1]) != 0)
+    if signal_col in data.columns:
+        return np.flatnonzero(data[signal_col].to_numpy() != 0)
+    return np.array([], dtype=np.int64)
+
+
+def _drawdown(values, value_col):
+    """相对历史最高点的回撤比例；累计收益率列按净值（1 + 累计收益率）计算"""
+    nav = 1 + values if value_col.endswith('累计收益率') else values
+    running_max = np.fmax.accumulate(nav)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = nav / running_max - 1
+    return np.nan_to_num(drawdown, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def downsample_backtest_data(data, target_points, value_col='总资金', method='lttb'):
+    """
+    对回测数据做降采样，保留回撤低点和交易点
+
+    结果不超过target_points行：回撤低点和交易点较多时按时间分桶，每个桶保留回撤最深的一个，
+    因此最大回撤的最低点总会保留。
+
+    参数:
+    data: pandas DataFrame, 回测数据（日期索引）
+    target_points: int, 目标点数
+    value_col: str, 用于选点的数值列，默认'总资金'
+    method: str, 'lttb' 或 'minmax'
+
+    返回:
+    pandas DataFrame, 降采样后的回测数据（行数不超过target_points）
+    """
+    if target_points is None or len(data) <= target_points:
+        return data
+    # 首行收益率为NaN，用相邻值填充后再选点
+    values = data[value_col].ffill().bfill().to_numpy(dtype=np.float64)
+    x = np.arange(len(data), dtype=np.float64)
+    keep = np.union1d(drawdown_trough_indices(values), _trade_indices(data))
+    indices = downsample_indices(x, values, target_points, method=method, keep=keep,
+                                 keep_priority=_drawdown(values, value_col)[keep])
+    return data.iloc[indices]
+
+
+class StreamingDownsampler:
+    """
+    分块输入的降采样（如分块回测逐月产出的回测数据）
+
+    每个分块先降采样到target_points，累积的点数超过4倍target_points时合并后再降采样到2倍，
+    内存占用与输入总长度无关；result()返回最终降采样到target_points的结果。
+
+    参数:
+    target_points: int, 目标点数
+    value_col: str, 用于选点的数值列，见downsample_backtest_data
+    method: str, 'lttb' 或 'minmax'
+    """
+
+    def __init__(self, target_points, value_col='总资金', method='lttb'):
+        self.target_points = target_points
+        self.value_col = value_col
+        self.method = method
+        self._parts = []
+        self._rows = 0
+
+    def add(self, chunk):
+        part = downsample_backtest_data(chunk, self.target_points, self.value_col, self.method)
+        self._parts.append(part)
+        self._rows += len(part)
+        if self._rows > 4 * self.target_points:
+            merged = downsample_backtest_data(pd.concat(self._parts), 2 * self.target_points,
+                                              self.value_col, self.method)
+            self._parts = [merged]
+            self._rows = len(merged)
+
+    def result(self):
+        if not self._parts:
+            return None
+        return downsample_backtest_data(pd.concat(self._parts), self.target_points, self.value_col, self.method)
+
+
+def slice_window(data, start=None, end=None):
+    """
+    截取日期窗口（用于缩放查询，返回窗口内全分辨率数据）
+
+    参数:
+    data: pandas DataFrame, 日期索引
+    start: str 或 None, 开始日期，格式YYYYMMDD或YYYY-MM-DD
+    end: str 或 None, 结束日期
+    """
+    start = pd.Timestamp(start) if start else None
+    end = pd.Timestamp(end) if end else None
+    if end is not None and end == end.normalize():
+        # 仅给出日期时包含当天全部K线
+        end = end + pd.Timedelta(days=1) - pd.Timedelta(1, unit='ns')
+    return data.loc[start:end]
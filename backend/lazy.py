@@ -0,0 +1,45 @@
+import importlib
+import threading
+import time
+
+
+class LazyModule:
+    """
+    延迟导入的模块：第一次访问属性时才真正导入
+
+    用于akshare、matplotlib等导入较慢的依赖，服务启动时不需要加载，
+    可以在启动后由后台预热线程调用load()提前导入。
+
+    参数:
+    name: str, 模块名，如'akshare'、'matplotlib.pyplot'
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+        self.load_seconds = None
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        """导入模块（只导入一次），返回真实的模块对象"""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    self.load_seconds = time.perf_counter() - start
+                    print(f"已导入 {self._name}，耗时 {self.load_seconds:.2f} 秒")
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        # 只有实例上不存在的属性才会进入这里
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = "已导入" if self.loaded else "未导入"
+        return f"<LazyModule {self._name} ({state})>"
@@ -1,15 +1,44 @@
-from fastapi import FastAPI, HTTPException
+import time
+
+# 启动耗时统计的起点（在导入其他依赖之前记录）
+_STARTUP_BEGIN = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Header, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
+from typing import Dict, List, Optional, Union
 import pandas as pd
 import numpy as np
-import base64
-from io import BytesIO
+import itertools
+import os
+import threading
 
-from strategies import moving_average_crossover_strategy, bollinger_band_strategy, rsi_strategy
-from backtest import BacktestEngine
-from data import get_stock_data
-from charts import generate_equity_curve, generate_heatmap
+from strategies import SharedIndicators, compute_signals, trend_filter, warmup_bars, STRATEGY_FUNCTIONS
+from backtest import BacktestEngine, compact_frame, run_backtest_batch, iter_chunked_backtest
+from data import (get_stock_data, iter_intraday_data, factor_version, bars_per_year, cache_ttl, INTRADAY_PERIODS,
+                  FactorUnavailableError)
+from charts import (generate_equity_curve, generate_heatmap, generate_comparison_chart, ChunkedChartData,
+                    CHART_WIDTH_PX)
+from downsample import StreamingDownsampler, downsample_backtest_data, multi_series_indices, slice_window
+from metrics import calculate_metrics
+from resample import get_timeframe, timeframe_rule, resample_chunks
+from adjust import ADJUST_MODES
+from benchmark import benchmark_metrics, is_valid_benchmark
+from shared_cache import shared_cache
+import profiling
+import serializers
+import streaming
+import charts
+import data as data_module
+
+# 启动耗时：模块导入耗时、后台预热耗时、启动到第一个响应完成的耗时（秒）
+startup_timings = {
+    "import_seconds": time.perf_counter() - _STARTUP_BEGIN,
+    "prewarm_seconds": None,
+    "first_response_seconds": None,
+}
+print(f"后端模块导入耗时 {startup_timings['import_seconds']:.2f} 秒")
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -27,6 +56,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 启动时预热的股票代码（逗号分隔），如 QUANT_WARMUP_SYMBOLS=000001,600519
+WARMUP_SYMBOLS = [code.strip() for code in os.environ.get("QUANT_WARMUP_SYMBOLS", "").split(",") if code.strip()]
+
+# 服务开始接受请求后是否在后台导入akshare、matplotlib并预热字体缓存，设置QUANT_PREWARM=0关闭
+PREWARM = os.environ.get("QUANT_PREWARM", "1") != "0"
+
+def _warm_up():
+    """
+    后台预热：导入延迟加载的依赖并预热字体缓存，清理过期的共享缓存，
+    并预先拉取常用股票的日线数据（多个工作进程只会拉取一次）
+    """
+    if PREWARM:
+        start = time.perf_counter()
+        try:
+            data_module.ak.load()
+            charts.prewarm()
+        except Exception as e:
+            print(f"预热依赖失败: {e}")
+        startup_timings["prewarm_seconds"] = time.perf_counter() - start
+        print(f"后台预热完成，耗时 {startup_timings['prewarm_seconds']:.2f} 秒")
+    shared_cache.prune()
+    # 使用接口的默认请求参数拉取，缓存键与不指定日期等参数的回测请求一致
+    defaults = BacktestRequest(strategy_id=strategies[0]["id"])
+    for symbol in WARMUP_SYMBOLS:
+        try:
+            get_stock_data(symbol=symbol, start_date=defaults.start_date, end_date=defaults.end_date,
+                           period=defaults.period, adjust=defaults.adjust)
+        except Exception as e:
+            print(f"预热股票数据失败 {symbol}: {e}")
+
+@app.on_event("startup")
+def start_warm_up():
+    # 在后台线程中预热，不阻塞服务启动
+    threading.Thread(target=_warm_up, daemon=True).start()
+
+@app.middleware("http")
+async def record_first_response(request, call_next):
+    response = await call_next(request)
+    if startup_timings["first_response_seconds"] is None:
+        startup_timings["first_response_seconds"] = time.perf_counter() - _STARTUP_BEGIN
+        print(f"启动到第一个响应耗时 {startup_timings['first_response_seconds']:.2f} 秒")
+    return response
+
 # 策略列表
 strategies = [
     {
@@ -69,112 +141,664 @@ class BacktestRequest(BaseModel):
     stock_code: str = "000001"
     start_date: str = "20240101"
     end_date: str = None
+    # K线周期：'daily'（日线）或 '1'/'5'/'15'/'60'（分钟线）
+    period: str = "daily"
+    # 日线复权方式：'qfq'（前复权）、'hfq'（后复权）或 'none'（不复权）
+    adjust: str = "qfq"
+    # 高周期趋势过滤：'weekly'、'monthly' 或 N分钟（如'30min'），None表示不过滤
+    trend_timeframe: Optional[str] = None
+    # 净值曲线图片的绘制点数上限，默认为图片像素宽度
+    chart_width: Optional[int] = None
+    # 相对基准指数计算阿尔法、贝塔等指标：'csi300'、'csi500' 或指数代码，仅支持日线
+    benchmark: Optional[str] = None
+    # 止损/止盈/移动止损比例（如0.05表示5%），None表示不设置
+    stop_loss: Optional[float] = None
+    take_profit: Optional[float] = None
+    trailing_stop: Optional[float] = None
 
-# 运行回测
-@app.post("/api/backtest")
-def run_backtest(request: BacktestRequest):
+    def exit_params(self):
+        """传给BacktestEngine的止损止盈参数"""
+        return {
+            'stop_loss': self.stop_loss,
+            'take_profit': self.take_profit,
+            'trailing_stop': self.trailing_stop,
+        }
+
+def _validate_request(request):
+    """验证回测请求参数，不合法时抛出400错误"""
+    # 验证策略ID
+    if request.strategy_id not in [s["id"] for s in strategies]:
+        raise HTTPException(status_code=400, detail="无效的策略ID")
+    if request.period != "daily" and request.period not in INTRADAY_PERIODS:
+        raise HTTPException(status_code=400, detail=f"不支持的K线周期: {request.period}")
+    if request.benchmark is not None:
+        if not is_valid_benchmark(request.benchmark):
+            raise HTTPException(status_code=400, detail=f"不支持的基准指数: {request.benchmark}")
+        if request.period != "daily":
+            raise HTTPException(status_code=400, detail="基准指数对比仅支持日线")
+    if request.adjust not in ADJUST_MODES:
+        raise HTTPException(status_code=400, detail=f"不支持的复权方式: {request.adjust}")
+    code = request.stock_code.replace('.ss', '').replace('.sz', '')
+    if len(code) != 6 or not code.isdigit():
+        raise HTTPException(status_code=400, detail=f"无效的股票代码: {request.stock_code}")
+    if request.trend_timeframe:
+        try:
+            timeframe_rule(request.trend_timeframe)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    for name in ('stop_loss', 'trailing_stop'):
+        value = getattr(request, name)
+        if value is not None and not 0 < value < 1:
+            raise HTTPException(status_code=400, detail=f"{name}必须在0到1之间")
+    if request.take_profit is not None and request.take_profit <= 0:
+        raise HTTPException(status_code=400, detail="take_profit必须大于0")
+
+def _factor_version(request):
+    """请求对应的复权因子版本（用于缓存键），复权因子暂时无法获取时返回503"""
+    try:
+        return factor_version(request.stock_code, request.adjust, request.period)
+    except FactorUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+# 引擎快照的有效期：快照只在同一配置延后结束日期时使用，过期后由共享缓存清理
+SNAPSHOT_TTL = 7 * 24 * 3600
+
+def _run_with_snapshot(data, snapshot_key, signals_for, engine_kwargs, warmup=0, full_signals=None,
+                       trade_logic='full'):
+    """
+    执行回测：同一配置之前回测到较早的结束日期时，从其快照继续，只为新增的K线生成信号并模拟；
+    回测完成后保存覆盖范围更长的快照（工作进程之间共享，有效期SNAPSHOT_TTL）
+
+    参数:
+    data: pandas DataFrame, 价格数据
+    snapshot_key: tuple, 快照缓存键（同一配置不含结束日期）
+    signals_for: 函数, 由价格数据生成信号；从快照继续时传入快照末尾的K线窗口和新增的K线
+    engine_kwargs: dict, BacktestEngine的其他参数
+    warmup: int, 计算指标需要的历史K线数（见strategies.warmup_bars），保存在快照中
+    full_signals: 函数 或 None, 完整回测时生成全部K线的信号（如读取共享缓存），None表示signals_for(data)
+    trade_logic: str, 交易逻辑类型
+
+    返回:
+    BacktestEngine, 已完成回测的引擎实例
+    """
+    snapshot = shared_cache.get('snapshots', snapshot_key)
+    last_bar = data.index[-1] if len(data) > 0 else None
+    extends = last_bar is not None and (snapshot is None or snapshot.end < last_bar)
+    engine = None
+    if snapshot is not None and extends:
+        if snapshot.matches(data):
+            n_done = len(snapshot)
+            window = snapshot.window
+            signals = signals_for(pd.concat([window, data.iloc[n_done:]])).iloc[len(window):]
+            try:
+                engine = BacktestEngine(data, signals=signals, **engine_kwargs)
+                engine.resume(snapshot, trade_logic=trade_logic)
+                print(f"从回测快照（{snapshot.end}）继续，新增K线 {len(data) - n_done} 根")
+            except ValueError as e:
+                print(f"回测快照不可用，重新完整回测: {e}")
+                engine = None
+        else:
+            print("快照之前的K线数据已发生变化，重新完整回测")
+    if engine is None:
+        signals = full_signals() if full_signals is not None else signals_for(data)
+        engine = BacktestEngine(data, signals=signals, **engine_kwargs)
+        engine.run(trade_logic=trade_logic)
+    if extends:
+        shared_cache.set('snapshots', snapshot_key, engine.snapshot(window=warmup), ttl=SNAPSHOT_TTL)
+    return engine
+
+def _execute_backtest(request, resume=True):
+    """
+    获取数据、生成信号并执行回测
+
+    参数:
+    request: BacktestRequest
+    resume: bool, 是否从之前的快照继续回测；继续回测时快照之前K线的信号和指标列为空，
+        需要每根K线指标列的调用方（如Arrow输出）传入False
+
+    返回:
+    BacktestEngine, 已完成回测的引擎实例
+    """
     strategy_id = request.strategy_id
     stock_code = request.stock_code
     start_date = request.start_date
     end_date = request.end_date
+
+    _validate_request(request)
+
+    # 获取股票数据
     try:
-        # 验证策略ID
-        if strategy_id not in [s["id"] for s in strategies]:
-            raise HTTPException(status_code=400, detail="无效的策略ID")
+        data = get_stock_data(symbol=stock_code, start_date=start_date, end_date=end_date, period=request.period,
+                              adjust=request.adjust)
+        print(f"股票数据形状: {data.shape}")
+        print(f"股票数据日期范围: {data.index.min()} 到 {data.index.max()}")
+        print(f"股票数据前5行:\n{data.head()}")
+    except FactorUnavailableError as e:
+        print(f"获取股票数据失败: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(f"获取股票数据失败: {e}")
+        # 注意：get_stock_data函数在获取真实数据失败时会返回模拟数据，所以这里不应该抛出异常
+        # 只有当get_stock_data函数本身出现严重错误时，才会进入这里
+        raise HTTPException(status_code=500, detail=f"获取股票数据失败: {e}")
 
-        # 获取股票数据
-        try:
-            data = get_stock_data(symbol=stock_code, start_date=start_date, end_date=end_date)
-            print(f"股票数据形状: {data.shape}")
-            print(f"股票数据日期范围: {data.index.min()} 到 {data.index.max()}")
-            print(f"股票数据前5行:\n{data.head()}")
-        except Exception as e:
-            print(f"获取股票数据失败: {e}")
-            # 注意：get_stock_data函数在获取真实数据失败时会返回模拟数据，所以这里不应该抛出异常
-            # 只有当get_stock_data函数本身出现严重错误时，才会进入这里
-            raise HTTPException(status_code=500, detail=f"获取股票数据失败: {e}")
+    # 复权因子版本（获取数据时已加载，这里不会再访问数据源）
+    version = _factor_version(request)
 
-        # 根据策略ID选择策略
+    def _generate_signals(frame):
+        """生成frame的交易信号（完整数据，或快照的K线窗口加新增的K线）"""
         try:
             if strategy_id == 1:
                 # 双均线金叉死叉策略
                 print("使用双均线金叉死叉策略")
-                data_with_signals = moving_average_crossover_strategy(data)
             elif strategy_id == 2:
                 # RSI超卖反转策略
                 print("使用RSI超卖反转策略")
-                data_with_signals = rsi_strategy(data)
             elif strategy_id == 3:
                 # 布林带突破策略
                 print("使用布林带突破策略")
-                data_with_signals = bollinger_band_strategy(data)
-            else:
-                raise HTTPException(status_code=400, detail="无效的策略ID")
-            
+            signals = compute_signals(frame, strategy_id)
+
+            # 高周期趋势过滤（聚合K线由完整数据按股票缓存，只在有新K线时增量更新）
+            if request.trend_timeframe:
+                print(f"使用{request.trend_timeframe}趋势过滤")
+                trend_bars = get_timeframe(stock_code, request.period, request.trend_timeframe, data,
+                                           request.adjust, version)
+                signals = trend_filter(signals, trend_bars)
+
             # 检查信号数量
-            buy_signals = (data_with_signals['信号'] == 1).sum()
-            sell_signals = (data_with_signals['信号'] == -1).sum()
-            print(f"买入信号数量: {buy_signals}")
-            print(f"卖出信号数量: {sell_signals}")
-            print(f"信号列统计:\n{data_with_signals['信号'].describe()}")
-            
+            print(f"买入信号数量: {(signals['信号'] == 1).sum()}")
+            print(f"卖出信号数量: {(signals['信号'] == -1).sum()}")
+            return signals
         except Exception as e:
             print(f"生成交易信号失败: {e}")
             raise HTTPException(status_code=500, detail=f"生成交易信号失败: {e}")
 
-        # 创建回测引擎实例
-        try:
-            backtest_engine = BacktestEngine(
-                data_with_signals,
-                initial_capital=100000,
-                transaction_cost=0.001,
-                slippage=0.0005
-            )
-            print("回测引擎实例创建成功")
-        except Exception as e:
-            print(f"创建回测引擎实例失败: {e}")
-            raise HTTPException(status_code=500, detail=f"创建回测引擎实例失败: {e}")
+    def _full_signals():
+        # 指标和信号在工作进程之间共享（包含复权因子版本，除权后前复权价格变化时重新计算）
+        signals_key = (stock_code, start_date, end_date, request.period, request.adjust, strategy_id,
+                       request.trend_timeframe, version)
+        signals = shared_cache.get_or_compute('signals', signals_key, lambda: _generate_signals(data),
+                                              ttl=cache_ttl(end_date))
+        if not signals.index.equals(data.index):
+            # 价格数据已更新（缓存的信号基于旧数据），重新计算
+            signals = _generate_signals(data)
+            shared_cache.set('signals', signals_key, signals, ttl=cache_ttl(end_date))
+        return signals
 
-        # 执行回测
-        try:
-            results = backtest_engine.run(trade_logic='full')
-            print(f"回测结果: {results}")
-            
-            # 检查回测数据
-            backtest_data = backtest_engine.backtest_data
-            print(f"回测数据形状: {backtest_data.shape}")
-            print(f"回测数据前5行:\n{backtest_data.head()}")
-            print(f"策略收益率统计:\n{backtest_data['策略收益率'].describe()}")
-            print(f"策略累计收益率统计:\n{backtest_data['策略累计收益率'].describe()}")
-            print(f"总资金统计:\n{backtest_data['总资金'].describe()}")
-            
-        except Exception as e:
-            print(f"执行回测失败: {e}")
-            raise HTTPException(status_code=500, detail=f"执行回测失败: {e}")
-
-        # 生成图表
-        equity_curve_img = generate_equity_curve(backtest_engine.backtest_data)
-        heatmap_img = generate_heatmap(backtest_engine.backtest_data)
-
-        # 构建响应
-        response = {
-            "metrics": results,
-            "charts": {
-                "equity_curve": equity_curve_img,
-                "heatmap": heatmap_img
-            }
+    engine_kwargs = dict(
+        initial_capital=100000,
+        transaction_cost=0.001,
+        slippage=0.0005,
+        periods_per_year=bars_per_year(request.period),
+        **request.exit_params()
+    )
+
+    # 执行回测（结束日期延长时从之前的快照继续）
+    try:
+        if resume:
+            snapshot_key = (stock_code, start_date, request.period, request.adjust, strategy_id,
+                            request.trend_timeframe, tuple(sorted(request.exit_params().items())))
+            backtest_engine = _run_with_snapshot(data, snapshot_key, _generate_signals, engine_kwargs,
+                                                 warmup=warmup_bars(STRATEGY_FUNCTIONS[strategy_id]),
+                                                 full_signals=_full_signals)
+        else:
+            backtest_engine = BacktestEngine(data, signals=_full_signals(), **engine_kwargs)
+            backtest_engine.run()
+        print(f"回测结果: {backtest_engine.results}")
+
+        # 检查回测输出（不拼接完整回测数据）
+        output = backtest_engine.output
+        print(f"回测输出形状: {output.shape}")
+        print(f"策略收益率统计:\n{output['策略收益率'].describe()}")
+        print(f"策略累计收益率统计:\n{output['策略累计收益率'].describe()}")
+        print(f"总资金统计:\n{output['总资金'].describe()}")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"执行回测失败: {e}")
+        raise HTTPException(status_code=500, detail=f"执行回测失败: {e}")
+
+    return backtest_engine
+
+def _iter_intraday_backtest(request):
+    """
+    分钟线回测：按月分块读取本地存储的K线，逐块生成信号并回测（账户和绩效指标跨分块延续），
+    不把整段分钟线读入内存，结果与一次性回测一致
+
+    参数:
+    request: BacktestRequest, period为分钟线周期
+
+    返回:
+    生成器, 逐个产出已完成回测的分块引擎（results为截至该分块的累计绩效指标）
+    """
+    def _chunks():
+        return iter_intraday_data(request.stock_code, request.start_date, request.end_date, period=request.period)
+
+    trend_bars = None
+    if request.trend_timeframe:
+        # 高周期K线数量很少，先逐块聚合一遍
+        print(f"使用{request.trend_timeframe}趋势过滤")
+        trend_bars = resample_chunks(_chunks(), request.trend_timeframe)
+
+    def _signals(frame):
+        signals = compute_signals(frame, request.strategy_id)
+        return trend_filter(signals, trend_bars) if trend_bars is not None else signals
+
+    return iter_chunked_backtest(
+        _chunks(),
+        _signals,
+        warmup=warmup_bars(STRATEGY_FUNCTIONS[request.strategy_id]),
+        initial_capital=100000,
+        transaction_cost=0.001,
+        slippage=0.0005,
+        periods_per_year=bars_per_year(request.period),
+        **request.exit_params()
+    )
+
+def _intraday_backtest_response(request):
+    """分钟线的/api/backtest响应：逐块回测，净值曲线逐块降采样，热力图只保留月度收益"""
+    charts_data = ChunkedChartData(request.chart_width or CHART_WIDTH_PX)
+    results = None
+    try:
+        for engine in _iter_intraday_backtest(request):
+            charts_data.add(engine.compact_data())
+            results = engine.results
+    except Exception as e:
+        print(f"执行回测失败: {e}")
+        raise HTTPException(status_code=500, detail=f"执行回测失败: {e}")
+    if results is None:
+        raise HTTPException(status_code=500, detail="获取股票数据失败: 没有分钟线数据")
+    print(f"回测结果: {results}")
+
+    return {
+        "metrics": results,
+        "charts": {
+            "equity_curve": charts_data.equity_curve(),
+            "heatmap": charts_data.heatmap()
+        }
+    }
+
+def _backtest_response(request):
+    """执行回测并生成图表，返回/api/backtest的响应内容"""
+    _validate_request(request)
+    if request.period in INTRADAY_PERIODS:
+        return _intraday_backtest_response(request)
+    backtest_engine = _execute_backtest(request)
+
+    # 生成图表（只需要输出列，使用float32的紧凑数据；从快照继续时之前K线的信号列为空）
+    backtest_data = compact_frame(backtest_engine.output)
+    equity_curve_img = generate_equity_curve(
+        backtest_data,
+        max_points=request.chart_width or CHART_WIDTH_PX
+    )
+    heatmap_img = generate_heatmap(backtest_data)
+
+    # 构建响应
+    response = {
+        "metrics": backtest_engine.results,
+        "charts": {
+            "equity_curve": equity_curve_img,
+            "heatmap": heatmap_img
         }
+    }
+    if request.benchmark:
+        relative = benchmark_metrics(backtest_engine.output['总资金'].to_numpy(), backtest_engine.output.index,
+                                     request.benchmark, bars_per_year(request.period))
+        response["benchmark_metrics"] = {key: float(values[0]) for key, values in relative.items()}
+    return response
+
+# 运行回测
+@app.post("/api/backtest")
+def run_backtest(request: BacktestRequest, x_profile_token: Optional[str] = Header(None)):
+    # 先验证参数，无效的复权方式、股票代码或周期不会触发复权因子拉取
+    _validate_request(request)
+    # 携带有效令牌的请求或管理接口布置的接下来N次回测在性能分析下执行；
+    # 未启用性能分析时忽略X-Profile-Token请求头，与未携带时相同
+    if profiling.enabled() and (x_profile_token is not None or profiling.armed_runs()):
+        interval = _profile_interval(x_profile_token)
+        if interval is not None:
+            return _profiled_backtest(request, interval)
+    try:
+        # 相同请求的结果（含图表）编码为JSON后在工作进程之间共享，复权因子更新后不再命中
+        cache_key = (request.model_dump_json(), _factor_version(request))
+        content = shared_cache.get_or_compute(
+            'backtest_json', cache_key,
+            lambda: serializers.dumps_json(_backtest_response(request)),
+            ttl=cache_ttl(request.end_date)
+        )
+        return serializers.json_response(content)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _profile_interval(token):
+    """本次回测的采样间隔；令牌无效时返回403，不需要分析时返回None"""
+    if token is not None:
+        if not profiling.check_token(token):
+            raise HTTPException(status_code=403, detail="性能分析令牌无效")
+        return profiling.DEFAULT_INTERVAL
+    return profiling.take()
+
+def _profiled_backtest(request, interval):
+    """在性能分析下执行回测：不读取结果缓存，分析结果ID通过X-Profile-Id响应头返回"""
+    try:
+        with profiling.profile_run('/api/backtest', request.model_dump(), interval) as summary:
+            content = serializers.dumps_json(_backtest_response(request))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    response = serializers.json_response(content)
+    if summary is not None:
+        response.headers["X-Profile-Id"] = summary["id"]
+    return response
+
+# 单次对比请求的策略数上限
+MAX_COMPARE_STRATEGIES = 10
+
+# 对比结果中由metrics.calculate_metrics补充的指标（其余指标与/api/backtest一致）
+COMPARE_EXTRA_METRICS = ('年化波动率', '索提诺比率', '卡玛比率', '最大回撤持续期')
+
+class CompareStrategy(BaseModel):
+    strategy_id: int
+    # 策略参数，未传入的使用策略默认值
+    params: Dict[str, Union[int, float]] = {}
+
+class CompareRequest(BaseModel):
+    stock_code: str = "000001"
+    start_date: str = "20240101"
+    end_date: str = None
+    period: str = "daily"
+    adjust: str = "qfq"
+    strategies: List[CompareStrategy]
+    chart_width: Optional[int] = None
+    benchmark: Optional[str] = None
+
+def _compare_label(spec):
+    """对比图例中的策略名称，如'双均线金叉死叉(short_window=20, long_window=60)'"""
+    name = next(s["name"] for s in strategies if s["id"] == spec.strategy_id)
+    if not spec.params:
+        return name
+    return f"{name}({', '.join(f'{key}={value}' for key, value in spec.params.items())})"
+
+def _validate_compare_request(request):
+    """验证多策略对比请求参数，不合法时抛出400错误"""
+    if not request.strategies:
+        raise HTTPException(status_code=400, detail="至少需要一个策略")
+    if len(request.strategies) > MAX_COMPARE_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"一次最多对比{MAX_COMPARE_STRATEGIES}个策略")
+    for spec in request.strategies:
+        _validate_request(BacktestRequest(strategy_id=spec.strategy_id, **request.model_dump(exclude={"strategies"})))
+
+def _compare_response(request):
+    """
+    多策略对比：只获取一次数据，各策略共用指标缓存，所有策略在一次批量回测中计算
+
+    返回:
+    dict, /api/compare的响应内容
+    """
+    _validate_compare_request(request)
+    try:
+        data = get_stock_data(symbol=request.stock_code, start_date=request.start_date, end_date=request.end_date,
+                              period=request.period, adjust=request.adjust)
+    except FactorUnavailableError as e:
+        print(f"获取股票数据失败: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(f"获取股票数据失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取股票数据失败: {e}")
+
+    # 参数相同的策略只计算一次信号
+    indicators = SharedIndicators(data['收盘'])
+    signal_rows = {}
+    for spec in request.strategies:
+        key = (spec.strategy_id, tuple(sorted(spec.params.items())))
+        if key in signal_rows:
+            continue
+        try:
+            signals = compute_signals(data, spec.strategy_id, indicators=indicators, **spec.params)
+        except (TypeError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"策略参数无效: {e}")
+        signal_rows[key] = signals['信号'].to_numpy()
+    keys = list(signal_rows)
+    # 每个请求策略在批量回测结果中的行号
+    rows = [keys.index((spec.strategy_id, tuple(sorted(spec.params.items())))) for spec in request.strategies]
 
-        return response
+    periods_per_year = bars_per_year(request.period)
+    initial_capital = 100000
+    results, equity, benchmark = run_backtest_batch(
+        data, np.vstack([signal_rows[key] for key in keys]),
+        initial_capital=initial_capital, transaction_cost=0.001, slippage=0.0005,
+        periods_per_year=periods_per_year
+    )
+    extra = calculate_metrics(equity, periods_per_year)
+    relative = None
+    if request.benchmark:
+        relative = benchmark_metrics(equity, data.index, request.benchmark, periods_per_year)
 
+    items = []
+    for spec, row in zip(request.strategies, rows):
+        metrics_row = results[row].to_dict()
+        metrics_row.update({key: float(extra[key][row]) for key in COMPARE_EXTRA_METRICS})
+        item = {"strategy_id": spec.strategy_id, "params": spec.params, "label": _compare_label(spec),
+                "metrics": metrics_row}
+        if relative is not None:
+            item["benchmark_metrics"] = {key: float(values[row]) for key, values in relative.items()}
+        items.append(item)
+
+    # 叠加的净值曲线：所有策略共用同一组降采样点
+    labels = [item["label"] for item in items]
+    nav = equity[rows] / initial_capital
+    benchmark_nav = 1 + benchmark
+    max_points = request.chart_width or CHART_WIDTH_PX
+    indices = multi_series_indices(nav, max_points)
+    return {
+        "strategies": items,
+        "curves": {
+            "dates": [timestamp.isoformat() for timestamp in data.index[indices]],
+            "benchmark": np.nan_to_num(benchmark_nav[indices], nan=1.0).tolist(),
+            "series": nav[:, indices].tolist(),
+        },
+        "charts": {
+            "equity_curve": generate_comparison_chart(data.index, nav, labels, benchmark_nav, max_points=max_points),
+        },
+    }
+
+# 多策略对比
+@app.post("/api/compare")
+def run_compare(request: CompareRequest):
+    # 先验证参数再计算缓存键（缓存键需要复权因子版本）
+    _validate_compare_request(request)
+    try:
+        cache_key = (request.model_dump_json(), _factor_version(request))
+        content = shared_cache.get_or_compute(
+            'compare_json', cache_key,
+            lambda: serializers.dumps_json(_compare_response(request)),
+            ttl=cache_ttl(request.end_date)
+        )
+        return serializers.json_response(content)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class BacktestSeriesRequest(BacktestRequest):
+    columns: Optional[List[str]] = None
+    # 降采样目标点数（通常为图表像素宽度），None表示返回全分辨率数据
+    max_points: Optional[int] = None
+    downsample_method: str = "lttb"
+    # 缩放查询的日期窗口，格式YYYYMMDD，窗口内按max_points降采样
+    window_start: Optional[str] = None
+    window_end: Optional[str] = None
+
+def _intraday_series_frames(request):
+    """
+    分钟线的/api/backtest/series数据：逐块回测并截取缩放窗口，不降采样时逐块输出
+
+    返回:
+    可迭代对象, 按时间顺序的紧凑回测数据分块（第一个分块已算好，参数错误在开始输出前报出）
+    """
+    _validate_request(request)
+    frames = (slice_window(engine.compact_data(), request.window_start, request.window_end)
+              for engine in _iter_intraday_backtest(request))
+    try:
+        if request.max_points is not None:
+            # 逐块降采样，只在内存中保留约max_points的数倍行
+            sampler = StreamingDownsampler(request.max_points, method=request.downsample_method)
+            for frame in frames:
+                sampler.add(frame)
+            result = sampler.result()
+            frames = iter([result] if result is not None else [])
+        first = next(frames, None)
+        if first is not None:
+            serializers.select_columns(first, request.columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"执行回测失败: {e}")
+        raise HTTPException(status_code=500, detail=f"执行回测失败: {e}")
+    if first is None:
+        raise HTTPException(status_code=500, detail="获取股票数据失败: 没有分钟线数据")
+    return itertools.chain([first], frames)
+
+# 以Arrow IPC格式输出完整回测数据
+@app.post("/api/backtest/series")
+def run_backtest_series(request: BacktestSeriesRequest, accept_encoding: Optional[str] = Header(None)):
+    if serializers.pa is None:
+        raise HTTPException(status_code=501, detail="服务器未安装pyarrow，无法输出Arrow格式数据")
+
+    if request.max_points is not None and request.max_points < 3:
+        raise HTTPException(status_code=400, detail="max_points不能小于3")
+
+    if request.period in INTRADAY_PERIODS:
+        frames = _intraday_series_frames(request)
+    else:
+        # Arrow输出包含每根K线的信号和指标列，需要完整回测
+        backtest_engine = _execute_backtest(request, resume=False)
+        backtest_data = backtest_engine.compact_data()
+        try:
+            serializers.select_columns(backtest_data, request.columns)
+            # 先截取缩放窗口，再在窗口内降采样（选点基于总资金，保留回撤低点和交易点）
+            backtest_data = slice_window(backtest_data, request.window_start, request.window_end)
+            backtest_data = downsample_backtest_data(backtest_data, request.max_points,
+                                                     method=request.downsample_method)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        frames = [backtest_data]
+
+    compression = serializers.negotiate_compression(accept_encoding)
+    headers = {"Vary": "Accept-Encoding"}
+    if compression == "gzip":
+        headers["Content-Encoding"] = "gzip"
+    elif compression == "zstd":
+        headers["X-Arrow-Compression"] = "zstd"
+
+    return StreamingResponse(
+        serializers.iter_arrow_ipc_frames(frames, columns=request.columns, compression=compression),
+        media_type=serializers.ARROW_STREAM_MEDIA_TYPE,
+        headers=headers
+    )
+
+class StreamRequest(BacktestRequest):
+    # 'backtest'：单次回测，逐块推送净值曲线；'sweep'：参数扫描，推送排行榜
+    type: str = "backtest"
+    # 参数扫描的参数网格，如 {"rsi_period": [7, 14, 21], "oversold": [20, 30]}
+    grid: Optional[Dict[str, List[Union[int, float]]]] = None
+
+# 以WebSocket推送长时间任务的进度和部分结果
+@app.websocket("/api/ws/backtest")
+async def backtest_stream(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        message = await websocket.receive_json()
+        try:
+            request = StreamRequest(**message)
+            _validate_request(request)
+            if request.type == "sweep" and not request.grid:
+                raise ValueError("参数扫描需要提供grid")
+            if request.type not in ("backtest", "sweep"):
+                raise ValueError(f"不支持的任务类型: {request.type}")
+        except HTTPException as e:
+            await websocket.send_json({"type": "error", "detail": e.detail})
+            await websocket.close()
+            return
+        except (ValidationError, ValueError) as e:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            await websocket.close()
+            return
+
+        if request.type == "sweep":
+            job = lambda channel: streaming.run_sweep_stream(request, request.grid, channel)
+        else:
+            job = lambda channel: streaming.run_backtest_stream(request, channel)
+        if await streaming.serve(websocket, job):
+            await websocket.close()
+    except WebSocketDisconnect:
+        print("WebSocket客户端已断开连接")
+
+class ProfileArmRequest(BaseModel):
+    runs: int = 1  # 接下来分析的回测次数，0表示取消
+    interval: float = profiling.DEFAULT_INTERVAL  # 采样间隔（秒）
+
+def _require_profile_token(token):
+    """性能分析管理接口的访问校验：功能未启用时接口不存在（404），令牌错误时返回403"""
+    if not profiling.enabled():
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiling.check_token(token):
+        raise HTTPException(status_code=403, detail="性能分析令牌无效")
+
+# 布置接下来N次回测进行性能分析（只作用于处理该请求的工作进程）
+@app.post("/api/admin/profile")
+def arm_profiling(request: ProfileArmRequest, x_profile_token: Optional[str] = Header(None)):
+    _require_profile_token(x_profile_token)
+    if not 0 <= request.runs <= profiling.MAX_ARMED_RUNS:
+        raise HTTPException(status_code=400, detail=f"runs必须在0到{profiling.MAX_ARMED_RUNS}之间")
+    if not 0.001 <= request.interval <= 1:
+        raise HTTPException(status_code=400, detail="interval必须在0.001到1秒之间")
+    return {"armed_runs": profiling.arm(request.runs, request.interval), "pid": os.getpid()}
+
+# 已保存的性能分析结果列表
+@app.get("/api/admin/profiles")
+def get_profiles(x_profile_token: Optional[str] = Header(None)):
+    _require_profile_token(x_profile_token)
+    return {"armed_runs": profiling.armed_runs(), "profiles": profiling.list_profiles()}
+
+# 下载性能分析结果（热点函数、内存分配位置）
+@app.get("/api/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, x_profile_token: Optional[str] = Header(None)):
+    _require_profile_token(x_profile_token)
+    try:
+        return profiling.load_profile(profile_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="性能分析结果不存在")
+
+# 下载折叠调用栈（flamegraph.pl / speedscope格式）
+@app.get("/api/admin/profiles/{profile_id}/collapsed")
+def get_profile_collapsed(profile_id: str, x_profile_token: Optional[str] = Header(None)):
+    _require_profile_token(x_profile_token)
+    try:
+        collapsed = profiling.load_collapsed(profile_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="性能分析结果不存在")
+    return PlainTextResponse(collapsed, headers={
+        "Content-Disposition": f'attachment; filename="{profile_id}{profiling.COLLAPSED_SUFFIX}"'
+    })
+
 # 健康检查
 @app.get("/api/health")
 def health_check():
-    return {"status": "ok"}
+    return {"status": "ok", "startup": startup_timings}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8081)
+    # 工作进程数，可通过环境变量QUANT_WORKERS设置；多个工作进程通过共享缓存复用数据和结果
+    workers = int(os.environ.get("QUANT_WORKERS", "1"))
+    if workers > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=8081, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8081)
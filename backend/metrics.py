@@ -0,0 +1,315 @@
+import numpy as np
+
+
+# 每年交易日数量（与BacktestEngine保持一致）
+TRADING_DAYS = 252
+
+# 单个分块允许占用的临时内存上限（字节），默认64MB
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+
+
+def _as_2d(values):
+    """将一维/二维输入统一为 (曲线数 × K线数) 的float64二维数组"""
+    array = np.asarray(values, dtype=np.float64)
+    if array.ndim == 1:
+        array = array[np.newaxis, :]
+    if array.ndim != 2:
+        raise ValueError(f"输入数组必须是一维或二维，当前维度: {array.ndim}")
+    return array
+
+
+def _iter_chunks(n_curves, n_bars, memory_budget=DEFAULT_MEMORY_BUDGET, copies=6):
+    """
+    按内存预算切分曲线，生成每个分块的切片
+
+    参数:
+    n_curves: int, 曲线数量
+    n_bars: int, 每条曲线的K线数量
+    memory_budget: int, 单个分块允许占用的临时内存（字节）
+    copies: int, 计算过程中同时存在的临时数组个数估计
+    """
+    row_bytes = max(1, n_bars * 8 * copies)
+    chunk_size = max(1, int(memory_budget // row_bytes))
+    for start in range(0, n_curves, chunk_size):
+        yield slice(start, min(start + chunk_size, n_curves))
+
+
+def equity_to_returns(equity):
+    """
+    由净值（或总资金）曲线计算逐K线收益率
+
+    参数:
+    equity: array-like, (曲线数 × K线数) 的净值矩阵
+
+    返回:
+    numpy.ndarray, (曲线数 × (K线数-1)) 的收益率矩阵
+    """
+    equity = _as_2d(equity)
+    return equity[:, 1:] / equity[:, :-1] - 1
+
+
+def total_return(equity):
+    """累计收益率"""
+    equity = _as_2d(equity)
+    return equity[:, -1] / equity[:, 0] - 1
+
+
+def annualized_return(equity, periods_per_year=TRADING_DAYS):
+    """
+    年化收益率，与BacktestEngine一致按K线总数折算：(1 + 累计收益率) ** (年K线数 / K线数) - 1
+    """
+    equity = _as_2d(equity)
+    n_bars = equity.shape[1]
+    if n_bars == 0:
+        return np.zeros(equity.shape[0])
+    return (1 + total_return(equity)) ** (periods_per_year / n_bars) - 1
+
+
+def annualized_volatility(returns, periods_per_year=TRADING_DAYS):
+    """年化波动率（样本标准差，ddof=1，与pandas一致）"""
+    returns = _as_2d(returns)
+    if returns.shape[1] < 2:
+        return np.full(returns.shape[0], np.nan)
+    return returns.std(axis=1, ddof=1) * np.sqrt(periods_per_year)
+
+
+def downside_volatility(returns, periods_per_year=TRADING_DAYS):
+    """年化下行波动率（以0为目标收益率）"""
+    returns = _as_2d(returns)
+    downside = np.minimum(returns, 0.0)
+    return np.sqrt((downside ** 2).mean(axis=1)) * np.sqrt(periods_per_year)
+
+
+def _safe_divide(numerator, denominator):
+    """分母为0或非有限值时返回0，与BacktestEngine的夏普比率处理方式一致"""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    result = np.zeros(np.broadcast(numerator, denominator).shape)
+    valid = np.isfinite(denominator) & (denominator > 0)
+    np.divide(numerator, denominator, out=result, where=valid)
+    return result
+
+
+def drawdown(equity):
+    """
+    回撤序列：净值相对历史最高点的跌幅
+
+    等价于BacktestEngine中 (累计收益率 - 历史最高累计收益率) / (1 + 历史最高累计收益率)
+    """
+    equity = _as_2d(equity)
+    running_max = np.maximum.accumulate(equity, axis=1)
+    return equity / running_max - 1
+
+
+def max_drawdown(equity):
+    """最大回撤（负数）"""
+    return drawdown(equity).min(axis=1)
+
+
+def max_drawdown_duration(equity):
+    """
+    最长回撤持续期：从前一个净值高点到重新创出新高之间的最大K线数
+    """
+    equity = _as_2d(equity)
+    n_bars = equity.shape[1]
+    running_max = np.maximum.accumulate(equity, axis=1)
+    bar_index = np.arange(n_bars)
+    # 每根K线对应的最近一次净值高点位置
+    last_peak = np.where(equity >= running_max, bar_index, 0)
+    last_peak = np.maximum.accumulate(last_peak, axis=1)
+    return (bar_index - last_peak).max(axis=1)
+
+
+def _calculate_chunk_metrics(equity, periods_per_year):
+    """计算单个分块的全部指标"""
+    returns = equity_to_returns(equity)
+    ann_return = annualized_return(equity, periods_per_year)
+    ann_volatility = annualized_volatility(returns, periods_per_year)
+    ann_downside = downside_volatility(returns, periods_per_year)
+    mdd = max_drawdown(equity)
+    return {
+        '累计收益率': total_return(equity),
+        '年化收益率': ann_return,
+        '年化波动率': ann_volatility,
+        '夏普比率': _safe_divide(ann_return, ann_volatility),
+        '索提诺比率': _safe_divide(ann_return, ann_downside),
+        '卡玛比率': _safe_divide(ann_return, -mdd),
+        '最大回撤': mdd,
+        '最大回撤持续期': max_drawdown_duration(equity),
+    }
+
+
+def calculate_metrics(equity, periods_per_year=TRADING_DAYS, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    批量计算多条净值曲线的绩效指标
+
+    夏普、索提诺、卡玛比率沿用BacktestEngine的定义（年化收益率 / 对应风险指标，无风险利率为0）。
+
+    参数:
+    equity: array-like, (曲线数 × K线数) 的净值或总资金矩阵，一维输入视为单条曲线
+    periods_per_year: int, 每年K线数量，默认252
+    memory_budget: int, 单个分块允许占用的临时内存（字节）
+
+    返回:
+    dict, 指标名 -> numpy.ndarray（长度为曲线数）
+    """
+    equity = _as_2d(equity)
+    n_curves, n_bars = equity.shape
+    results = None
+    for chunk in _iter_chunks(n_curves, n_bars, memory_budget):
+        chunk_metrics = _calculate_chunk_metrics(equity[chunk], periods_per_year)
+        if results is None:
+            results = {key: np.empty(n_curves, dtype=value.dtype) for key, value in chunk_metrics.items()}
+        for key, value in chunk_metrics.items():
+            results[key][chunk] = value
+    return results if results is not None else {}
+
+
+def relative_metrics(equity, benchmark, periods_per_year=TRADING_DAYS, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    批量计算相对基准指数的指标
+
+    对所有曲线的收益率同时做一次关于基准收益率的线性回归：中心化后的收益率矩阵与基准收益率做一次矩阵乘法，
+    即得到每条曲线与基准的协方差。
+
+    参数:
+    equity: array-like, (曲线数 × K线数) 的净值或总资金矩阵，一维输入视为单条曲线
+    benchmark: array-like, 长度为K线数的基准价格（或净值），与equity使用相同的交易日历，
+        缺失值所在的K线不参与计算
+    periods_per_year: int, 每年K线数量，默认252
+    memory_budget: int, 单个分块允许占用的临时内存（字节）
+
+    返回:
+    dict, 指标名 -> numpy.ndarray（长度为曲线数）
+        - '阿尔法': 年化超额收益（回归截距 × 年K线数）
+        - '贝塔': 收益率对基准收益率的回归系数
+        - '相关系数': 与基准收益率的相关系数
+        - '跟踪误差': 主动收益率（策略 - 基准）的年化标准差
+        - '信息比率': 年化主动收益率 / 跟踪误差
+    """
+    equity = _as_2d(equity)
+    benchmark = np.asarray(benchmark, dtype=np.float64)
+    n_curves, n_bars = equity.shape
+    if benchmark.shape != (n_bars,):
+        raise ValueError(f"基准长度({benchmark.shape[0]})与曲线K线数({n_bars})不一致")
+
+    keys = ('阿尔法', '贝塔', '相关系数', '跟踪误差', '信息比率')
+    results = {key: np.full(n_curves, np.nan) for key in keys}
+    bench_returns = benchmark[1:] / benchmark[:-1] - 1
+    valid = np.isfinite(bench_returns)
+    bench_returns = bench_returns[valid]
+    n = len(bench_returns)
+    if n < 2:
+        return results
+
+    bench_mean = bench_returns.mean()
+    bench_centered = bench_returns - bench_mean
+    bench_var = bench_centered @ bench_centered / (n - 1)
+
+    for chunk in _iter_chunks(n_curves, n_bars, memory_budget, copies=3):
+        returns = equity_to_returns(equity[chunk])[:, valid]
+        mean = returns.mean(axis=1)
+        centered = returns - mean[:, np.newaxis]
+        covariance = centered @ bench_centered / (n - 1)
+        variance = np.einsum('ij,ij->i', centered, centered) / (n - 1)
+
+        beta = _safe_divide(covariance, bench_var)
+        results['贝塔'][chunk] = beta
+        results['阿尔法'][chunk] = (mean - beta * bench_mean) * periods_per_year
+        results['相关系数'][chunk] = _safe_divide(covariance, np.sqrt(variance * bench_var))
+        # 主动收益率方差 = Var(策略) + Var(基准) - 2Cov(策略, 基准)
+        tracking_error = np.sqrt(np.maximum(variance + bench_var - 2 * covariance, 0.0) * periods_per_year)
+        results['跟踪误差'][chunk] = tracking_error
+        results['信息比率'][chunk] = _safe_divide((mean - bench_mean) * periods_per_year, tracking_error)
+    return results
+
+
+def _rolling_sum(values, window):
+    """沿K线方向的滚动求和，前window-1个位置为NaN"""
+    n_bars = values.shape[1]
+    result = np.full(values.shape, np.nan)
+    if window > n_bars:
+        return result
+    cumsum = np.cumsum(values, axis=1)
+    result[:, window - 1] = cumsum[:, window - 1]
+    result[:, window:] = cumsum[:, window:] - cumsum[:, :-window]
+    return result
+
+
+def _rolling_mean_std(returns, window):
+    """滚动均值与样本标准差（先去中心化再累加，减小累积求和的精度损失）"""
+    center = returns.mean(axis=1, keepdims=True)
+    centered = returns - center
+    sums = _rolling_sum(centered, window)
+    sq_sums = _rolling_sum(centered ** 2, window)
+    mean = sums / window
+    variance = (sq_sums - window * mean ** 2) / (window - 1)
+    std = np.sqrt(np.maximum(variance, 0.0))
+    return mean + center, std
+
+
+def _apply_rolling(func, values, memory_budget):
+    """按分块对二维数组执行滚动计算"""
+    values = _as_2d(values)
+    n_curves, n_bars = values.shape
+    result = np.empty(values.shape)
+    for chunk in _iter_chunks(n_curves, n_bars, memory_budget):
+        result[chunk] = func(values[chunk])
+    return result
+
+
+def rolling_return(equity, window, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """滚动区间收益率：当前净值相对window根K线之前的涨跌幅"""
+    def _func(chunk):
+        result = np.full(chunk.shape, np.nan)
+        result[:, window:] = chunk[:, window:] / chunk[:, :-window] - 1
+        return result
+    return _apply_rolling(_func, equity, memory_budget)
+
+
+def rolling_volatility(returns, window, periods_per_year=TRADING_DAYS, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """滚动年化波动率"""
+    def _func(chunk):
+        _, std = _rolling_mean_std(chunk, window)
+        return std * np.sqrt(periods_per_year)
+    return _apply_rolling(_func, returns, memory_budget)
+
+
+def rolling_sharpe(returns, window, periods_per_year=TRADING_DAYS, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    滚动夏普比率：滚动均值 / 滚动标准差 * sqrt(年K线数)
+
+    与charts.generate_sharpe_ratio_chart原有的pandas rolling计算口径一致。
+    """
+    def _func(chunk):
+        mean, std = _rolling_mean_std(chunk, window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return mean / std * np.sqrt(periods_per_year)
+    return _apply_rolling(_func, returns, memory_budget)
+
+
+def rolling_sortino(returns, window, periods_per_year=TRADING_DAYS, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """滚动索提诺比率：滚动均值 / 滚动下行偏差 * sqrt(年K线数)"""
+    def _func(chunk):
+        mean = _rolling_sum(chunk, window) / window
+        downside = np.sqrt(_rolling_sum(np.minimum(chunk, 0.0) ** 2, window) / window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return mean / downside * np.sqrt(periods_per_year)
+    return _apply_rolling(_func, returns, memory_budget)
+
+
+def rolling_max_drawdown(equity, window, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    滚动最大回撤：每根K线向前window根K线（含当前）窗口内的最大回撤
+    """
+    def _func(chunk):
+        n_bars = chunk.shape[1]
+        result = np.full(chunk.shape, np.nan)
+        if window > n_bars:
+            return result
+        windows = np.lib.stride_tricks.sliding_window_view(chunk, window, axis=1)
+        running_max = np.maximum.accumulate(windows, axis=2)
+        result[:, window - 1:] = (windows / running_max - 1).min(axis=2)
+        return result
+    # 滑动窗口会产生 window 倍的临时数组
+    return _apply_rolling(_func, equity, max(1, memory_budget // max(1, window)))
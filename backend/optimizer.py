@@ -0,0 +1,324 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest import BacktestEngine
+from strategies import STRATEGY_FUNCTIONS, compute_signals, warmup_bars
+
+
+# 各策略的参数搜索空间：参数名 -> (下限, 上限, 类型)
+PARAM_SPACES = {
+    1: {
+        'short_window': (5, 100, int),
+        'long_window': (20, 250, int),
+    },
+    2: {
+        'rsi_period': (5, 30, int),
+        'overbought': (60, 90, int),
+        'oversold': (10, 40, int),
+    },
+    3: {
+        'window': (10, 60, int),
+        'num_std': (1.0, 3.0, float),
+    },
+}
+
+# 参数之间的约束
+PARAM_CONSTRAINTS = {
+    1: lambda p: p['short_window'] < p['long_window'],
+    2: lambda p: p['oversold'] < p['overbought'],
+    3: lambda p: True,
+}
+
+# 评估失败或无法计算时的得分
+_WORST_SCORE = float('-inf')
+
+
+# ---- 工作进程 ----
+# 价格数据在进程池初始化时传给每个工作进程一次，之后每个任务只传参数和K线数
+
+_worker_data = None
+_worker_strategy_id = None
+_worker_engine_kwargs = None
+
+
+def _init_worker(data, strategy_id, engine_kwargs):
+    global _worker_data, _worker_strategy_id, _worker_engine_kwargs
+    # 工作进程内所有参数组合共用同一份价格数据（与data.py一致开启copy-on-write）
+    pd.set_option("mode.copy_on_write", True)
+    _worker_data = data
+    _worker_strategy_id = strategy_id
+    _worker_engine_kwargs = engine_kwargs
+
+
+def _evaluate(params, n_bars):
+    """在前n_bars根K线上回测一组参数，返回绩效指标"""
+    data = _worker_data.iloc[:n_bars]
+    engine = BacktestEngine(data, signals=compute_signals(data, _worker_strategy_id, **params), **_worker_engine_kwargs)
+    return engine.run(trade_logic='full')
+
+
+def _evaluate_task(task):
+    params, n_bars = task
+    try:
+        return _evaluate(params, n_bars)
+    except Exception as e:
+        print(f"参数评估失败 {params}: {e}")
+        return None
+
+
+class _Evaluator:
+    """并行评估器：n_workers为1时在当前进程内执行"""
+
+    def __init__(self, data, strategy_id, engine_kwargs, n_workers):
+        self.n_workers = n_workers
+        self.evaluations = 0
+        self.evaluated_bars = 0
+        if n_workers > 1:
+            self._pool = ProcessPoolExecutor(
+                max_workers=n_workers, initializer=_init_worker,
+                initargs=(data, strategy_id, engine_kwargs)
+            )
+        else:
+            self._pool = None
+            _init_worker(data, strategy_id, engine_kwargs)
+
+    def map(self, params_list, n_bars):
+        """评估一批参数，返回与输入顺序一致的绩效指标列表"""
+        tasks = [(params, n_bars) for params in params_list]
+        self.evaluations += len(tasks)
+        self.evaluated_bars += len(tasks) * n_bars
+        if self._pool is None:
+            return [_evaluate_task(task) for task in tasks]
+        return list(self._pool.map(_evaluate_task, tasks))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+def _score(results, objective):
+    """将绩效指标转换为得分（越大越好），无效结果得分最低"""
+    if results is None:
+        return _WORST_SCORE
+    value = results.get(objective)
+    if value is None or not np.isfinite(value):
+        return _WORST_SCORE
+    return float(value)
+
+
+def _sample(space, constraint, rng, max_tries=1000):
+    """在搜索空间中均匀采样一组满足约束的参数"""
+    for _ in range(max_tries):
+        params = {}
+        for name, (low, high, kind) in space.items():
+            if kind is int:
+                params[name] = int(rng.integers(low, high + 1))
+            else:
+                params[name] = round(float(rng.uniform(low, high)), 2)
+        if constraint(params):
+            return params
+    raise ValueError("无法采样到满足约束的参数")
+
+
+def _grid_size(space):
+    """搜索空间对应的完整网格大小（浮点参数按0.1步长计算），用于报告节省的评估次数"""
+    size = 1
+    for low, high, kind in space.values():
+        size *= (high - low + 1) if kind is int else int(round((high - low) / 0.1)) + 1
+    return size
+
+
+# ---- 搜索算法 ----
+
+def _random_search(evaluator, space, constraint, rng, n_trials, n_bars, objective, batch_size):
+    trials = []
+    while len(trials) < n_trials:
+        batch = [_sample(space, constraint, rng) for _ in range(min(batch_size, n_trials - len(trials)))]
+        for params, results in zip(batch, evaluator.map(batch, n_bars)):
+            trials.append({'params': params, 'score': _score(results, objective), 'bars': n_bars,
+                           'metrics': results})
+    return trials
+
+
+def _successive_halving(evaluator, space, constraint, rng, n_trials, n_bars, min_bars, objective, eta=3):
+    """
+    逐轮淘汰：所有候选先在最短的历史前缀上评估，每轮保留得分前1/eta的候选，
+    并把历史长度放大eta倍，直到在完整历史上评估剩余候选
+    """
+    candidates = [_sample(space, constraint, rng) for _ in range(n_trials)]
+    n_rounds = max(1, int(math.floor(math.log(max(n_bars / min_bars, 1), eta))) + 1)
+    trials = []
+    for round_index in range(n_rounds):
+        # 最后一轮使用完整历史
+        budget = n_bars if round_index == n_rounds - 1 else int(n_bars / eta ** (n_rounds - 1 - round_index))
+        results_list = evaluator.map(candidates, budget)
+        scores = [_score(results, objective) for results in results_list]
+        ranked = sorted(zip(scores, range(len(candidates))), reverse=True)
+        for score, index in ranked:
+            trials.append({'params': candidates[index], 'score': score, 'bars': budget,
+                           'metrics': results_list[index]})
+        if budget == n_bars:
+            break
+        keep = max(1, len(candidates) // eta)
+        candidates = [candidates[index] for _, index in ranked[:keep]]
+    return trials
+
+
+def _parzen_log_density(values, observations, low, high):
+    """一维Parzen窗（高斯核）对数密度，带宽按Scott规则并限制在取值范围的1/20以上"""
+    observations = np.asarray(observations, dtype=np.float64)
+    span = high - low
+    bandwidth = max(observations.std() * len(observations) ** (-1 / 5), span / 20) if len(observations) > 1 else span / 5
+    z = (np.asarray(values, dtype=np.float64)[:, np.newaxis] - observations[np.newaxis, :]) / bandwidth
+    # 叠加一个均匀先验，避免密度为0
+    density = np.exp(-0.5 * z ** 2).mean(axis=1) / (bandwidth * np.sqrt(2 * np.pi))
+    return np.log(density * len(observations) / (len(observations) + 1) + 1 / span / (len(observations) + 1))
+
+
+def _tpe_propose(space, constraint, rng, trials, n_proposals, gamma=0.25, n_candidates=64):
+    """
+    TPE（Tree-structured Parzen Estimator）风格的采样：
+    按得分把已有结果分为好/差两组，为每个参数分别估计两组的密度l(x)与g(x)，
+    从好组附近生成候选并选出l(x)/g(x)最大的参数
+    """
+    scored = [t for t in trials if np.isfinite(t['score'])]
+    scored.sort(key=lambda t: t['score'], reverse=True)
+    n_good = max(1, int(math.ceil(gamma * len(scored))))
+    good, bad = scored[:n_good], scored[n_good:] or scored[-1:]
+
+    proposals = []
+    for _ in range(n_proposals):
+        candidates = []
+        for _ in range(n_candidates):
+            base = good[int(rng.integers(len(good)))]['params']
+            params = {}
+            for name, (low, high, kind) in space.items():
+                value = rng.normal(base[name], (high - low) / 10)
+                value = min(max(value, low), high)
+                params[name] = int(round(value)) if kind is int else round(float(value), 2)
+            if constraint(params):
+                candidates.append(params)
+        if not candidates:
+            proposals.append(_sample(space, constraint, rng))
+            continue
+        log_ratio = np.zeros(len(candidates))
+        for name, (low, high, _) in space.items():
+            values = [c[name] for c in candidates]
+            log_ratio += _parzen_log_density(values, [t['params'][name] for t in good], low, high)
+            log_ratio -= _parzen_log_density(values, [t['params'][name] for t in bad], low, high)
+        proposals.append(candidates[int(np.argmax(log_ratio))])
+    return proposals
+
+
+def _tpe_search(evaluator, space, constraint, rng, n_trials, n_bars, min_bars, objective, batch_size,
+                n_startup=None):
+    """
+    TPE搜索，并对每个候选先在历史前缀上评估：前缀得分低于已有前缀得分中位数的候选直接淘汰，
+    不再在完整历史上评估
+    """
+    n_startup = n_startup or max(batch_size, n_trials // 4)
+    prefix_bars = min(n_bars, max(min_bars, n_bars // 3))
+    trials = []
+    prefix_scores = []
+    proposed = 0
+    while proposed < n_trials:
+        size = min(batch_size, n_trials - proposed)
+        full_trials = [t for t in trials if t['bars'] == n_bars]
+        if proposed < n_startup or len(full_trials) < 2:
+            batch = [_sample(space, constraint, rng) for _ in range(size)]
+        else:
+            batch = _tpe_propose(space, constraint, rng, full_trials, size)
+        proposed += len(batch)
+
+        if prefix_bars < n_bars:
+            results_list = evaluator.map(batch, prefix_bars)
+            scores = [_score(results, objective) for results in results_list]
+            threshold = np.median(prefix_scores) if len(prefix_scores) >= batch_size else _WORST_SCORE
+            prefix_scores.extend(s for s in scores if np.isfinite(s))
+            survivors = []
+            for params, score, results in zip(batch, scores, results_list):
+                if score >= threshold and np.isfinite(score):
+                    survivors.append(params)
+                else:
+                    trials.append({'params': params, 'score': score, 'bars': prefix_bars, 'pruned': True,
+                                   'metrics': results})
+            batch = survivors
+
+        if batch:
+            for params, results in zip(batch, evaluator.map(batch, n_bars)):
+                trials.append({'params': params, 'score': _score(results, objective), 'bars': n_bars,
+                               'metrics': results})
+    return trials
+
+
+def optimize(data, strategy_id, method='tpe', n_trials=60, objective='夏普比率', n_workers=None,
+             seed=None, min_bars=None, **engine_kwargs):
+    """
+    策略参数优化
+
+    参数:
+    data: pandas DataFrame, 价格数据（只读）
+    strategy_id: int, 策略ID，见strategies.STRATEGY_FUNCTIONS
+    method: str, 搜索方法
+        - 'random': 随机搜索
+        - 'halving': 逐轮淘汰（successive halving），先在短历史上评估再逐步放大
+        - 'tpe': TPE风格的贝叶斯采样，并在历史前缀上提前淘汰
+    n_trials: int, 候选参数组数
+    objective: str, 优化目标（绩效指标名，越大越好），默认'夏普比率'
+    n_workers: int 或 None, 并行进程数，默认CPU核数；为1时在当前进程内执行
+    seed: int 或 None, 随机种子
+    min_bars: int 或 None, 提前淘汰时使用的最短历史长度，默认为最大指标窗口的2倍
+    engine_kwargs: BacktestEngine的其他参数（initial_capital、periods_per_year等）
+
+    返回:
+    dict: 包含best_params、best_score、metrics（最优参数在完整历史上的绩效指标）、
+        evaluations（评估次数）、evaluated_bars（累计回测K线数）、grid_size（完整网格大小）和trials
+        （每个候选的参数、得分、评估K线数和绩效指标）
+    """
+    if strategy_id not in PARAM_SPACES:
+        raise ValueError(f"无效的策略ID: {strategy_id}")
+    space = PARAM_SPACES[strategy_id]
+    constraint = PARAM_CONSTRAINTS[strategy_id]
+    rng = np.random.default_rng(seed)
+    n_bars = len(data)
+    if min_bars is None:
+        # 最长指标窗口的2倍，保证短历史上也能产生足够的信号
+        strategy = STRATEGY_FUNCTIONS[strategy_id]
+        widest = {name: high for name, (low, high, kind) in space.items() if kind is int}
+        min_bars = 2 * warmup_bars(strategy, **widest)
+    min_bars = min(min_bars, n_bars)
+
+    n_workers = n_workers or os.cpu_count() or 1
+    evaluator = _Evaluator(data, strategy_id, engine_kwargs, n_workers)
+    try:
+        if method == 'random':
+            trials = _random_search(evaluator, space, constraint, rng, n_trials, n_bars, objective, n_workers)
+        elif method == 'halving':
+            trials = _successive_halving(evaluator, space, constraint, rng, n_trials, n_bars, min_bars, objective)
+        elif method == 'tpe':
+            trials = _tpe_search(evaluator, space, constraint, rng, n_trials, n_bars, min_bars, objective,
+                                 batch_size=max(2, n_workers))
+        else:
+            raise ValueError(f"不支持的优化方法: {method}")
+
+        full_trials = [t for t in trials if t['bars'] == n_bars and np.isfinite(t['score'])]
+        if not full_trials:
+            raise ValueError("没有在完整历史上得到有效结果的参数")
+        # 每个候选的绩效指标随评估结果保存，最优参数不需要重新回测
+        best = max(full_trials, key=lambda t: t['score'])
+    finally:
+        evaluator.close()
+
+    return {
+        'best_params': best['params'],
+        'best_score': best['score'],
+        'metrics': best['metrics'],
+        'evaluations': evaluator.evaluations,
+        'evaluated_bars': evaluator.evaluated_bars,
+        'grid_size': _grid_size(space),
+        'trials': trials,
+    }
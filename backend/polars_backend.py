@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+
+try:
+    import polars as pl
+except ImportError:  # polars为可选依赖，未安装时使用pandas实现
+    pl = None
+
+
+# 多股票数据中用于分组的列名
+SYMBOL_COL = '股票代码'
+
+
+def available():
+    """是否已安装polars"""
+    return pl is not None
+
+
+def _require_polars():
+    if pl is None:
+        raise RuntimeError("未安装polars，请先执行 pip install polars 或使用pandas后端")
+
+
+def _lazy_frame(data, columns, by):
+    """将pandas价格数据转换为LazyFrame（只取需要的列，保留行号用于还原索引）"""
+    columns = list(columns) + ([by] if by else [])
+    frame = pl.from_pandas(data[columns].reset_index(drop=True))
+    return frame.lazy().with_row_index('_行号')
+
+
+def _over(expr, by):
+    """按股票分组计算窗口表达式，单只股票时不分组"""
+    return expr.over(by) if by else expr
+
+
+def _signal_expr(buy, sell):
+    """
+    信号列：与pandas实现一致，同时满足时卖出信号覆盖买入信号；
+    条件为null（指标尚未形成）时视为不满足
+    """
+    return (
+        pl.when(sell.fill_null(False)).then(-1)
+        .when(buy.fill_null(False)).then(1)
+        .otherwise(0)
+        .cast(pl.Int64)
+        .alias('信号')
+    )
+
+
+def _ma_crossover_exprs(by, short_window=50, long_window=200):
+    close = pl.col('收盘')
+    diff = pl.col('短期MA') - pl.col('长期MA')
+    return [
+        [
+            _over(close.rolling_mean(short_window), by).alias('短期MA'),
+            _over(close.rolling_mean(long_window), by).alias('长期MA'),
+        ],
+        [diff.alias('MA差值')],
+        [_over(pl.col('MA差值').shift(1), by).alias('MA差值_前一天')],
+        [_signal_expr(
+            (pl.col('MA差值_前一天') < 0) & (pl.col('MA差值') > 0),
+            (pl.col('MA差值_前一天') > 0) & (pl.col('MA差值') < 0),
+        )],
+    ]
+
+
+def _rsi_exprs(by, rsi_period=14, overbought=70, oversold=30):
+    delta = _over(pl.col('收盘').diff(), by)
+    gain = pl.when(delta > 0).then(delta).otherwise(0.0)
+    loss = pl.when(delta < 0).then(-delta).otherwise(0.0)
+    rs = _over(gain.rolling_mean(rsi_period), by) / _over(loss.rolling_mean(rsi_period), by)
+    # 0/0得到的NaN转为null：polars中NaN参与比较时大于任何数，与pandas不同
+    rsi = (100 - 100 / (1 + rs)).fill_nan(None)
+    return [
+        [rsi.alias('RSI')],
+        [_over(pl.col('RSI').shift(1), by).alias('RSI_前一天')],
+        [_signal_expr(
+            (pl.col('RSI_前一天') < oversold) & (pl.col('RSI') > pl.col('RSI_前一天')),
+            (pl.col('RSI_前一天') > overbought) & (pl.col('RSI') < pl.col('RSI_前一天')),
+        )],
+    ]
+
+
+def _bollinger_exprs(by, window=20, num_std=2):
+    close = pl.col('收盘')
+    previous_close = _over(close.shift(1), by)
+    return [
+        [
+            _over(close.rolling_mean(window), by).alias('中轨'),
+            _over(close.rolling_std(window), by).alias('标准差'),
+        ],
+        [
+            (pl.col('中轨') + num_std * pl.col('标准差')).alias('上轨'),
+            (pl.col('中轨') - num_std * pl.col('标准差')).alias('下轨'),
+        ],
+        [_signal_expr(
+            (previous_close < _over(pl.col('下轨').shift(1), by)) & (close > pl.col('下轨')),
+            (previous_close > _over(pl.col('上轨').shift(1), by)) & (close < pl.col('上轨')),
+        )],
+    ]
+
+
+# 策略ID -> (表达式构造函数, 输出列)，输出列与strategies.py中的pandas实现一致
+_STRATEGY_EXPRS = {
+    1: (_ma_crossover_exprs, ['短期MA', '长期MA', 'MA差值', 'MA差值_前一天', '信号']),
+    2: (_rsi_exprs, ['RSI', 'RSI_前一天', '信号']),
+    3: (_bollinger_exprs, ['中轨', '标准差', '上轨', '下轨', '信号']),
+}
+
+
+def strategy_signals(data, strategy_id, by=None, **params):
+    """
+    用polars惰性查询生成交易信号，结果与strategies.py中的pandas实现一致
+
+    多只股票的数据可以放在同一个DataFrame中（by指定股票代码列），
+    所有股票的滚动窗口在一次分组查询中由polars多线程计算。
+
+    参数:
+    data: pandas DataFrame, 价格数据（只读），多只股票时需按股票分组、组内按时间升序排列
+    strategy_id: int, 策略ID
+    by: str 或 None, 分组列名（如'股票代码'），None表示单只股票
+    params: 策略参数，未传入的使用与pandas实现相同的默认值
+
+    返回:
+    pandas DataFrame, 与data共用索引，包含指标列和'信号'列
+    """
+    _require_polars()
+    if strategy_id not in _STRATEGY_EXPRS:
+        raise ValueError(f"无效的策略ID: {strategy_id}")
+    build, columns = _STRATEGY_EXPRS[strategy_id]
+
+    query = _lazy_frame(data, ['收盘'], by)
+    for stage in build(by, **params):
+        query = query.with_columns(stage)
+    result = query.sort('_行号').select(columns).collect()
+
+    signals = result.to_pandas()
+    signals.index = data.index
+    return signals
+
+
+def backtest_results(output, initial_capital=100000, periods_per_year=252, by=None):
+    """
+    由回测输出计算绩效指标（polars分组聚合），与BacktestEngine.run返回的结果一致
+
+    参数:
+    output: pandas DataFrame, 回测数据，需包含'总资金'和'信号'列（有'离场'列时风险离场视为卖出信号），
+        多个回测结果放在一起时用by列区分，组内按时间升序排列
+    initial_capital: float, 初始资金
+    periods_per_year: int, 每年K线数量
+    by: str 或 None, 分组列名
+
+    返回:
+    dict（单个回测）或 pandas DataFrame（按by分组，每行一个回测）
+    """
+    _require_polars()
+    columns = ['总资金', '信号'] + (['离场'] if '离场' in output.columns else [])
+    query = _lazy_frame(output, columns, by)
+
+    signal = pl.col('信号')
+    if '离场' in output.columns:
+        signal = pl.when(pl.col('离场') != 0).then(-1).otherwise(signal)
+    returns = _over(pl.col('总资金').pct_change(), by)
+    nav = _over((1 + pl.col('收益率')).cum_prod(), by)
+    query = query.with_columns(returns.alias('收益率'), signal.alias('交易信号')).with_columns(
+        (nav - 1).alias('累计收益率')
+    ).with_columns(
+        _over(pl.col('累计收益率').cum_max(), by).alias('历史最高')
+    )
+
+    r = pl.col('收益率')
+    trade = r.filter(pl.col('交易信号') != 0)
+    aggregations = [
+        pl.len().alias('K线数'),
+        pl.col('总资金').last().alias('最终资金'),
+        ((1 + r).product() - 1).alias('累计收益率'),
+        ((pl.col('累计收益率') - pl.col('历史最高')) / (1 + pl.col('历史最高'))).min().alias('最大回撤'),
+        r.count().alias('收益率数'),
+        r.std(ddof=1).alias('收益率标准差'),
+        (pl.col('交易信号') != 0).sum().alias('信号数'),
+        (trade > 0).sum().alias('盈利数'),
+        trade.filter(trade > 0).sum().alias('盈利和'),
+        trade.filter(trade < 0).sum().alias('亏损和'),
+    ]
+    grouped = query.group_by(by, maintain_order=True) if by else query.group_by(pl.lit(0).alias('_组'))
+    stats = grouped.agg(aggregations).collect().to_pandas()
+
+    n_bars = stats['K线数'].to_numpy(dtype=np.float64)
+    cumulative = np.where(n_bars > 1, stats['累计收益率'].to_numpy(dtype=np.float64), np.nan)
+    annualized = np.where(n_bars > 0, (1 + cumulative) ** (periods_per_year / np.maximum(n_bars, 1)) - 1, 0)
+    volatility = stats['收益率标准差'].to_numpy(dtype=np.float64) * np.sqrt(periods_per_year)
+    sharpe = np.zeros(len(stats))
+    valid = (stats['收益率数'].to_numpy() > 1) & (volatility > 0)
+    sharpe[valid] = annualized[valid] / volatility[valid]
+    signal_bars = stats['信号数'].to_numpy(dtype=np.float64)
+    loss_sum = np.abs(stats['亏损和'].to_numpy(dtype=np.float64))
+    profit_sum = stats['盈利和'].to_numpy(dtype=np.float64)
+    has_signals = signal_bars > 0
+
+    results = pd.DataFrame({
+        '初始资金': initial_capital,
+        '最终资金': stats['最终资金'].to_numpy(dtype=np.float64),
+        '累计收益率': cumulative,
+        '年化收益率': annualized,
+        '最大回撤': stats['最大回撤'].to_numpy(dtype=np.float64),
+        '夏普比率': sharpe,
+        '胜率': np.where(has_signals, stats['盈利数'] / np.where(has_signals, signal_bars, 1), 0),
+        '盈亏比': np.where(has_signals & (loss_sum > 0), profit_sum / np.where(loss_sum > 0, loss_sum, 1), 0),
+    })
+    if by:
+        results.index = pd.Index(stats[by], name=by)
+        return results
+    return results.iloc[0].to_dict()
@@ -0,0 +1,447 @@
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from data import get_stock_data
+from resample import timeframe_rule
+
+
+# 支持的权重方法：最小方差、风险平价、等权
+WEIGHT_METHODS = ('min_variance', 'risk_parity', 'equal_weight')
+
+# 默认回看的调仓周期数（月度调仓时约为一年）
+DEFAULT_LOOKBACK = 12
+
+# 回看窗口内有效收益率占比低于该值的股票（停牌过久、上市不久）不参与本次配置
+DEFAULT_MIN_COVERAGE = 0.9
+
+# 批量求解时每批的调仓日数量，限制 (调仓日数 × 股票数 × 股票数) 协方差数组的内存占用
+DEFAULT_BATCH_SIZE = 32
+
+
+def load_returns(symbols, start_date=None, end_date=None, adjust='qfq'):
+    """
+    读取多只股票的日线收益率（本地已存储的K线直接读取，缺失的区间才从数据源拉取）
+
+    参数:
+    symbols: list[str], 股票代码
+    start_date: str, 开始日期，格式YYYYMMDD
+    end_date: str, 结束日期，格式YYYYMMDD
+    adjust: str, 复权方式，默认前复权
+
+    返回:
+    pandas DataFrame, 以日期为索引、股票代码为列的收益率，停牌或未上市的日期为NaN
+    """
+    closes = {}
+    for symbol in symbols:
+        try:
+            data = get_stock_data(symbol=symbol, start_date=start_date, end_date=end_date, adjust=adjust)
+        except Exception as e:
+            print(f"获取股票数据失败 {symbol}: {e}")
+            continue
+        closes[symbol] = data['收盘']
+    if not closes:
+        return pd.DataFrame()
+    prices = pd.DataFrame(closes).sort_index()
+    return prices.pct_change(fill_method=None)
+
+
+def rebalance_positions(index, freq='monthly'):
+    """
+    每个调仓周期最后一根K线的位置（在该K线收盘后按截至当天的数据计算新权重）
+
+    参数:
+    index: pandas.DatetimeIndex, 交易日历
+    freq: str, 'weekly' 或 'monthly'
+
+    返回:
+    numpy.ndarray, 升序排列的位置
+    """
+    positions = pd.Series(np.arange(len(index)), index=index).resample(timeframe_rule(freq)).last()
+    return positions.dropna().to_numpy(dtype=np.int64)
+
+
+def ledoit_wolf(centered_gram, n_samples, fourth_moment):
+    """
+    Ledoit-Wolf收缩协方差（收缩目标为 平均方差 × 单位矩阵，与sklearn.covariance.ledoit_wolf一致）
+
+    参数:
+    centered_gram: numpy.ndarray, (N × N) 去均值收益率的 X'X
+    n_samples: int, 样本数（K线数）
+    fourth_moment: float, 去均值收益率各行平方和的平方之和 Σ_t ||x_t||^4
+
+    返回:
+    tuple: (numpy.ndarray 收缩后的协方差, float 收缩强度)
+    """
+    n_features = centered_gram.shape[0]
+    emp_cov = centered_gram / n_samples
+    mu = np.trace(emp_cov) / n_features
+    emp_cov_sq = (emp_cov ** 2).sum()
+    delta = (emp_cov_sq - 2 * mu * np.trace(emp_cov) + n_features * mu ** 2) / n_features
+    beta = (fourth_moment / n_samples - emp_cov_sq) / (n_features * n_samples)
+    beta = min(beta, delta)
+    shrinkage = 0.0 if beta == 0 else beta / delta
+    shrunk = (1 - shrinkage) * emp_cov
+    shrunk.flat[::n_features + 1] += shrinkage * mu
+    return shrunk, shrinkage
+
+
+class RollingCovariance:
+    """
+    调仓日的滚动收缩协方差
+
+    收益率按调仓日切分为若干周期，每个周期的 X'X（N × N）、收益率之和与有效样本数只计算一次并缓存，
+    每个调仓日的回看窗口由最近lookback个周期的缓存相加得到：月度调仓时每次只需新计算一个月的矩阵，
+    而不是对整年的收益率重新做一次 N × N 的矩阵乘法。缺失的收益率按0处理，
+    有效样本占比低于min_coverage的股票不参与该调仓日的配置。
+
+    参数:
+    returns: numpy.ndarray, (K线数 × 股票数) 的收益率，缺失为NaN
+    positions: array-like, 调仓日位置（见rebalance_positions）
+    lookback: int, 回看的调仓周期数
+    min_coverage: float, 最低有效样本占比
+    """
+
+    def __init__(self, returns, positions, lookback=DEFAULT_LOOKBACK, min_coverage=DEFAULT_MIN_COVERAGE):
+        self.returns = np.asarray(returns, dtype=np.float64)
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.lookback = lookback
+        self.min_coverage = min_coverage
+        self._valid = ~np.isnan(self.returns)
+        self._filled = np.where(self._valid, self.returns, 0.0)
+        # 最近lookback个周期的 (起始行, 结束行, X'X, 收益率之和, 有效样本数)
+        self._blocks = deque(maxlen=lookback)
+        self._next_row = 0
+
+    def _add_block(self, end):
+        """缓存一个新周期（行 [_next_row, end)）的统计量"""
+        start = self._next_row
+        block = self._filled[start:end]
+        self._blocks.append((start, end, block.T @ block, block.sum(axis=0), self._valid[start:end].sum(axis=0)))
+        self._next_row = end
+
+    def __iter__(self):
+        """
+        按调仓日依次产出协方差
+
+        产出:
+        tuple: (调仓日位置, numpy.ndarray 参与配置的股票掩码, numpy.ndarray (N × N) 收缩协方差，
+            未参与配置的股票所在行列为0)
+        """
+        n_assets = self.returns.shape[1]
+        for position in self.positions:
+            self._add_block(position + 1)
+            start = self._blocks[0][0]
+            n_samples = position + 1 - start
+            counts = sum(block[4] for block in self._blocks)
+            mask = counts >= self.min_coverage * n_samples
+            covariance = np.zeros((n_assets, n_assets))
+            if n_samples < 2 or not mask.any():
+                yield position, np.zeros(n_assets, dtype=bool), covariance
+                continue
+
+            gram = sum(block[2] for block in self._blocks)[np.ix_(mask, mask)]
+            mean = sum(block[3] for block in self._blocks)[mask] / n_samples
+            # 去均值：Σ(x - m)(x - m)' = X'X - n m m'
+            centered_gram = gram - n_samples * np.outer(mean, mean)
+            # 收缩强度需要的四阶量只有 O(K线数 × 股票数) 的计算量，直接由窗口内的收益率计算
+            centered = self._filled[start:position + 1][:, mask] - mean
+            fourth_moment = ((centered ** 2).sum(axis=1) ** 2).sum()
+            shrunk, _ = ledoit_wolf(centered_gram, n_samples, fourth_moment)
+
+            # 方差为0（整个窗口停牌）的股票不参与配置
+            valid = np.diag(shrunk) > 0
+            mask[mask] = valid
+            covariance[np.ix_(mask, mask)] = shrunk[np.ix_(valid, valid)]
+            yield position, mask, covariance
+
+
+class _FreeSetInverse:
+    """
+    自由集上协方差子矩阵的逆，加入或移出一个变量时做秩1更新（分块求逆），每次O(k²)，不重新分解
+
+    参数:
+    sigma: numpy.ndarray, (N × N) 正定协方差
+    """
+
+    def __init__(self, sigma):
+        self.sigma = sigma
+        self.index = []
+        self.inverse = np.zeros((0, 0))
+
+    def reset(self, index):
+        """以index为自由集直接求逆（热启动时一次分解代替逐个加入）"""
+        self.index = list(index)
+        self.inverse = np.linalg.inv(self.sigma[np.ix_(self.index, self.index)])
+
+    def add(self, j):
+        column = self.sigma[self.index, j]
+        b = self.inverse @ column
+        d = self.sigma[j, j] - column @ b
+        k = len(self.index)
+        inverse = np.empty((k + 1, k + 1))
+        inverse[:k, :k] = self.inverse + np.outer(b, b) / d
+        inverse[:k, k] = inverse[k, :k] = -b / d
+        inverse[k, k] = 1.0 / d
+        self.inverse = inverse
+        self.index.append(j)
+
+    def remove(self, j):
+        p = self.index.index(j)
+        keep = np.r_[0:p, p + 1:len(self.index)]
+        column = self.inverse[keep, p]
+        self.inverse = self.inverse[np.ix_(keep, keep)] - np.outer(column, column) / self.inverse[p, p]
+        del self.index[p]
+
+    def solve_ones(self):
+        """自由集上 Σ_F z = 1 的解"""
+        return self.inverse.sum(axis=1)
+
+
+def _nonnegative_qp(sigma, tol=1e-12, max_iter=None, initial=None):
+    """
+    有效集法（Lawson-Hanson）求解 min ½v'Σv - 1'v，v ≥ 0
+
+    从空集（或initial给出的上一次调仓的持仓）开始，每次把梯度最违反最优性条件的变量加入自由集，
+    只在自由集上求解线性方程组。自由集子矩阵的逆随变量加入/移出做秩1更新，
+    每次迭代O(k²)（k为自由集大小）；相邻调仓日的持仓通常变化不大，从上次的持仓出发只需少量迭代。
+
+    返回:
+    tuple: (v, 自由集的更新次数)
+    """
+    n = len(sigma)
+    v = np.zeros(n)
+    free = np.zeros(n, dtype=bool)
+    inverse = _FreeSetInverse(sigma)
+    updates = 0
+    if initial is not None:
+        inverse.reset(np.flatnonzero(initial))
+        free[inverse.index] = True
+        # 逐个移出解最小的非正变量，直到自由集上的解全部为正，作为可行的起点
+        while inverse.index:
+            z = inverse.solve_ones()
+            if (z > tol).all():
+                v[inverse.index] = z
+                break
+            worst = inverse.index[int(np.argmin(z))]
+            inverse.remove(worst)
+            free[worst] = False
+            updates += 1
+    for _ in range(max_iter or 3 * n):
+        # 负梯度 1 - Σv 为正的变量增大可以继续降低目标函数
+        slack = 1 - sigma @ v
+        slack[free] = -np.inf
+        j = int(np.argmax(slack))
+        if slack[j] <= tol:
+            break
+        inverse.add(j)
+        free[j] = True
+        updates += 1
+        while True:
+            z = np.zeros(n)
+            z[inverse.index] = inverse.solve_ones()
+            negative = free & (z <= 0)
+            if not negative.any():
+                v = z
+                break
+            # 沿 v -> z 方向前进到第一个变量降为0，将其移出自由集
+            alpha = np.min(v[negative] / (v[negative] - z[negative]))
+            v = v + alpha * (z - v)
+            for k in np.flatnonzero(free & (v <= tol)):
+                inverse.remove(k)
+                free[k] = False
+                updates += 1
+            v[~free] = 0.0
+    return v, updates
+
+
+def min_variance_weights(covariances, masks, initial=None):
+    """
+    求解只做多的最小方差权重：min w'Σw，w ≥ 0，Σw = 1
+
+    由KKT条件，最优权重与 min ½v'Σv - 1'v（v ≥ 0）的解成比例：w = v / Σv，
+    后者用有效集法精确求解，每个调仓日从上一个调仓日的持仓出发。
+
+    参数:
+    covariances: numpy.ndarray, (调仓日数 × N × N) 协方差
+    masks: numpy.ndarray, (调仓日数 × N) 参与配置的股票
+    initial: numpy.ndarray 或 None, (N,) 第一个调仓日之前的持仓（如上一批的最后一行权重），用于热启动
+
+    返回:
+    numpy.ndarray, (调仓日数 × N) 权重，没有可配置股票的调仓日全部为0
+    """
+    covariances = np.asarray(covariances, dtype=np.float64)
+    masks = np.asarray(masks, dtype=bool)
+    weights = np.zeros(masks.shape)
+    held = np.zeros(masks.shape[1], dtype=bool) if initial is None else np.asarray(initial) > 0
+    for b, mask in enumerate(masks):
+        if not mask.any():
+            continue
+        index = np.flatnonzero(mask)
+        sigma = covariances[b][np.ix_(index, index)]
+        # 按平均方差缩放，使收敛判断与收益率的量纲无关
+        scale = np.trace(sigma) / len(index)
+        v, _ = _nonnegative_qp(sigma / scale, initial=held[index])
+        weights[b, index] = v / v.sum()
+        held = weights[b] > 0
+    return weights
+
+
+def risk_parity_weights(covariances, masks, max_iter=200, tol=1e-10):
+    """
+    批量求解风险平价权重：每只股票对组合方差的贡献 w_i(Σw)_i 相等
+
+    求解等价的凸问题 min ½y'Σy - Σ b_i log(y_i)（b_i为等额风险预算）后归一化，
+    按股票做循环坐标下降，每一步对所有调仓日同时更新（每个坐标有闭式解）。
+
+    参数:
+    covariances: numpy.ndarray, (调仓日数 × N × N) 协方差
+    masks: numpy.ndarray, (调仓日数 × N) 参与配置的股票
+    max_iter: int, 最大迭代轮数
+    tol: float, 相对变化小于该值时停止
+
+    返回:
+    numpy.ndarray, (调仓日数 × N) 权重
+    """
+    covariances = np.asarray(covariances, dtype=np.float64)
+    masks = np.asarray(masks, dtype=bool)
+    n_assets = masks.shape[1]
+    counts = masks.sum(axis=1, keepdims=True)
+    budgets = np.where(masks, 1.0 / np.maximum(counts, 1), 0.0)
+    variances = np.einsum('bii->bi', covariances)
+    safe_variances = np.where(masks, variances, 1.0)
+
+    y = np.where(masks, 1.0 / np.sqrt(safe_variances), 0.0) / np.sqrt(np.maximum(counts, 1))
+    sigma_y = np.einsum('bij,bj->bi', covariances, y)
+    for _ in range(max_iter):
+        previous = y.copy()
+        for i in range(n_assets):
+            others = sigma_y[:, i] - variances[:, i] * y[:, i]
+            updated = (-others + np.sqrt(others ** 2 + 4 * safe_variances[:, i] * budgets[:, i])) / (2 * safe_variances[:, i])
+            updated = np.where(masks[:, i], updated, 0.0)
+            sigma_y += covariances[:, :, i] * (updated - y[:, i])[:, np.newaxis]
+            y[:, i] = updated
+        scale = np.maximum(np.abs(y).max(axis=1), 1e-300)
+        if (np.abs(y - previous).max(axis=1) / scale).max() < tol:
+            break
+    totals = y.sum(axis=1, keepdims=True)
+    return np.divide(y, totals, out=np.zeros_like(y), where=totals > 0)
+
+
+def volatility_target(weights, covariances, target, periods_per_year=252, max_leverage=1.0):
+    """
+    按目标年化波动率缩放权重：预期波动率高于目标时降低仓位，其余资金持有现金
+
+    参数:
+    weights: numpy.ndarray, (调仓日数 × N) 权重（每行之和为1）
+    covariances: numpy.ndarray, (调仓日数 × N × N) 协方差（日度）
+    target: float, 目标年化波动率，如0.15
+    periods_per_year: int, 每年K线数量
+    max_leverage: float, 总仓位上限，默认1（不加杠杆）
+
+    返回:
+    numpy.ndarray, 缩放后的权重
+    """
+    variance = np.einsum('bi,bij,bj->b', weights, covariances, weights)
+    volatility = np.sqrt(np.maximum(variance, 0.0) * periods_per_year)
+    scale = np.full(len(weights), max_leverage)
+    np.minimum(scale, target / np.where(volatility > 0, volatility, np.inf), out=scale, where=volatility > 0)
+    return weights * scale[:, np.newaxis]
+
+
+def optimize_portfolio(returns, method='risk_parity', freq='monthly', lookback=DEFAULT_LOOKBACK, vol_target=None,
+                       periods_per_year=252, max_leverage=1.0, min_coverage=DEFAULT_MIN_COVERAGE,
+                       batch_size=DEFAULT_BATCH_SIZE):
+    """
+    计算每个调仓日的组合权重
+
+    参数:
+    returns: pandas DataFrame, 以日期为索引、股票代码为列的收益率（见load_returns）
+    method: str, 'min_variance'、'risk_parity' 或 'equal_weight'
+    freq: str, 调仓频率，'weekly' 或 'monthly'
+    lookback: int, 协方差回看的调仓周期数
+    vol_target: float 或 None, 目标年化波动率，None表示满仓
+    periods_per_year: int, 每年K线数量
+    max_leverage: float, 使用目标波动率时的总仓位上限
+    min_coverage: float, 回看窗口内最低有效样本占比
+    batch_size: int, 每批同时求解的调仓日数量
+
+    返回:
+    pandas DataFrame, 以调仓日为索引、股票代码为列的权重（收盘后生效，从下一根K线开始持有）
+    """
+    if method not in WEIGHT_METHODS:
+        raise ValueError(f"不支持的权重方法: {method}")
+    positions = rebalance_positions(returns.index, freq)
+    rolling = RollingCovariance(returns.to_numpy(dtype=np.float64), positions, lookback, min_coverage)
+
+    weights = []
+    batch = []
+
+    def solve(batch):
+        masks = np.array([mask for _, mask, _ in batch])
+        covariances = np.array([covariance for _, _, covariance in batch])
+        if method == 'min_variance':
+            # 从上一批最后一个调仓日的持仓热启动
+            result = min_variance_weights(covariances, masks, initial=weights[-1][-1] if weights else None)
+        elif method == 'risk_parity':
+            result = risk_parity_weights(covariances, masks)
+        else:
+            counts = masks.sum(axis=1, keepdims=True)
+            result = np.where(masks, 1.0 / np.maximum(counts, 1), 0.0)
+        if vol_target is not None:
+            result = volatility_target(result, covariances, vol_target, periods_per_year, max_leverage)
+        weights.append(result)
+
+    for item in rolling:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            solve(batch)
+            batch = []
+    if batch:
+        solve(batch)
+
+    values = np.vstack(weights) if weights else np.empty((0, returns.shape[1]))
+    return pd.DataFrame(values, index=returns.index[positions], columns=returns.columns)
+
+
+def portfolio_equity(returns, weights, initial_capital=100000, transaction_cost=0.001):
+    """
+    按调仓权重计算组合资金曲线
+
+    两次调仓之间持仓随价格漂移（不每日再平衡），调仓时按换手金额扣除交易成本；
+    第一个调仓日之前持有现金。
+
+    参数:
+    returns: pandas DataFrame, 收益率（见load_returns）
+    weights: pandas DataFrame, optimize_portfolio的结果
+    initial_capital: float, 初始资金
+    transaction_cost: float, 交易成本（按换手金额计）
+
+    返回:
+    pandas Series, 以日期为索引的总资金
+    """
+    filled = returns[weights.columns].fillna(0.0).to_numpy(dtype=np.float64)
+    positions = returns.index.get_indexer(weights.index)
+    target = weights.to_numpy(dtype=np.float64)
+    equity = np.full(len(returns), float(initial_capital))
+    holdings = np.zeros(len(weights.columns))
+    cash = float(initial_capital)
+
+    for k, position in enumerate(positions):
+        end = positions[k + 1] if k + 1 < len(positions) else len(returns) - 1
+        total = cash + holdings.sum()
+        # 调仓：按换手金额扣除交易成本
+        new_holdings = target[k] * total
+        cost = np.abs(new_holdings - holdings).sum() * transaction_cost
+        holdings = target[k] * (total - cost)
+        cash = total - cost - holdings.sum()
+        equity[position] = total - cost
+        if end <= position:
+            continue
+        # 持有到下一次调仓：各股票的市值随累计收益率变化
+        growth = np.cumprod(1 + filled[position + 1:end + 1], axis=0)
+        values = growth * holdings
+        equity[position + 1:end + 1] = values.sum(axis=1) + cash
+        holdings = values[-1]
+    return pd.Series(equity, index=returns.index, name='总资金')
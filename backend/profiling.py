@@ -0,0 +1,345 @@
+"""
+按需性能分析
+
+设置环境变量QUANT_PROFILE_TOKEN后启用：管理接口可以让接下来N次回测在采样CPU分析器和tracemalloc下执行，
+单个请求也可以携带X-Profile-Token请求头只分析这一次。分析结果（热点函数、可用于火焰图的折叠调用栈、
+内存分配最多的代码位置）保存在 data_cache/profiles/ 下（可通过QUANT_PROFILE_DIR修改），供下载。
+
+未启用或未布置分析时，回测请求只多一次整数比较，没有其他开销。
+采样器是一个后台线程，定期读取执行回测的线程当前的调用栈，不需要安装第三方分析工具。
+"""
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from store import DEFAULT_DATA_DIR
+
+
+# 访问令牌，未设置时性能分析功能关闭，管理接口不可用
+PROFILE_TOKEN = os.environ.get("QUANT_PROFILE_TOKEN") or None
+
+# 分析结果保存目录
+PROFILE_DIR = os.environ.get("QUANT_PROFILE_DIR", os.path.join(DEFAULT_DATA_DIR, "profiles"))
+
+# 默认采样间隔（秒）
+DEFAULT_INTERVAL = 0.005
+
+# 一次最多布置的分析次数
+MAX_ARMED_RUNS = 20
+
+# 最多保留的分析结果数，超过后删除最早的
+MAX_PROFILES = 50
+
+# 热点函数和内存分配位置各保留的条数
+TOP_N = 30
+
+# tracemalloc为每次分配记录的调用栈深度
+TRACEMALLOC_FRAMES = 1
+
+# 折叠调用栈文件的扩展名（每行 "根;...;叶 次数"，可直接交给flamegraph.pl或speedscope）
+COLLAPSED_SUFFIX = ".collapsed.txt"
+
+# 剩余待分析的回测次数；回测请求只读取这个整数
+_armed_runs = 0
+_armed_interval = DEFAULT_INTERVAL
+_arm_lock = threading.Lock()
+
+# tracemalloc是进程级的，同一时间只分析一个请求
+_run_lock = threading.Lock()
+
+
+def enabled():
+    """性能分析功能是否启用（设置了QUANT_PROFILE_TOKEN）"""
+    return PROFILE_TOKEN is not None
+
+
+def check_token(token):
+    """校验访问令牌（常数时间比较）"""
+    if not enabled() or not token:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), PROFILE_TOKEN.encode("utf-8"))
+
+
+def arm(runs, interval=DEFAULT_INTERVAL):
+    """
+    布置接下来runs次回测进行性能分析（只作用于接收到请求的工作进程）
+
+    参数:
+    runs: int, 分析次数，0表示取消
+    interval: float, 采样间隔（秒）
+
+    返回:
+    int, 剩余待分析次数
+    """
+    global _armed_runs, _armed_interval
+    with _arm_lock:
+        _armed_runs = max(0, min(int(runs), MAX_ARMED_RUNS))
+        _armed_interval = interval
+        return _armed_runs
+
+
+def armed_runs():
+    """剩余待分析的回测次数"""
+    return _armed_runs
+
+
+def take():
+    """
+    领取一次分析名额
+
+    返回:
+    float 或 None, 采样间隔；没有名额时返回None
+    """
+    global _armed_runs
+    if not _armed_runs:
+        return None
+    with _arm_lock:
+        if not _armed_runs:
+            return None
+        _armed_runs -= 1
+        return _armed_interval
+
+
+def _frame_name(code):
+    """调用栈中函数的显示名称：文件名:函数名"""
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    采样CPU分析器
+
+    后台线程每隔interval秒通过sys._current_frames()读取目标线程的调用栈并计数。
+    NumPy/pandas在C代码中的耗时计入调用它的Python函数。
+
+    参数:
+    thread_id: int, 被分析线程的标识，默认为创建分析器的线程
+    interval: float, 采样间隔（秒）
+    """
+
+    def __init__(self, thread_id=None, interval=DEFAULT_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._names = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="quant-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        names = self._names
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = _frame_name(code)
+                stack.append(name)
+                frame = frame.f_back
+            # 根在前、叶在后
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """折叠调用栈文本，按次数降序"""
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, n=TOP_N):
+        """
+        热点函数
+
+        返回:
+        list[dict]: function、self（位于栈顶的采样数）、total（出现在栈中的采样数）及其占比，按total降序
+        """
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            # 递归调用在同一采样中只计一次
+            for name in set(stack):
+                total[name] += count
+        samples = max(self.samples, 1)
+        return [
+            {
+                "function": name,
+                "self": own[name],
+                "total": count,
+                "self_percent": round(own[name] / samples * 100, 2),
+                "total_percent": round(count / samples * 100, 2),
+            }
+            for name, count in total.most_common(n)
+        ]
+
+
+def _top_allocations(snapshot, n=TOP_N):
+    """内存分配最多的代码位置（分析结束时仍未释放的内存）"""
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ])
+    allocations = []
+    for stat in snapshot.statistics("lineno")[:n]:
+        frame = stat.traceback[0]
+        allocations.append({
+            "location": f"{frame.filename}:{frame.lineno}",
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+        })
+    return allocations
+
+
+def _new_profile_id():
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def _profile_path(profile_id, suffix=".json"):
+    # 只接受自己生成的ID格式，防止路径穿越
+    if not profile_id or not all(c.isalnum() or c == "-" for c in profile_id):
+        raise KeyError(profile_id)
+    return os.path.join(PROFILE_DIR, profile_id + suffix)
+
+
+def _save(profile, collapsed):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(_profile_path(profile["id"], COLLAPSED_SUFFIX), "w", encoding="utf-8") as f:
+        f.write(collapsed)
+    # 先写临时文件再重命名，列表接口不会读到写了一半的文件
+    path = _profile_path(profile["id"])
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    for old in list_profiles()[MAX_PROFILES:]:
+        delete_profile(old["id"])
+
+
+@contextmanager
+def profile_run(label, request=None, interval=DEFAULT_INTERVAL):
+    """
+    在采样CPU分析器和tracemalloc下执行with块，结束后保存分析结果
+
+    已有请求正在被分析时直接执行，不做分析。
+
+    参数:
+    label: str, 分析对象（如接口路径）
+    request: dict 或 None, 请求参数，随结果保存
+    interval: float, 采样间隔（秒）
+
+    返回:
+    dict 或 None, with块结束后会填入分析结果的摘要（id、耗时等）；未分析时为None
+    """
+    if not _run_lock.acquire(blocking=False):
+        print("已有请求正在进行性能分析，本次请求不分析")
+        yield None
+        return
+    summary = {"id": _new_profile_id()}
+    profiler = SamplingProfiler(interval=interval)
+    error = None
+    # 进程已通过PYTHONTRACEMALLOC开启tracemalloc时沿用，只重置峰值
+    started_tracing = not tracemalloc.is_tracing()
+    try:
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        else:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            yield summary
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            profiler.stop()
+            wall_seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            profile = {
+                "id": summary["id"],
+                "label": label,
+                "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "request": request,
+                "error": error,
+                "wall_seconds": round(wall_seconds, 4),
+                "interval": interval,
+                "samples": profiler.samples,
+                "peak_memory_kb": round(peak / 1024, 1),
+                "top_functions": profiler.top_functions(),
+                "allocations": _top_allocations(snapshot),
+            }
+            summary.update({key: profile[key] for key in ("wall_seconds", "samples", "peak_memory_kb")})
+            try:
+                _save(profile, profiler.collapsed())
+                print(f"性能分析结果已保存: {summary['id']}（耗时 {wall_seconds:.2f} 秒，{profiler.samples} 个采样）")
+            except OSError as e:
+                print(f"保存性能分析结果失败: {e}")
+    finally:
+        _run_lock.release()
+
+
+def list_profiles():
+    """已保存的分析结果摘要，按时间倒序"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name), "r", encoding="utf-8") as f:
+                profile = json.load(f)
+        except (OSError, ValueError):
+            continue
+        profiles.append({key: profile.get(key) for key in
+                         ("id", "label", "created_at", "wall_seconds", "samples", "peak_memory_kb", "error")})
+    return profiles
+
+
+def load_profile(profile_id):
+    """读取分析结果（JSON），不存在时抛出KeyError"""
+    try:
+        with open(_profile_path(profile_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise KeyError(profile_id)
+
+
+def load_collapsed(profile_id):
+    """读取折叠调用栈文本，不存在时抛出KeyError"""
+    try:
+        with open(_profile_path(profile_id, COLLAPSED_SUFFIX), "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        raise KeyError(profile_id)
+
+
+def delete_profile(profile_id):
+    for suffix in (".json", COLLAPSED_SUFFIX):
+        try:
+            os.remove(_profile_path(profile_id, suffix))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,251 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from store import BarStore
+
+
+# pandas 2.2起月末频率写作'ME'，之前的版本为'M'
+MONTH_END = 'ME' if tuple(int(part) for part in pd.__version__.split('.')[:2]) >= (2, 2) else 'M'
+
+# 命名周期对应的pandas重采样规则
+TIMEFRAME_RULES = {
+    'weekly': 'W-FRI',
+    'monthly': MONTH_END,
+}
+
+# OHLCV聚合方式
+OHLCV_AGGREGATIONS = {
+    '开盘': 'first',
+    '最高': 'max',
+    '最低': 'min',
+    '收盘': 'last',
+    '成交量': 'sum',
+    '成交额': 'sum',
+}
+
+# 聚合K线中记录该周期第一根/最后一根基础K线时间的列，
+# 截止时间用于无未来函数地对齐到基础周期，起始时间用于增量更新
+FIRST_BAR_COL = '起始时间'
+LAST_BAR_COL = '截止时间'
+
+
+def timeframe_rule(timeframe):
+    """
+    将周期名转换为pandas重采样规则
+
+    参数:
+    timeframe: str, 'weekly'、'monthly' 或 N分钟（如'30min'）
+
+    返回:
+    str, pandas频率字符串
+    """
+    if timeframe in TIMEFRAME_RULES:
+        return TIMEFRAME_RULES[timeframe]
+    if timeframe.endswith('min') and timeframe[:-3].isdigit():
+        return timeframe
+    raise ValueError(f"不支持的聚合周期: {timeframe}")
+
+
+def resample_ohlcv(data, timeframe):
+    """
+    将基础K线聚合为更长周期的OHLCV
+
+    参数:
+    data: pandas DataFrame, 以时间为索引的基础K线，包含开盘/最高/最低/收盘/成交量/成交额中的若干列
+    timeframe: str, 目标周期，见timeframe_rule
+
+    返回:
+    pandas DataFrame, 以周期标签为索引，额外包含'起始时间'和'截止时间'列（该周期第一根和最后一根基础K线的时间）
+    """
+    rule = timeframe_rule(timeframe)
+    aggregations = {col: how for col, how in OHLCV_AGGREGATIONS.items() if col in data.columns}
+    # 分钟周期按K线结束时间标记（A股分钟线时间戳为该分钟结束时刻）
+    resample_kwargs = {'closed': 'right', 'label': 'right'} if rule.endswith('min') else {}
+    resampler = data.resample(rule, **resample_kwargs)
+    bars = resampler.agg(aggregations)
+    timestamps = pd.Series(data.index, index=data.index).resample(rule, **resample_kwargs)
+    bars[FIRST_BAR_COL] = timestamps.first()
+    bars[LAST_BAR_COL] = timestamps.last()
+    # 去掉没有基础K线的周期（节假日、午休）
+    return bars.dropna(subset=[LAST_BAR_COL])
+
+
+def resample_chunks(chunks, timeframe):
+    """
+    逐块聚合基础K线，结果与对拼接后的完整数据调用resample_ohlcv一致
+
+    跨越分块边界的周期（如跨月的一周）由前后两个分块的部分结果合并。
+
+    参数:
+    chunks: 可迭代对象, 按时间顺序产出基础K线DataFrame（如data.iter_intraday_data）
+    timeframe: str, 目标周期，见timeframe_rule
+
+    返回:
+    pandas DataFrame, 同resample_ohlcv
+    """
+    parts = []
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        bars = resample_ohlcv(chunk, timeframe)
+        if parts and len(bars) > 0 and bars.index[0] == parts[-1].index[-1]:
+            previous = parts[-1].iloc[-1]
+            current = bars.iloc[0].copy()
+            for col, how in OHLCV_AGGREGATIONS.items():
+                if col not in bars.columns:
+                    continue
+                if how == 'first':
+                    current[col] = previous[col]
+                elif how == 'max':
+                    current[col] = max(previous[col], current[col])
+                elif how == 'min':
+                    current[col] = min(previous[col], current[col])
+                elif how == 'sum':
+                    current[col] = previous[col] + current[col]
+            current[FIRST_BAR_COL] = previous[FIRST_BAR_COL]
+            parts[-1] = parts[-1].iloc[:-1]
+            bars = pd.concat([current.to_frame().T.astype(bars.dtypes), bars.iloc[1:]]).rename_axis(bars.index.name)
+        parts.append(bars)
+    if not parts:
+        return pd.DataFrame(columns=[*OHLCV_AGGREGATIONS, FIRST_BAR_COL, LAST_BAR_COL])
+    return pd.concat(parts)
+
+
+def align_to(bars, index, columns=None):
+    """
+    将聚合K线对齐到基础周期的时间索引
+
+    每根基础K线只能看到'截止时间'不晚于自身的聚合K线，即已经走完（或截至当前K线）的周期，
+    不会引入未来数据。
+
+    参数:
+    bars: pandas DataFrame, resample_ohlcv的结果
+    index: pandas.DatetimeIndex, 基础周期的时间索引
+    columns: list[str] 或 None, 需要对齐的列，None表示全部OHLCV列
+
+    返回:
+    pandas DataFrame, 以index为索引
+    """
+    columns = columns or [col for col in bars.columns if col not in (FIRST_BAR_COL, LAST_BAR_COL)]
+    source = bars.set_index(LAST_BAR_COL)[columns]
+    positions = source.index.searchsorted(index, side='right') - 1
+    aligned = source.iloc[np.maximum(positions, 0)].set_axis(index)
+    aligned[positions < 0] = np.nan
+    return aligned
+
+
+class TimeframeCache:
+    """
+    多周期聚合K线缓存
+
+    每个股票、复权方式的每个目标周期只完整聚合一次，结果保存在BarStore中基础K线旁边，
+    同时在进程内保留一份。基础K线新增后只重新聚合最后一个（可能未走完的）周期及之后的数据。
+    缓存始终覆盖一段连续的时间范围：请求的基础K线与缓存范围不相连时全量重建。
+
+    参数:
+    store: BarStore 或 None, 聚合结果的持久化存储
+    """
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else BarStore()
+        self._frames = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _period_name(base_period, timeframe, adjust):
+        return f"{base_period}-{adjust}@{timeframe}"
+
+    def _load(self, key):
+        if key not in self._frames:
+            symbol, base_period, timeframe, adjust = key
+            period = self._period_name(base_period, timeframe, adjust)
+            self._frames[key] = self.store.read(symbol, period)
+            self._versions[key] = self.store.version(symbol, period)
+        return self._frames[key]
+
+    def _save(self, key, bars, rebuild_from=None, version=None):
+        symbol, base_period, timeframe, adjust = key
+        period = self._period_name(base_period, timeframe, adjust)
+        if rebuild_from is not None:
+            self.store.truncate(symbol, period, rebuild_from)
+        self.store.write(symbol, period, bars)
+        if version != self._versions.get(key):
+            self.store.set_version(symbol, period, version)
+            self._versions[key] = version
+
+    @staticmethod
+    def _is_stale(cached, base):
+        """
+        缓存与基础K线是否矛盾（例如前复权价格因分红整体变化），需要全量重建
+        """
+        if '收盘' not in base.columns or '收盘' not in cached.columns:
+            return False
+        # 聚合K线的收盘价等于其最后一根基础K线的收盘价。比较重叠部分的首尾两根：
+        # 前复权除权改变的是较早的K线，数据源修正或复权方式变化则可能只影响最近的K线
+        overlap = cached[cached[LAST_BAR_COL].isin(base.index)]
+        if len(overlap) == 0:
+            return False
+        ends = overlap.iloc[[0, -1]]
+        return not np.allclose(base.loc[ends[LAST_BAR_COL], '收盘'].to_numpy(dtype=np.float64),
+                               ends['收盘'].to_numpy(dtype=np.float64))
+
+    def get(self, symbol, base_period, timeframe, base, adjust='none', version=None):
+        """
+        获取聚合K线，必要时增量更新
+
+        参数:
+        symbol: str, 股票代码
+        base_period: str, 基础K线周期，如'daily'、'5'
+        timeframe: str, 目标周期，如'weekly'、'monthly'、'30min'
+        base: pandas DataFrame, 基础K线（通常来自data.get_stock_data）
+        adjust: str, base的复权方式，不同复权方式分别缓存
+        version: str 或 None, 复权因子版本（data.factor_version），与缓存的版本不同时全量重建
+
+        返回:
+        pandas DataFrame, 覆盖base时间范围的聚合K线
+        """
+        key = (symbol, base_period, timeframe, adjust)
+        with self._lock:
+            cached = self._load(key)
+            if len(base) == 0:
+                return cached.iloc[0:0]
+
+            if (len(cached) == 0 or version != self._versions.get(key)
+                    or base.index[0] < cached[FIRST_BAR_COL].iloc[0]
+                    or base.index[0] > cached[LAST_BAR_COL].iloc[-1]
+                    or self._is_stale(cached, base)):
+                # 首次聚合、复权因子更新、基础K线向前扩展、与缓存范围不相连（中间缺少的K线无法补齐）
+                # 或历史价格变化：全量重建
+                bars = resample_ohlcv(base, timeframe)
+                self._save(key, bars, rebuild_from=cached.index[0] if len(cached) > 0 else None, version=version)
+                cached = bars
+            elif base.index[-1] > cached[LAST_BAR_COL].iloc[-1]:
+                # 有新K线：最后一个缓存周期可能尚未走完，从它的第一根基础K线开始重新聚合
+                last_label = cached.index[-1]
+                tail = resample_ohlcv(base[base.index >= cached[FIRST_BAR_COL].iloc[-1]], timeframe)
+                if base.index[0] > cached[FIRST_BAR_COL].iloc[-1]:
+                    # 基础K线不完整覆盖最后一个缓存周期时保留原有结果
+                    tail = tail[tail.index > last_label]
+                self._save(key, tail, version=version)
+                cached = pd.concat([cached[~cached.index.isin(tail.index)], tail]).sort_index()
+            self._frames[key] = cached
+
+        return cached[(cached[LAST_BAR_COL] >= base.index[0]) & (cached[FIRST_BAR_COL] <= base.index[-1])]
+
+    def clear(self):
+        """清空进程内缓存（磁盘上的聚合结果保留）"""
+        with self._lock:
+            self._frames.clear()
+            self._versions.clear()
+
+
+# 默认的全局聚合缓存
+_timeframe_cache = TimeframeCache()
+
+
+def get_timeframe(symbol, base_period, timeframe, base, adjust='none', version=None):
+    """获取聚合K线（使用全局缓存），参数见TimeframeCache.get"""
+    return _timeframe_cache.get(symbol, base_period, timeframe, base, adjust, version)
@@ -0,0 +1,257 @@
+import json
+import math
+import zlib
+from collections.abc import Mapping
+
+import numpy as np
+from fastapi.responses import Response
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow为可选依赖，仅二进制序列化接口需要
+    pa = None
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，未安装时使用标准库json
+    orjson = None
+
+
+# Arrow IPC 流格式的媒体类型
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+JSON_MEDIA_TYPE = "application/json"
+
+# 每个Arrow记录批次包含的行数
+DEFAULT_BATCH_ROWS = 65536
+
+
+def parse_accept_encoding(header):
+    """
+    解析Accept-Encoding请求头
+
+    参数:
+    header: str, 例如 "zstd, gzip;q=0.8, *;q=0"
+
+    返回:
+    dict, 编码名 -> q值（q=0的编码已被排除）
+    """
+    encodings = {}
+    if not header:
+        return encodings
+    for item in header.split(","):
+        parts = [part.strip() for part in item.split(";")]
+        name = parts[0].lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            encodings[name] = q
+    return encodings
+
+
+def negotiate_compression(accept_encoding):
+    """
+    根据Accept-Encoding协商压缩方式
+
+    - zstd: 使用Arrow IPC内置的缓冲区压缩，响应体本身仍是合法的Arrow流
+    - gzip: 对整个Arrow流做gzip压缩，并通过Content-Encoding告知客户端
+
+    返回:
+    str 或 None, 'zstd'、'gzip' 或 None（不压缩）
+    """
+    encodings = parse_accept_encoding(accept_encoding)
+    candidates = []
+    if "zstd" in encodings and pa is not None and pa.Codec.is_available("zstd"):
+        candidates.append((encodings["zstd"], 1, "zstd"))
+    if "gzip" in encodings:
+        candidates.append((encodings["gzip"], 0, "gzip"))
+    if not candidates:
+        return None
+    # q值相同时优先zstd
+    return max(candidates)[2]
+
+
+def _json_default(value):
+    """JSON编码器不能直接处理的对象：回测结果（BacktestResults等映射）和NumPy数值"""
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"无法编码为JSON的类型: {type(value).__name__}")
+
+
+def _finite(value):
+    """标准库json的兜底路径：与orjson一致，将NaN和无穷大替换为None"""
+    if isinstance(value, (Mapping, np.ndarray, np.generic)):
+        value = _json_default(value)
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def dumps_json(content):
+    """
+    将响应内容编码为UTF-8 JSON字节串
+
+    优先使用orjson（直接编码NumPy数组和标量，比标准库快一个数量级）；NaN和无穷大编码为null。
+
+    参数:
+    content: 可JSON编码的对象，可包含BacktestResults和NumPy数值
+
+    返回:
+    bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_json_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(_finite(content), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(content):
+    """
+    返回JSON响应（绕过FastAPI默认的jsonable_encoder）
+
+    参数:
+    content: bytes（已编码的JSON）或可JSON编码的对象
+    """
+    body = content if isinstance(content, bytes) else dumps_json(content)
+    return Response(content=body, media_type=JSON_MEDIA_TYPE)
+
+
+def select_columns(frame, columns=None):
+    """
+    按列名选择输出列，索引（日期）始终保留
+
+    参数:
+    frame: pandas DataFrame, 回测数据
+    columns: list[str] 或 None, 需要的列，None表示全部列
+
+    返回:
+    pandas DataFrame
+    """
+    if not columns:
+        return frame
+    missing = [col for col in columns if col not in frame.columns]
+    if missing:
+        raise ValueError(f"数据中不存在以下列: {missing}")
+    return frame[list(columns)]
+
+
+def iter_arrow_ipc(frame, columns=None, compression=None, batch_rows=DEFAULT_BATCH_ROWS):
+    """
+    以Arrow IPC流格式逐批次输出DataFrame
+
+    参数:
+    frame: pandas DataFrame, 回测数据（日期索引会作为一列输出）
+    columns: list[str] 或 None, 需要输出的列
+    compression: str 或 None, negotiate_compression 的返回值
+    batch_rows: int, 每个记录批次的行数
+
+    返回:
+    生成器, 逐段产出字节数据
+    """
+    return iter_arrow_ipc_frames([frame], columns=columns, compression=compression, batch_rows=batch_rows)
+
+
+def iter_arrow_ipc_frames(frames, columns=None, compression=None, batch_rows=DEFAULT_BATCH_ROWS):
+    """
+    将依次产出的多个DataFrame（列相同，如分块回测的各个分块）输出为同一个Arrow IPC流
+
+    每个DataFrame写完即可释放，内存占用只与单个DataFrame大小有关。
+
+    参数:
+    frames: 可迭代对象, 按顺序产出的DataFrame，schema取自第一个
+    columns/compression/batch_rows: 见iter_arrow_ipc
+
+    返回:
+    生成器, 逐段产出字节数据
+    """
+    if pa is None:
+        raise RuntimeError("未安装pyarrow，无法输出Arrow格式数据")
+
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        raise ValueError("没有需要输出的数据")
+    first = select_columns(first, columns)
+    schema = pa.Schema.from_pandas(first, preserve_index=True)
+
+    options = pa.ipc.IpcWriteOptions(compression="zstd" if compression == "zstd" else None)
+    gzip_compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compression == "gzip" else None
+
+    sink = _ChunkSink()
+
+    def _emit():
+        data = sink.pop()
+        if gzip_compressor is not None:
+            data = gzip_compressor.compress(data)
+        return data
+
+    with pa.ipc.new_stream(sink, schema, options=options) as writer:
+        # 流头部（schema消息）
+        yield _emit()
+        frame = first
+        while frame is not None:
+            table = pa.Table.from_pandas(frame, schema=schema, preserve_index=True)
+            for batch in table.to_batches(max_chunksize=batch_rows):
+                writer.write_batch(batch)
+                yield _emit()
+            next_frame = next(frames, None)
+            frame = select_columns(next_frame, columns) if next_frame is not None else None
+
+    # 流结束标记
+    tail = _emit()
+    if gzip_compressor is not None:
+        tail += gzip_compressor.flush()
+    yield tail
+
+
+class _ChunkSink:
+    """
+    只暂存最近写入字节的文件对象，
+    每个批次写完后立即取走，避免整个响应在内存中累积
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def pop(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def to_arrow_ipc(frame, columns=None, compression=None):
+    """将DataFrame完整序列化为Arrow IPC流字节"""
+    return b"".join(iter_arrow_ipc(frame, columns=columns, compression=compression))
+
+
+def read_arrow_ipc(data):
+    """将Arrow IPC流字节还原为DataFrame（用于测试和Python客户端）"""
+    if pa is None:
+        raise RuntimeError("未安装pyarrow，无法读取Arrow格式数据")
+    return pa.ipc.open_stream(data).read_all().to_pandas()
@@ -0,0 +1,205 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from store import DEFAULT_DATA_DIR
+
+
+# 共享缓存数据库路径，可通过环境变量QUANT_CACHE_PATH覆盖
+DEFAULT_CACHE_PATH = os.environ.get("QUANT_CACHE_PATH", os.path.join(DEFAULT_DATA_DIR, "shared_cache.sqlite3"))
+
+# 缓存条目数上限，超过后删除最早写入的条目
+DEFAULT_MAX_ENTRIES = 2000
+
+# 跨进程锁的租约时长（秒）：持有锁的进程异常退出后，租约到期即可被其他进程获取
+DEFAULT_LEASE_SECONDS = 120
+
+
+class SharedCache:
+    """
+    多个工作进程共享的缓存（SQLite WAL模式）
+
+    同一台机器上的所有uvicorn工作进程读写同一个数据库文件，不需要额外的网络服务。
+    WAL模式下读操作不会被写操作阻塞。值使用pickle序列化，可以直接保存DataFrame和回测结果。
+
+    get_or_compute在未命中时先获取以键命名的跨进程锁：多个进程同时请求同一份数据时，
+    只有一个进程访问上游数据源，其他进程等待后直接读取其写入的结果。
+
+    数据库不可用（如目录只读）时打印警告并退化为不缓存，不影响正常请求。
+
+    参数:
+    path: str, 数据库文件路径
+    max_entries: int, 缓存条目数上限
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self):
+        """当前线程的数据库连接（sqlite3连接不能跨线程共享）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # 自动提交模式：每条语句单独成为一个事务
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        with self._init_lock:
+            if not self._initialized:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+                    "created REAL NOT NULL, expires REAL, PRIMARY KEY (namespace, key))"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS entries_created ON entries (created)")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+                )
+                self._initialized = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _key(key):
+        return key if isinstance(key, str) else repr(key)
+
+    def get(self, namespace, key):
+        """
+        读取缓存
+
+        返回:
+        缓存的值，未命中或已过期时返回None
+        """
+        try:
+            row = self._connect().execute(
+                "SELECT value, expires FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, self._key(key))
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"读取共享缓存失败: {e}")
+            return None
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, namespace, key, value, ttl=None):
+        """
+        写入缓存
+
+        参数:
+        namespace: str, 命名空间（如'prices'、'signals'、'backtest'）
+        key: str 或 可repr的对象, 缓存键
+        value: 可pickle的对象
+        ttl: float 或 None, 有效期（秒），None表示不过期
+        """
+        now = time.time()
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, created, expires) VALUES (?, ?, ?, ?, ?)",
+                (namespace, self._key(key), blob, now, now + ttl if ttl is not None else None)
+            )
+            conn.execute(
+                "DELETE FROM entries WHERE rowid IN "
+                "(SELECT rowid FROM entries ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+        except (sqlite3.Error, pickle.PicklingError) as e:
+            print(f"写入共享缓存失败: {e}")
+
+    @contextmanager
+    def lock(self, name, timeout=60, lease=DEFAULT_LEASE_SECONDS):
+        """
+        跨进程互斥锁（基于租约，持有者异常退出后最多lease秒自动失效）
+
+        参数:
+        name: str, 锁名称
+        timeout: float, 等待获取锁的最长时间（秒），超时后不加锁继续执行
+        lease: float, 租约时长（秒）
+        """
+        owner = f"{os.getpid()}:{threading.get_ident()}:{uuid.uuid4().hex}"
+        acquired = False
+        deadline = time.time() + timeout
+        try:
+            conn = self._connect()
+            while True:
+                now = time.time()
+                conn.execute("DELETE FROM locks WHERE name = ? AND expires < ?", (name, now))
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO locks (name, owner, expires) VALUES (?, ?, ?)",
+                    (name, owner, now + lease)
+                )
+                if cursor.rowcount == 1:
+                    acquired = True
+                    break
+                if now > deadline:
+                    print(f"等待共享缓存锁超时: {name}")
+                    break
+                time.sleep(0.05)
+        except sqlite3.Error as e:
+            print(f"获取共享缓存锁失败: {e}")
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+                except sqlite3.Error as e:
+                    print(f"释放共享缓存锁失败: {e}")
+
+    def get_or_compute(self, namespace, key, compute, ttl=None):
+        """
+        读取缓存，未命中时在跨进程锁内计算并写入
+
+        参数:
+        compute: 无参数的可调用对象, 返回需要缓存的值（不能为None）
+        ttl: float 或 None, 有效期（秒）
+        """
+        value = self.get(namespace, key)
+        if value is not None:
+            return value
+        with self.lock(f"{namespace}:{self._key(key)}"):
+            # 等待锁期间其他进程可能已经写入
+            value = self.get(namespace, key)
+            if value is not None:
+                return value
+            value = compute()
+            self.set(namespace, key, value, ttl)
+            return value
+
+    def prune(self):
+        """删除已过期的缓存条目和锁"""
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("DELETE FROM entries WHERE expires IS NOT NULL AND expires < ?", (now,))
+            conn.execute("DELETE FROM locks WHERE expires < ?", (now,))
+        except sqlite3.Error as e:
+            print(f"清理共享缓存失败: {e}")
+
+    def clear(self, namespace=None):
+        """清空缓存（指定namespace时只清空该命名空间）"""
+        try:
+            conn = self._connect()
+            if namespace is None:
+                conn.execute("DELETE FROM entries")
+            else:
+                conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+        except sqlite3.Error as e:
+            print(f"清空共享缓存失败: {e}")
+
+
+# 默认的全局共享缓存
+shared_cache = SharedCache()
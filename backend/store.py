@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+
+import pandas as pd
+
+
+# 本地K线存储根目录，可通过环境变量QUANT_DATA_DIR覆盖
+DEFAULT_DATA_DIR = os.environ.get(
+    "QUANT_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cache")
+)
+
+
+class BarStore:
+    """
+    本地K线存储
+
+    按 周期/股票代码/分区 保存为Parquet文件：分钟线按月分区，日线及更长周期按年分区。
+    由基础K线聚合得到的其他周期以'基础周期-复权方式@目标周期'（如'daily-qfq@weekly'）作为周期名保存在同一目录下。
+    读取时可以按分区逐块迭代，处理多年分钟数据时内存占用只与单个分区大小有关。
+
+    参数:
+    root: str, 存储根目录
+    """
+
+    def __init__(self, root=DEFAULT_DATA_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _is_intraday(period):
+        """是否为分钟级周期（基础周期'1'/'5'等，或派生周期如'5@30min'）"""
+        timeframe = period.split("@")[-1]
+        return timeframe.isdigit() or timeframe.endswith("min")
+
+    @classmethod
+    def _partition_key(cls, timestamp, period):
+        """K线所属分区：分钟线按月，日线及更长周期按年"""
+        if not cls._is_intraday(period):
+            return f"{timestamp.year:04d}"
+        return f"{timestamp.year:04d}-{timestamp.month:02d}"
+
+    def _symbol_dir(self, symbol, period):
+        return os.path.join(self.root, period, symbol)
+
+    def _manifest_path(self, symbol, period):
+        return os.path.join(self._symbol_dir(symbol, period), "manifest.json")
+
+    def _partition_path(self, symbol, period, key):
+        return os.path.join(self._symbol_dir(symbol, period), f"{key}.parquet")
+
+    def coverage(self, symbol, period):
+        """
+        已从数据源拉取过的日期范围
+
+        返回:
+        tuple 或 None, (开始时间, 结束时间)，尚未拉取过时返回None
+        """
+        path = self._manifest_path(symbol, period)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return pd.Timestamp(manifest["start"]), pd.Timestamp(manifest["end"])
+
+    def _update_coverage(self, symbol, period, start, end):
+        current = self.coverage(symbol, period)
+        if current is not None:
+            start = min(start, current[0])
+            end = max(end, current[1])
+        path = self._manifest_path(symbol, period)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"start": start.isoformat(), "end": end.isoformat()}, f)
+        os.replace(tmp_path, path)
+
+    def version(self, symbol, period):
+        """数据版本标记（如派生周期所依据的复权因子版本），未设置时返回None"""
+        path = os.path.join(self._symbol_dir(symbol, period), "version.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["version"]
+
+    def set_version(self, symbol, period, version):
+        """记录数据版本标记，见version"""
+        with self._lock:
+            os.makedirs(self._symbol_dir(symbol, period), exist_ok=True)
+            path = os.path.join(self._symbol_dir(symbol, period), "version.json")
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": version}, f)
+            os.replace(tmp_path, path)
+
+    def partitions(self, symbol, period):
+        """已存储的分区键（升序）"""
+        directory = self._symbol_dir(symbol, period)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len(".parquet")] for name in os.listdir(directory) if name.endswith(".parquet"))
+
+    def write(self, symbol, period, frame, start=None, end=None):
+        """
+        写入K线，与已有分区按时间合并去重（新数据覆盖旧数据）
+
+        参数:
+        symbol: str, 股票代码
+        period: str, K线周期
+        frame: pandas DataFrame, 以时间为索引的K线数据
+        start/end: pandas.Timestamp 或 None, 本次拉取覆盖的范围（用于记录已拉取区间）
+        """
+        with self._lock:
+            os.makedirs(self._symbol_dir(symbol, period), exist_ok=True)
+            if len(frame) > 0:
+                keys = [self._partition_key(ts, period) for ts in frame.index]
+                for key, part in frame.groupby(keys, sort=True):
+                    path = self._partition_path(symbol, period, key)
+                    if os.path.exists(path):
+                        existing = pd.read_parquet(path)
+                        part = pd.concat([existing, part])
+                        part = part[~part.index.duplicated(keep="last")]
+                    part = part.sort_index()
+                    tmp_path = path + ".tmp"
+                    part.to_parquet(tmp_path)
+                    os.replace(tmp_path, path)
+            if start is None and len(frame) > 0:
+                start = frame.index.min()
+            if end is None and len(frame) > 0:
+                end = frame.index.max()
+            # 只写入数据、不记录拉取区间时（如区间全部尚未收盘），end会早于start
+            if start is not None and end is not None and pd.Timestamp(start) <= pd.Timestamp(end):
+                self._update_coverage(symbol, period, pd.Timestamp(start), pd.Timestamp(end))
+
+    def iter_chunks(self, symbol, period, start=None, end=None):
+        """
+        按分区逐块读取K线
+
+        参数:
+        start/end: pandas.Timestamp 或 None, 时间范围（闭区间）
+
+        返回:
+        生成器, 每次产出一个分区内落在范围中的DataFrame
+        """
+        start_key = self._partition_key(start, period) if start is not None else None
+        end_key = self._partition_key(end, period) if end is not None else None
+        for key in self.partitions(symbol, period):
+            if start_key is not None and key < start_key:
+                continue
+            if end_key is not None and key > end_key:
+                break
+            part = pd.read_parquet(self._partition_path(symbol, period, key))
+            part = part.loc[start:end]
+            if len(part) > 0:
+                yield part
+
+    def truncate(self, symbol, period, start):
+        """删除start（含）之后的K线，用于重建最后几个聚合周期"""
+        with self._lock:
+            start_key = self._partition_key(start, period)
+            for key in self.partitions(symbol, period):
+                if key < start_key:
+                    continue
+                path = self._partition_path(symbol, period, key)
+                part = pd.read_parquet(path)
+                part = part[part.index < start]
+                if len(part) > 0:
+                    tmp_path = path + ".tmp"
+                    part.to_parquet(tmp_path)
+                    os.replace(tmp_path, path)
+                else:
+                    os.remove(path)
+
+    def read(self, symbol, period, start=None, end=None):
+        """读取时间范围内的全部K线"""
+        chunks = list(self.iter_chunks(symbol, period, start, end))
+        if not chunks:
+            return pd.DataFrame()
+        return pd.concat(chunks)
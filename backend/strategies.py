@@ -1,99 +1,243 @@
+import os
+
 import pandas as pd
 import numpy as np
 
+from resample import align_to
+
+
+# 信号和批量绩效指标的计算后端：'pandas'（默认）或 'polars'（需要安装polars），可通过环境变量QUANT_BACKEND设置
+SIGNAL_BACKEND = os.environ.get("QUANT_BACKEND", "pandas")
+
+
+# 策略计算信号用到的中间列（前一根K线的指标值），不需要随回测结果输出
+INTERMEDIATE_COLUMNS = ('MA差值_前一天', 'RSI_前一天')
+
+
+# 所有策略函数都不会修改传入的价格数据，而是返回一个与其共用日期索引的信号/指标DataFrame，
+# 因此同一份缓存的价格数据可以被多个请求并发使用。
+
+
+class SharedIndicators:
+    """
+    同一份价格数据上多个策略共用的指标缓存
+
+    双均线与布林带窗口相同时共用同一条移动平均线，多组RSI参数共用同一次价格差分，
+    每个指标只计算一次，结果与各策略单独计算完全一致。
+
+    参数:
+    close: pandas Series, 收盘价（只读）
+    """
+
+    def __init__(self, close):
+        self.close = close
+        self._cache = {}
+
+    def _get(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def rolling_mean(self, window):
+        """收盘价移动平均"""
+        return self._get(('均值', window), lambda: self.close.rolling(window=window, min_periods=window).mean())
+
+    def rolling_std(self, window):
+        """收盘价移动标准差"""
+        return self._get(('标准差', window), lambda: self.close.rolling(window=window, min_periods=window).std())
+
+    def delta(self):
+        """收盘价逐K线差分"""
+        return self._get(('差分',), lambda: self.close.diff())
+
+    def rsi(self, period):
+        """RSI指标"""
+        def compute():
+            delta = self.delta()
+            gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
+            loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+            rs = gain / loss
+            return 100 - (100 / (1 + rs))
+        return self._get(('RSI', period), compute)
 
-def moving_average_crossover_strategy(data, short_window=50, long_window=200):
+
+def moving_average_crossover_strategy(data, short_window=50, long_window=200, indicators=None):
     """
     双均线金叉死叉策略
     
     参数:
-    data: pandas DataFrame, 包含股票价格数据，必须有'收盘'列
+    data: pandas DataFrame, 包含股票价格数据，必须有'收盘'列（只读）
     short_window: int, 短期移动平均线的窗口大小，默认50天
     long_window: int, 长期移动平均线的窗口大小，默认200天
+    indicators: SharedIndicators 或 None, 与其他策略共用的指标缓存
     
     返回:
-    data: pandas DataFrame, 包含原始数据和策略信号
+    signals: pandas DataFrame, 与data共用日期索引，包含指标列和'信号'列
     """
+    indicators = indicators or SharedIndicators(data['收盘'])
+    signals = pd.DataFrame(index=data.index)
+    
     # 计算短期和长期移动平均线
-    data['短期MA'] = data['收盘'].rolling(window=short_window, min_periods=short_window).mean()
-    data['长期MA'] = data['收盘'].rolling(window=long_window, min_periods=long_window).mean()
+    signals['短期MA'] = indicators.rolling_mean(short_window)
+    signals['长期MA'] = indicators.rolling_mean(long_window)
     
     # 计算MA差值和前一天的差值
-    data['MA差值'] = data['短期MA'] - data['长期MA']
-    data['MA差值_前一天'] = data['MA差值'].shift(1)
+    signals['MA差值'] = signals['短期MA'] - signals['长期MA']
+    signals['MA差值_前一天'] = signals['MA差值'].shift(1)
     
     # 创建信号列，初始化为0
-    data['信号'] = 0
+    signals['信号'] = 0
     
     # 买入信号：前一天短期MA < 长期MA，当天短期MA > 长期MA（金叉）
-    data.loc[(data['MA差值_前一天'] < 0) & (data['MA差值'] > 0), '信号'] = 1
+    signals.loc[(signals['MA差值_前一天'] < 0) & (signals['MA差值'] > 0), '信号'] = 1
     
     # 卖出信号：前一天短期MA > 长期MA，当天短期MA < 长期MA（死叉）
-    data.loc[(data['MA差值_前一天'] > 0) & (data['MA差值'] < 0), '信号'] = -1
+    signals.loc[(signals['MA差值_前一天'] > 0) & (signals['MA差值'] < 0), '信号'] = -1
     
-    return data
+    return signals
 
 
-def rsi_strategy(data, rsi_period=14, overbought=70, oversold=30):
+def rsi_strategy(data, rsi_period=14, overbought=70, oversold=30, indicators=None):
     """
     RSI超卖反转策略
     
     参数:
-    data: pandas DataFrame, 包含股票价格数据，必须有'收盘'列
+    data: pandas DataFrame, 包含股票价格数据，必须有'收盘'列（只读）
     rsi_period: int, RSI计算周期，默认14天
     overbought: int, 超买阈值，默认70
     oversold: int, 超卖阈值，默认30
+    indicators: SharedIndicators 或 None, 与其他策略共用的指标缓存
     
     返回:
-    data: pandas DataFrame, 包含原始数据和策略信号
+    signals: pandas DataFrame, 与data共用日期索引，包含指标列和'信号'列
     """
+    indicators = indicators or SharedIndicators(data['收盘'])
+    signals = pd.DataFrame(index=data.index)
+    
     # 计算RSI指标
-    delta = data['收盘'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=rsi_period).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=rsi_period).mean()
-    rs = gain / loss
-    data['RSI'] = 100 - (100 / (1 + rs))
+    signals['RSI'] = indicators.rsi(rsi_period)
     
     # 计算RSI前一天的值
-    data['RSI_前一天'] = data['RSI'].shift(1)
+    signals['RSI_前一天'] = signals['RSI'].shift(1)
     
     # 创建信号列，初始化为0
-    data['信号'] = 0
+    signals['信号'] = 0
     
     # 买入信号：前一天RSI < 超卖阈值，当天RSI > 前一天RSI（反弹）
-    data.loc[(data['RSI_前一天'] < oversold) & (data['RSI'] > data['RSI_前一天']), '信号'] = 1
+    signals.loc[(signals['RSI_前一天'] < oversold) & (signals['RSI'] > signals['RSI_前一天']), '信号'] = 1
     
     # 卖出信号：前一天RSI > 超买阈值，当天RSI < 前一天RSI（回落）
-    data.loc[(data['RSI_前一天'] > overbought) & (data['RSI'] < data['RSI_前一天']), '信号'] = -1
+    signals.loc[(signals['RSI_前一天'] > overbought) & (signals['RSI'] < signals['RSI_前一天']), '信号'] = -1
     
-    return data
+    return signals
 
 
-def bollinger_band_strategy(data, window=20, num_std=2):
+def bollinger_band_strategy(data, window=20, num_std=2, indicators=None):
     """
     布林带突破策略
     
     参数:
-    data: pandas DataFrame, 包含股票价格数据，必须有'收盘'列
+    data: pandas DataFrame, 包含股票价格数据，必须有'收盘'列（只读）
     window: int, 移动平均线窗口大小，默认20天
     num_std: int, 标准差倍数，默认2倍
+    indicators: SharedIndicators 或 None, 与其他策略共用的指标缓存
     
     返回:
-    data: pandas DataFrame, 包含原始数据和策略信号
+    signals: pandas DataFrame, 与data共用日期索引，包含指标列和'信号'列
     """
+    close = data['收盘']
+    indicators = indicators or SharedIndicators(close)
+    signals = pd.DataFrame(index=data.index)
+    
     # 计算布林线指标
-    data['中轨'] = data['收盘'].rolling(window=window, min_periods=window).mean()
-    data['标准差'] = data['收盘'].rolling(window=window, min_periods=window).std()
-    data['上轨'] = data['中轨'] + num_std * data['标准差']
-    data['下轨'] = data['中轨'] - num_std * data['标准差']
+    signals['中轨'] = indicators.rolling_mean(window)
+    signals['标准差'] = indicators.rolling_std(window)
+    signals['上轨'] = signals['中轨'] + num_std * signals['标准差']
+    signals['下轨'] = signals['中轨'] - num_std * signals['标准差']
     
     # 创建信号列，初始化为0
-    data['信号'] = 0
+    signals['信号'] = 0
     
     # 买入信号：价格突破下轨
-    data.loc[(data['收盘'].shift(1) < data['下轨'].shift(1)) & (data['收盘'] > data['下轨']), '信号'] = 1
+    signals.loc[(close.shift(1) < signals['下轨'].shift(1)) & (close > signals['下轨']), '信号'] = 1
     
     # 卖出信号：价格突破上轨
-    data.loc[(data['收盘'].shift(1) > data['上轨'].shift(1)) & (data['收盘'] < data['上轨']), '信号'] = -1
+    signals.loc[(close.shift(1) > signals['上轨'].shift(1)) & (close < signals['上轨']), '信号'] = -1
     
-    return data
+    return signals
+
+
+def warmup_bars(strategy, **params):
+    """
+    策略计算信号所需的历史K线数（分块回测时用于指标预热）
+    
+    参数:
+    strategy: 策略函数
+    params: 策略参数，未传入的参数使用策略默认值
+    
+    返回:
+    int, 预热K线数
+    """
+    if strategy is moving_average_crossover_strategy:
+        # 长期均线窗口 + 前一天的差值
+        return params.get('long_window', 200) + 1
+    if strategy is rsi_strategy:
+        # 价格差分 + RSI窗口 + 前一天的RSI
+        return params.get('rsi_period', 14) + 2
+    if strategy is bollinger_band_strategy:
+        # 布林带窗口 + 前一天的价格和轨道
+        return params.get('window', 20) + 1
+    raise ValueError(f"未知的策略函数: {strategy}")
+
+
+def trend_filter(signals, trend_bars, window=10):
+    """
+    高周期趋势过滤：高周期收盘价低于其均线时屏蔽买入信号，卖出信号不受影响
+    
+    参数:
+    signals: pandas DataFrame, 策略函数返回的信号数据（不会被修改）
+    trend_bars: pandas DataFrame, 高周期K线（resample.get_timeframe的结果，如周线）
+    window: int, 高周期均线窗口，默认10（周线约为一个季度）
+    
+    返回:
+    signals: pandas DataFrame, 增加'趋势MA'、'趋势向上'列并过滤后的信号数据
+    """
+    trend = trend_bars.assign(趋势MA=trend_bars['收盘'].rolling(window=window, min_periods=window).mean())
+    aligned = align_to(trend, signals.index, columns=['收盘', '趋势MA'])
+    uptrend = (aligned['收盘'] > aligned['趋势MA']).to_numpy()
+    
+    filtered_signal = signals['信号'].where((signals['信号'] != 1) | uptrend, 0)
+    return signals.assign(趋势MA=aligned['趋势MA'], 趋势向上=uptrend, 信号=filtered_signal)
+
+
+# 策略ID与策略函数的对应关系（与main.py中的策略列表一致）
+STRATEGY_FUNCTIONS = {
+    1: moving_average_crossover_strategy,
+    2: rsi_strategy,
+    3: bollinger_band_strategy,
+}
+
+
+def compute_signals(data, strategy_id, backend=None, indicators=None, **params):
+    """
+    按配置的后端生成交易信号
+
+    参数:
+    data: pandas DataFrame, 价格数据（只读）
+    strategy_id: int, 策略ID
+    backend: str 或 None, 'pandas' 或 'polars'，None表示使用SIGNAL_BACKEND；
+        polars未安装时退回pandas
+    indicators: SharedIndicators 或 None, 多个策略共用的指标缓存（仅pandas后端使用）
+    params: 策略参数
+
+    返回:
+    signals: pandas DataFrame, 与data共用日期索引，包含指标列和'信号'列
+    """
+    if strategy_id not in STRATEGY_FUNCTIONS:
+        raise ValueError(f"无效的策略ID: {strategy_id}")
+    if (backend or SIGNAL_BACKEND) == 'polars':
+        import polars_backend
+        if polars_backend.available():
+            return polars_backend.strategy_signals(data, strategy_id, **params)
+        print("未安装polars，使用pandas计算信号")
+    return STRATEGY_FUNCTIONS[strategy_id](data, indicators=indicators, **params)
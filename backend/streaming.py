@@ -0,0 +1,287 @@
+import asyncio
+import itertools
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from backtest import BacktestEngine, EngineState
+from data import get_stock_data, bars_per_year, factor_version
+from resample import get_timeframe
+from strategies import compute_signals, trend_filter
+
+
+# 单个WebSocket连接在服务器端最多缓存的消息数，超过后计算线程会暂停等待客户端读取
+DEFAULT_QUEUE_SIZE = 8
+
+# 流式回测时每个净值曲线分块的K线数
+DEFAULT_CHUNK_BARS = 250
+
+# 参数扫描允许的最大组合数
+MAX_SWEEP_COMBINATIONS = 500
+
+# 参数扫描排行榜保留的条数
+LEADERBOARD_SIZE = 10
+
+
+class StreamCancelled(Exception):
+    """客户端断开连接，计算线程应尽快停止"""
+
+
+class StreamChannel:
+    """
+    计算线程到WebSocket的有界消息通道
+
+    - 数据消息（净值曲线分块、排行榜、最终结果）在队列满时阻塞计算线程，
+      服务器端缓存的数据量不会超过队列长度，慢客户端会让计算自然减速
+    - 进度消息可以丢弃：队列满时只保留最新的一条，不阻塞计算
+
+    参数:
+    loop: asyncio事件循环
+    maxsize: int, 队列长度
+    """
+
+    def __init__(self, loop, maxsize=DEFAULT_QUEUE_SIZE):
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._pending_progress = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """标记客户端已断开，之后的send会抛出StreamCancelled"""
+        self._cancelled.set()
+
+    def send(self, message):
+        """从计算线程发送数据消息，队列满时阻塞"""
+        if self.cancelled:
+            raise StreamCancelled()
+        future = asyncio.run_coroutine_threadsafe(self._queue.put(message), self._loop)
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return
+            except FutureTimeoutError:
+                if self.cancelled:
+                    future.cancel()
+                    raise StreamCancelled()
+
+    def progress(self, message):
+        """从计算线程发送进度消息，不阻塞"""
+        if self.cancelled:
+            raise StreamCancelled()
+        self._loop.call_soon_threadsafe(self._offer_progress, message)
+
+    def _offer_progress(self, message):
+        try:
+            self._queue.put_nowait(message)
+            self._pending_progress = None
+        except asyncio.QueueFull:
+            # 队列已满时只保留最新进度，等有空位时再发送
+            self._pending_progress = message
+
+    async def get(self):
+        """在事件循环中取出下一条消息"""
+        message = await self._queue.get()
+        if self._pending_progress is not None and not self._queue.full():
+            self._queue.put_nowait(self._pending_progress)
+            self._pending_progress = None
+        return message
+
+
+def _to_float(value):
+    """将NumPy标量转换为可JSON序列化的float（NaN转换为None）"""
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def _curve_chunk(output, start, end):
+    """净值曲线分块消息内容"""
+    part = output.iloc[start:end]
+    return {
+        "dates": [ts.isoformat() for ts in part.index],
+        "total_capital": [_to_float(v) for v in part['总资金']],
+        "strategy_return": [_to_float(v) for v in part['策略累计收益率']],
+        "benchmark_return": [_to_float(v) for v in part['基准累计收益率']],
+    }
+
+
+def _results_payload(results):
+    return {key: _to_float(value) for key, value in results.items()}
+
+
+def _sort_value(metrics, sort_by):
+    """排行榜排序值：缺失或非有限值（如无交易时的夏普比率）排在最后，0仍按0排序"""
+    value = metrics.get(sort_by)
+    return value if value is not None and np.isfinite(value) else -np.inf
+
+
+def _trend_bars(request, data):
+    """请求指定了高周期趋势过滤时返回聚合K线，否则返回None"""
+    if not request.trend_timeframe:
+        return None
+    version = factor_version(request.stock_code, request.adjust, request.period)
+    return get_timeframe(request.stock_code, request.period, request.trend_timeframe, data, request.adjust, version)
+
+
+def _fetch(request, channel):
+    channel.progress({"type": "progress", "stage": "fetch", "message": "正在获取股票数据"})
+    return get_stock_data(symbol=request.stock_code, start_date=request.start_date,
+                          end_date=request.end_date, period=request.period, adjust=request.adjust)
+
+
+def run_backtest_stream(request, channel, chunk_bars=DEFAULT_CHUNK_BARS):
+    """
+    流式执行单次回测：按分块模拟并逐块推送净值曲线，结果与一次性回测一致
+
+    参数:
+    request: main.BacktestRequest
+    channel: StreamChannel
+    chunk_bars: int, 每个净值曲线分块的K线数
+    """
+    data = _fetch(request, channel)
+
+    channel.progress({"type": "progress", "stage": "signals", "message": "正在生成交易信号"})
+    signals = compute_signals(data, request.strategy_id)
+    trend_bars = _trend_bars(request, data)
+    if trend_bars is not None:
+        signals = trend_filter(signals, trend_bars)
+
+    state = EngineState(100000)
+    results = {}
+    n_bars = len(data)
+    for start in range(0, n_bars, chunk_bars):
+        end = min(start + chunk_bars, n_bars)
+        engine = BacktestEngine(
+            data.iloc[start:end],
+            signals=signals.iloc[start:end],
+            initial_capital=100000,
+            transaction_cost=0.001,
+            slippage=0.0005,
+            periods_per_year=bars_per_year(request.period),
+            **request.exit_params()
+        )
+        results = engine.run(trade_logic='full', state=state)
+        channel.send({"type": "equity_chunk", "offset": start, "total": n_bars,
+                      **_curve_chunk(engine.output, 0, end - start)})
+        channel.progress({"type": "progress", "stage": "simulate", "completed": end, "total": n_bars})
+
+    channel.send({"type": "result", "metrics": _results_payload(results)})
+
+
+def _grid_combinations(grid):
+    """将参数网格展开为参数字典列表"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def run_sweep_stream(request, grid, channel, sort_by='夏普比率'):
+    """
+    流式执行参数扫描：每完成一组参数推送进度，并推送当前排行榜
+
+    参数:
+    request: main.BacktestRequest
+    grid: dict, 参数名 -> 取值列表
+    channel: StreamChannel
+    sort_by: str, 排行榜排序指标
+    """
+    combinations = _grid_combinations(grid)
+    if len(combinations) > MAX_SWEEP_COMBINATIONS:
+        raise ValueError(f"参数组合过多: {len(combinations)}，最多允许{MAX_SWEEP_COMBINATIONS}组")
+
+    data = _fetch(request, channel)
+    # 趋势过滤与单次回测一致，聚合K线只取一次
+    trend_bars = _trend_bars(request, data)
+
+    leaderboard = []
+    for i, params in enumerate(combinations, start=1):
+        signals = compute_signals(data, request.strategy_id, **params)
+        if trend_bars is not None:
+            signals = trend_filter(signals, trend_bars)
+        engine = BacktestEngine(
+            data,
+            signals=signals,
+            initial_capital=100000,
+            transaction_cost=0.001,
+            slippage=0.0005,
+            periods_per_year=bars_per_year(request.period),
+            **request.exit_params()
+        )
+        results = _results_payload(engine.run(trade_logic='full'))
+        leaderboard.append({"params": params, "metrics": results})
+        leaderboard.sort(key=lambda item: _sort_value(item["metrics"], sort_by), reverse=True)
+        del leaderboard[LEADERBOARD_SIZE:]
+
+        channel.progress({"type": "progress", "stage": "sweep", "completed": i, "total": len(combinations)})
+        channel.send({"type": "leaderboard", "completed": i, "total": len(combinations), "entries": leaderboard})
+
+    channel.send({"type": "result", "leaderboard": leaderboard})
+
+
+async def _wait_disconnect(websocket):
+    """等待客户端断开连接（任务开始后客户端发来的其他消息忽略）"""
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+
+async def serve(websocket, job):
+    """
+    在线程池中执行job并把消息转发到WebSocket，直到完成、出错或客户端断开
+
+    同时监听客户端断开：断开后立即通知计算线程停止，不等到下一次发送失败。
+
+    参数:
+    websocket: fastapi.WebSocket, 已accept的连接
+    job: 可调用对象, 接收StreamChannel，在工作线程中执行
+
+    返回:
+    bool: 客户端仍然连接（任务完成或出错）时为True，客户端已断开时为False
+    """
+    loop = asyncio.get_running_loop()
+    channel = StreamChannel(loop)
+    done = object()
+
+    def _worker():
+        try:
+            job(channel)
+        except StreamCancelled:
+            return
+        except Exception as e:
+            print(f"流式任务失败: {e}")
+            _send_final(channel, {"type": "error", "detail": str(e)})
+            return
+        _send_final(channel, done)
+
+    task = loop.run_in_executor(None, _worker)
+    disconnected = asyncio.ensure_future(_wait_disconnect(websocket))
+    try:
+        while True:
+            getter = asyncio.ensure_future(channel.get())
+            await asyncio.wait({getter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                return False
+            message = getter.result()
+            if message is done:
+                await websocket.send_json({"type": "done"})
+                return True
+            await websocket.send_json(message)
+            if message.get("type") == "error":
+                return True
+    finally:
+        # 正常结束或客户端断开：通知计算线程停止并等待其退出
+        disconnected.cancel()
+        channel.cancel()
+        await task
+
+
+def _send_final(channel, message):
+    try:
+        channel.send(message)
+    except StreamCancelled:
+        pass
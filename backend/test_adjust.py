@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data
+from conftest import make_prices
+from store import BarStore
+
+
+class FakeAkshare:
+    """模拟数据源：不复权日线和累计后复权因子表"""
+
+    def __init__(self, bars, hfq):
+        self.bars = bars
+        self.hfq = hfq
+        self.fail_factors = False
+        self.factor_calls = 0
+
+    def stock_zh_a_hist(self, symbol, start_date, end_date, adjust=""):
+        part = self.bars.loc[start_date:end_date]
+        return part.reset_index().assign(日期=lambda frame: frame['日期'].dt.strftime("%Y-%m-%d"))
+
+    def stock_zh_a_daily(self, symbol, adjust=""):
+        self.factor_calls += 1
+        if self.fail_factors:
+            raise ConnectionError("数据源不可用")
+        return pd.DataFrame({'date': self.hfq.index.strftime("%Y-%m-%d"), 'hfq_factor': self.hfq.to_numpy()})
+
+
+@pytest.fixture
+def fake_source(tmp_path, monkeypatch):
+    bars = make_prices(1500, start='2015-01-01')
+    hfq = pd.Series([1.0, 1.1], index=pd.to_datetime(['2015-01-05', '2017-06-01']))
+    source = FakeAkshare(bars, hfq)
+    monkeypatch.setattr(data, "ak", source)
+    monkeypatch.setattr(data, "_bar_store", BarStore(str(tmp_path)))
+    data.clear_cache()
+    yield source
+    data.clear_cache()
+
+
+def _next_day(monkeypatch, days=1):
+    """模拟日期前进（复权因子每天最多检查一次）"""
+    class ShiftedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.now(tz) + timedelta(days=days)
+
+    monkeypatch.setattr(data, "datetime", ShiftedDatetime)
+
+
+# 测试新增除权因子后，历史区间的前复权价格和因子版本随之变化（不命中旧缓存）
+def test_new_factor_changes_qfq_prices(fake_source, monkeypatch):
+    print("\n=== 测试除权后前复权价格更新 ===")
+    args = dict(symbol="000001", start_date="20160101", end_date="20181231", adjust='qfq')
+    before = data.get_stock_data(**args)
+    version = data.factor_version("000001")
+    raw = fake_source.bars.loc['2016-01-01':'2018-12-31']
+    np.testing.assert_allclose(before.loc[:'2017-05-31', '收盘'], raw.loc[:'2017-05-31', '收盘'] / 1.1)
+    # 同一天内重复请求命中缓存，不再访问数据源
+    assert data.get_stock_data(**args) is before
+    assert fake_source.factor_calls == 1
+
+    fake_source.hfq.loc[pd.Timestamp('2020-06-01')] = 1.21
+    _next_day(monkeypatch)
+    after = data.get_stock_data(**args)
+    assert data.factor_version("000001") != version
+    np.testing.assert_allclose(after['收盘'].to_numpy(), before['收盘'].to_numpy() / 1.1)
+    # 后复权的历史价格不受新的除权影响，不复权价格没有版本
+    np.testing.assert_allclose(data.get_stock_data(**{**args, 'adjust': 'hfq'})['收盘'].to_numpy(),
+                               before['收盘'].to_numpy() * 1.1)
+    assert data.factor_version("000001", adjust='none') is None
+
+
+# 测试拉取复权因子失败：有本地因子时使用本地因子且不记录拉取区间，没有时抛出异常
+def test_factor_fetch_failure(fake_source, monkeypatch):
+    print("\n=== 测试复权因子拉取失败 ===")
+    fake_source.fail_factors = True
+    with pytest.raises(data.FactorUnavailableError, match="复权因子"):
+        data.get_stock_data(symbol="000001", start_date="20160101", end_date="20181231")
+    assert data._bar_store.coverage("000001", data.FACTOR_PERIOD) is None
+
+    fake_source.fail_factors = False
+    version = data.factor_version("000001")
+    coverage = data._bar_store.coverage("000001", data.FACTOR_PERIOD)
+
+    fake_source.fail_factors = True
+    _next_day(monkeypatch)
+    assert data.factor_version("000001") == version
+    assert data._bar_store.coverage("000001", data.FACTOR_PERIOD) == coverage
+    # 失败不计入当天已检查，下次请求重新拉取
+    data.factor_version("000001")
+    assert fake_source.factor_calls == 4
+
+
+# 测试无效的复权方式、股票代码和周期返回400，且在计算缓存键之前报出，不会拉取复权因子
+def test_invalid_request_skips_factor_fetch(api_client, monkeypatch):
+    print("\n=== 测试无效参数不拉取复权因子 ===")
+    import main
+
+    calls = []
+    monkeypatch.setattr(main, "factor_version", lambda *args: calls.append(args))
+    body = {"strategy_id": 1, "start_date": "20150101", "end_date": "20201231"}
+    for invalid in ({"adjust": "bogus"}, {"stock_code": "abc"}, {"period": "weekly"}):
+        response = api_client.post("/api/backtest", json={**body, **invalid})
+        assert response.status_code == 400, invalid
+        compare = api_client.post("/api/compare", json={**body, **invalid, "strategies": [{"strategy_id": 1}]})
+        assert compare.status_code == 400, invalid
+    assert "复权方式" in api_client.post("/api/backtest", json={**body, "adjust": "bogus"}).json()["detail"]
+    assert calls == []
+
+
+# 测试复权因子拉取失败且本地没有因子时返回503
+def test_factor_outage_returns_503(api_client, monkeypatch):
+    print("\n=== 测试复权因子不可用 ===")
+    import main
+
+    def unavailable(*args):
+        raise data.FactorUnavailableError("没有000001的复权因子，暂时无法计算复权价格")
+
+    monkeypatch.setattr(main, "factor_version", unavailable)
+    body = {"strategy_id": 1, "start_date": "20150101", "end_date": "20201231"}
+    response = api_client.post("/api/backtest", json=body)
+    assert response.status_code == 503
+    assert "复权因子" in response.json()["detail"]
+    assert api_client.post("/api/compare", json={**body, "strategies": [{"strategy_id": 1}]}).status_code == 503
+
+    # 获取价格数据时因子不可用同样返回503
+    monkeypatch.setattr(main, "factor_version", lambda *args: None)
+    monkeypatch.setattr(main, "get_stock_data", lambda **kwargs: unavailable())
+    assert api_client.post("/api/backtest", json=body).status_code == 503
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
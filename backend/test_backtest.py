@@ -50,17 +50,18 @@ def test_backtest_engine():
         data = generate_simulated_data(days=days)
         
         # 使用双均线金叉死叉策略生成信号
-        data_with_signals = moving_average_crossover_strategy(data)
+        signals = moving_average_crossover_strategy(data)
         
         # 检查信号数量
-        buy_signals = (data_with_signals['信号'] == 1).sum()
-        sell_signals = (data_with_signals['信号'] == -1).sum()
+        buy_signals = (signals['信号'] == 1).sum()
+        sell_signals = (signals['信号'] == -1).sum()
         print(f"买入信号数量: {buy_signals}")
         print(f"卖出信号数量: {sell_signals}")
         
         # 创建回测引擎实例
         backtest_engine = BacktestEngine(
-            data_with_signals,
+            data,
+            signals=signals,
             initial_capital=100000,
             transaction_cost=0.001,
             slippage=0.0005
@@ -0,0 +1,86 @@
+import concurrent.futures
+
+import pandas as pd
+import pytest
+
+import batch
+
+SPEC = {
+    "symbols": ["000001", "600519"],
+    "strategies": [{"id": 1, "params": [{"short_window": 20, "long_window": 60}]}, {"id": 2}],
+    "date_ranges": [{"start_date": "20150101", "end_date": "20201231"}],
+}
+
+
+@pytest.fixture
+def fake_prices(monkeypatch, price_data):
+    # 工作进程由fork创建，继承替换后的行情数据函数
+    monkeypatch.setattr(batch, "get_stock_data", lambda **kwargs: price_data)
+    return price_data
+
+
+# 测试任务ID包含周期、复权方式、引擎参数、交易逻辑和基准等回测设置
+def test_task_id_covers_settings():
+    print("\n=== 测试任务ID ===")
+    base = [batch.task_id(task) for task in batch.expand_tasks(SPEC)]
+    assert len(set(base)) == len(base) == 4
+    # 显式写出默认值不改变任务ID
+    explicit = {**SPEC, "period": "daily", "adjust": "qfq", "trade_logic": "full", "engine": {}}
+    assert [batch.task_id(task) for task in batch.expand_tasks(explicit)] == base
+    for change in ({"period": "60"}, {"adjust": "hfq"}, {"engine": {"transaction_cost": 0.002}},
+                   {"trade_logic": "percent"}, {"trade_param": {"percent": 0.5}}, {"benchmark": "csi300"}):
+        changed = [batch.task_id(task) for task in batch.expand_tasks({**SPEC, **change})]
+        assert not set(changed) & set(base), change
+
+
+# 测试续跑跳过已完成的任务、删除未记录的分片，修改回测设置后重新执行
+def test_resume_skips_completed(tmp_path, fake_prices):
+    print("\n=== 测试批量回测续跑 ===")
+    output = str(tmp_path / "campaign")
+    first = batch.run_campaign(SPEC, output, workers=1, flush_every=1)
+    assert first == {"total": 4, "completed": 4, "skipped": 0, "failed": 0}
+    results = batch.read_results(output)
+    assert len(results) == 4 and results["任务ID"].is_unique
+
+    # 写入分片后、记录journal之前崩溃留下的分片在续跑时删除
+    results.head(1).to_parquet(tmp_path / "campaign" / batch.METRICS_DIR / "part-00099.parquet")
+    second = batch.run_campaign(SPEC, output, workers=1)
+    assert second == {"total": 4, "completed": 0, "skipped": 4, "failed": 0}
+    pd.testing.assert_frame_equal(batch.read_results(output), results)
+
+    third = batch.run_campaign({**SPEC, "engine": {"transaction_cost": 0.002}}, output, workers=1)
+    assert third["completed"] == 4 and third["skipped"] == 0
+    assert len(batch.read_results(output)) == 8
+
+
+class _RecordingPool(concurrent.futures.ProcessPoolExecutor):
+    shutdowns = []
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        _RecordingPool.shutdowns.append(cancel_futures)
+        super().shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+# 测试Ctrl+C时取消尚未开始的任务，并写入已经完成的结果
+def test_interrupt_cancels_pending(tmp_path, fake_prices, monkeypatch):
+    print("\n=== 测试批量回测中断 ===")
+    def interrupted(futures):
+        iterator = concurrent.futures.as_completed(futures)
+        yield next(iterator)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", _RecordingPool)
+    monkeypatch.setattr(batch, "as_completed", interrupted)
+    output = str(tmp_path / "campaign")
+    with pytest.raises(KeyboardInterrupt):
+        batch.run_campaign(SPEC, output, workers=1)
+    assert _RecordingPool.shutdowns[0] is True
+    # 完成的第一组（同一股票的2个任务）已写入，续跑只执行剩余的任务
+    assert len(batch.read_results(output)) == 2
+    monkeypatch.setattr(batch, "as_completed", concurrent.futures.as_completed)
+    assert batch.run_campaign(SPEC, output, workers=1)["skipped"] == 2
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+import data
+from conftest import make_prices
+from metrics import relative_metrics
+from shared_cache import shared_cache
+from store import BarStore
+
+
+def _index_prices(start='2014-12-01', n_bars=1600, seed=1):
+    """模拟指数日线（只有收盘价有意义）"""
+    prices = make_prices(n_bars, seed=seed, start=start)
+    return prices[['开盘', '收盘', '最高', '最低', '成交量']]
+
+
+class FakeIndexSource:
+    """模拟指数数据源，记录每次拉取的指数代码和日期范围"""
+
+    def __init__(self, bars):
+        self.bars = bars
+        self.calls = []
+
+    def index_zh_a_hist(self, symbol, period, start_date, end_date):
+        self.calls.append((symbol, start_date, end_date))
+        part = self.bars.loc[pd.Timestamp(start_date):pd.Timestamp(end_date)]
+        return part.reset_index()
+
+
+@pytest.fixture
+def index_source(tmp_path, monkeypatch):
+    source = FakeIndexSource(_index_prices())
+    monkeypatch.setattr(data, "ak", source)
+    monkeypatch.setattr(data, "_bar_store", BarStore(str(tmp_path)))
+    shared_cache.clear('prices')
+    data.clear_cache()
+    benchmark._aligned_cache.clear()
+    yield source
+    shared_cache.clear('prices')
+    data.clear_cache()
+    benchmark._aligned_cache.clear()
+
+
+# 测试指数日线只拉取一次：之后的请求（包括子区间和清空进程内缓存后）从本地存储读取
+def test_index_data_fetch_and_cache(index_source):
+    print("\n=== 测试指数数据获取与缓存 ===")
+    bars = index_source.bars
+    first = data.get_index_data('csi300', start_date='20150101', end_date='20181231')
+    assert index_source.calls and all(call[0] == '000300' for call in index_source.calls)
+    np.testing.assert_allclose(first['收盘'].to_numpy(), bars.loc['2015-01-01':'2018-12-31', '收盘'].to_numpy())
+
+    n_calls = len(index_source.calls)
+    assert data.get_index_data('csi300', start_date='20150101', end_date='20181231') is first
+    shared_cache.clear('prices')
+    data.clear_cache()
+    subrange = data.get_index_data('000300', start_date='20160101', end_date='20171231')
+    assert len(index_source.calls) == n_calls
+    pd.testing.assert_frame_equal(subrange, first.loc['2016-01-01':'2017-12-31'])
+
+    with pytest.raises(Exception, match="未获取到指数数据"):
+        data.get_index_data('000905', start_date='20000101', end_date='20001231')
+
+
+# 测试对齐到个股交易日历：停牌日（日历中缺失）跨越的区间用停牌前后的指数收盘价，
+# 个股有K线而指数休市的日子沿用前一个指数收盘价，指数开始之前为NaN
+def test_aligned_benchmark_misaligned_calendar(index_source):
+    print("\n=== 测试基准对齐交易日历 ===")
+    index_bars = index_source.bars.drop(pd.Timestamp('2016-03-09'))
+    index_source.bars = index_bars
+    closes = index_bars['收盘']
+    calendar = pd.bdate_range('2014-11-20', '2016-06-30', name='日期')
+    # 个股停牌两周
+    calendar = calendar[(calendar < '2015-08-03') | (calendar > '2015-08-14')]
+
+    aligned = benchmark.aligned_benchmark('csi300', calendar)
+    assert len(aligned) == len(calendar)
+    before_index = calendar < closes.index[0]
+    assert np.isnan(aligned[before_index]).all()
+    expected = closes.reindex(calendar, method='ffill').to_numpy()
+    np.testing.assert_array_equal(aligned[~before_index], expected[~before_index])
+    # 指数休市日取前一交易日收盘价
+    position = calendar.get_loc(pd.Timestamp('2016-03-09'))
+    assert aligned[position] == closes.loc['2016-03-08']
+    # 停牌结束后第一根K线对应停牌期间的指数收益率
+    resumed = calendar.get_loc(pd.Timestamp('2015-08-17'))
+    assert aligned[resumed] / aligned[resumed - 1] == closes.loc['2015-08-17'] / closes.loc['2015-07-31']
+
+    # 同一指数和交易日历只对齐一次
+    n_calls = len(index_source.calls)
+    assert benchmark.aligned_benchmark('csi300', calendar) is aligned
+    assert len(index_source.calls) == n_calls
+    assert not aligned.flags.writeable
+
+    equity = np.vstack([closes.reindex(calendar, method='ffill').fillna(1.0).to_numpy() * 2,
+                        np.linspace(1, 2, len(calendar))])
+    relative = benchmark.benchmark_metrics(equity, calendar, 'csi300')
+    expected_metrics = relative_metrics(equity, aligned)
+    for key, values in expected_metrics.items():
+        np.testing.assert_allclose(relative[key], values)
+    assert relative['贝塔'][0] == pytest.approx(1.0)
+
+
+# 测试/api/backtest指定基准时返回相对基准的指标，无效的基准返回400
+def test_backtest_benchmark_payload(api_client, index_source, price_data):
+    print("\n=== 测试回测接口的基准指标 ===")
+    body = {"strategy_id": 1, "start_date": "20150101", "end_date": "20201231"}
+    plain = api_client.post("/api/backtest", json=body).json()
+    assert "benchmark_metrics" not in plain
+
+    payload = api_client.post("/api/backtest", json={**body, "benchmark": "csi300"}).json()
+    relative = payload["benchmark_metrics"]
+    assert set(relative) == {'阿尔法', '贝塔', '相关系数', '跟踪误差', '信息比率'}
+    assert all(np.isfinite(value) for value in relative.values())
+    assert -1 <= relative['相关系数'] <= 1
+    assert payload["metrics"] == plain["metrics"]
+
+    assert api_client.post("/api/backtest", json={**body, "benchmark": "sp500"}).status_code == 400
+    assert api_client.post("/api/backtest", json={**body, "benchmark": "csi300", "period": "5"}).status_code == 400
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+import serializers
+from backtest import BacktestEngine, compact_frame, run_chunked_backtest
+from charts import ChunkedChartData
+from resample import resample_chunks, resample_ohlcv
+from strategies import compute_signals, rsi_strategy, trend_filter, warmup_bars
+
+ENGINE_KWARGS = dict(initial_capital=100000, transaction_cost=0.001, slippage=0.0005, periods_per_year=252)
+
+
+def _monthly_chunks(data):
+    """按月切分，模拟data.iter_intraday_data"""
+    return [part for _, part in data.groupby(data.index.to_period('M'))]
+
+
+def _assert_results_close(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        assert np.isclose(actual[key], value, equal_nan=True), (key, actual[key], value)
+
+
+# 测试分块回测（含指标预热和止损止盈）与一次性回测的结果一致
+def test_chunked_backtest_matches_engine(price_data):
+    print("\n=== 测试分块回测与一次性回测一致 ===")
+    exits = dict(stop_loss=0.05, take_profit=0.1)
+    engine = BacktestEngine(price_data, signals=rsi_strategy(price_data), **ENGINE_KWARGS, **exits)
+    expected = engine.run()
+
+    chunks = []
+    results, state = run_chunked_backtest(_monthly_chunks(price_data), rsi_strategy, warmup=warmup_bars(rsi_strategy),
+                                          on_chunk=chunks.append, **ENGINE_KWARGS, **exits)
+    _assert_results_close(results, expected)
+    combined = pd.concat(chunks)
+    for col in ('信号', '持仓数量', '总资金', '策略累计收益率'):
+        np.testing.assert_allclose(combined[col].to_numpy(dtype=float), engine.backtest_data[col].to_numpy(dtype=float))
+
+
+# 测试逐块聚合的高周期K线与完整数据聚合一致
+def test_resample_chunks(price_data):
+    print("\n=== 测试逐块聚合 ===")
+    for timeframe in ('weekly', 'monthly'):
+        pd.testing.assert_frame_equal(resample_chunks(_monthly_chunks(price_data), timeframe),
+                                      resample_ohlcv(price_data, timeframe), check_freq=False)
+
+
+@pytest.fixture
+def intraday_client(api_client, monkeypatch, price_data):
+    """分钟线接口客户端：main.iter_intraday_data按月产出price_data（不读取本地存储）"""
+    def fake_iter_intraday_data(symbol="000001", start_date=None, end_date=None, period='5', **kwargs):
+        start = pd.Timestamp(start_date) if start_date else None
+        end = pd.Timestamp(end_date) if end_date else None
+        return iter(_monthly_chunks(price_data.loc[start:end]))
+
+    monkeypatch.setattr(main, "iter_intraday_data", fake_iter_intraday_data)
+    return api_client
+
+
+def _full_engine(price_data, strategy_id, trend_timeframe=None):
+    signals = compute_signals(price_data, strategy_id)
+    if trend_timeframe:
+        signals = trend_filter(signals, resample_ohlcv(price_data, trend_timeframe))
+    engine = BacktestEngine(price_data, signals=signals, **{**ENGINE_KWARGS, 'periods_per_year': main.bars_per_year('5')})
+    engine.run()
+    return engine
+
+
+# 测试分钟线的/api/backtest和/api/backtest/series逐块回测，结果与一次性回测一致
+def test_intraday_endpoints_match_engine(intraday_client, price_data):
+    print("\n=== 测试分钟线接口分块回测 ===")
+    body = {"strategy_id": 1, "period": "5", "start_date": "20150101", "end_date": "20201231",
+            "trend_timeframe": "weekly"}
+    engine = _full_engine(price_data, 1, "weekly")
+
+    response = intraday_client.post("/api/backtest", json=body)
+    assert response.status_code == 200
+    _assert_results_close(response.json()["metrics"], engine.results)
+    assert response.json()["charts"]["heatmap"]
+
+    series = intraday_client.post("/api/backtest/series", json=body)
+    assert series.status_code == 200
+    restored = serializers.read_arrow_ipc(series.content)
+    expected = compact_frame(engine.backtest_data)
+    assert list(restored.columns) == list(expected.columns)
+    np.testing.assert_allclose(restored['总资金'].to_numpy(), expected['总资金'].to_numpy())
+
+    sampled = intraday_client.post("/api/backtest/series", json={**body, "max_points": 200, "columns": ['总资金']})
+    assert len(serializers.read_arrow_ipc(sampled.content)) <= 200
+    bad = intraday_client.post("/api/backtest/series", json={**body, "columns": ['不存在']})
+    assert bad.status_code == 400
+
+
+# 测试分块图表数据只保留有限的点，热力图的月份跨分块合并
+def test_chunked_chart_data_is_bounded(price_data):
+    print("\n=== 测试分块图表数据 ===")
+    engine = BacktestEngine(price_data, signals=rsi_strategy(price_data), **ENGINE_KWARGS)
+    engine.run()
+    data = engine.compact_data()
+    charts_data = ChunkedChartData(max_points=100)
+    # 分块边界落在月中，同一个月的收益率分在两个分块里
+    for part in np.array_split(np.arange(len(data)), 37):
+        charts_data.add(data.iloc[part])
+        assert charts_data._curve._rows <= 4 * 100
+    assert len(charts_data._curve.result()) <= 100
+    monthly = pd.concat(charts_data._monthly).groupby(level=0).sum()
+    np.testing.assert_allclose(monthly.to_numpy(), data['策略收益率'].resample('ME').sum().to_numpy(), rtol=1e-5)
+    assert charts_data.equity_curve() and charts_data.heatmap()
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import BacktestEngine, run_backtest_batch
+from strategies import (SharedIndicators, bollinger_band_strategy, compute_signals, moving_average_crossover_strategy,
+                        rsi_strategy)
+
+BODY = {"start_date": "20150101", "end_date": "20201231"}
+
+
+# 测试批量回测与逐个策略运行BacktestEngine的结果一致
+def test_backtest_batch_matches_engine():
+    print("\n=== 测试多策略批量回测 ===")
+    rng = np.random.default_rng(7)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, 800)))
+    data = pd.DataFrame({'收盘': close}, index=pd.bdate_range('2020-01-01', periods=800))
+
+    indicators = SharedIndicators(data['收盘'])
+    signal_frames = [
+        moving_average_crossover_strategy(data, short_window=20, long_window=60, indicators=indicators),
+        rsi_strategy(data, indicators=indicators),
+        bollinger_band_strategy(data, window=20, indicators=indicators),
+    ]
+    results, equity, _ = run_backtest_batch(data, np.vstack([s['信号'].to_numpy() for s in signal_frames]))
+
+    for i, signals in enumerate(signal_frames):
+        engine = BacktestEngine(data, signals=signals)
+        expected = engine.run(trade_logic='full')
+        assert np.array_equal(equity[i], engine.output['总资金'].to_numpy())
+        for key, value in expected.items():
+            assert value == results[i][key] or (np.isnan(value) and np.isnan(results[i][key])), key
+    print("批量回测结果与逐个回测一致")
+
+
+# 测试/api/compare：各策略的指标与单独回测一致，相同参数只计算一次，曲线共用降采样点
+def test_compare_endpoint(api_client, price_data):
+    print("\n=== 测试多策略对比接口 ===")
+    specs = [
+        {"strategy_id": 1, "params": {"short_window": 20, "long_window": 60}},
+        {"strategy_id": 2},
+        {"strategy_id": 1, "params": {"long_window": 60, "short_window": 20}},
+    ]
+    response = api_client.post("/api/compare", json={**BODY, "strategies": specs, "chart_width": 300})
+    assert response.status_code == 200
+    content = response.json()
+    items = content["strategies"]
+    assert [item["strategy_id"] for item in items] == [1, 2, 1]
+    assert items[0]["label"].startswith("双均线金叉死叉(")
+    assert items[0]["metrics"] == items[2]["metrics"]
+
+    for item in items:
+        signals = compute_signals(price_data, item["strategy_id"], **item["params"])
+        engine = BacktestEngine(price_data, signals=signals, initial_capital=100000, transaction_cost=0.001,
+                                slippage=0.0005)
+        for key, value in engine.run().items():
+            assert item["metrics"][key] == pytest.approx(value, nan_ok=True), key
+        assert '索提诺比率' in item["metrics"]
+
+    curves = content["curves"]
+    assert len(curves["series"]) == 3
+    assert len(curves["dates"]) == len(curves["benchmark"]) == len(curves["series"][0]) <= 300
+    assert content["charts"]["equity_curve"]
+
+
+# 测试/api/compare的参数校验
+def test_compare_rejects_invalid_requests(api_client):
+    print("\n=== 测试多策略对比参数校验 ===")
+    assert api_client.post("/api/compare", json={**BODY, "strategies": []}).status_code == 400
+    too_many = [{"strategy_id": 2, "params": {"rsi_period": n}} for n in range(5, 16)]
+    assert api_client.post("/api/compare", json={**BODY, "strategies": too_many}).status_code == 400
+    unknown = api_client.post("/api/compare", json={**BODY, "strategies": [{"strategy_id": 9}]})
+    assert unknown.status_code == 400
+    bad_param = api_client.post("/api/compare", json={**BODY, "strategies": [{"strategy_id": 2, "params": {"x": 1}}]})
+    assert bad_param.status_code == 400
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
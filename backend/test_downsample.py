@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from downsample import downsample_backtest_data, multi_series_indices
+
+
+def _backtest_frame(n_bars=20000, seed=0, trade_every=3):
+    rng = np.random.default_rng(seed)
+    equity = 100000 * np.exp(np.cumsum(rng.normal(0, 0.01, n_bars)))
+    positions = np.zeros(n_bars)
+    # 每隔几根K线换一次仓，交易点远多于目标点数
+    positions[::trade_every] = rng.integers(0, 10, len(positions[::trade_every])) * 100
+    return pd.DataFrame({'总资金': equity, '持仓数量': positions},
+                        index=pd.date_range('2020-01-01', periods=n_bars, freq='min'))
+
+
+# 测试交易点很多时降采样结果仍不超过目标点数，且保留最大回撤最低点和首尾两点
+def test_downsample_bounded_and_keeps_trough():
+    print("\n=== 测试降采样点数上限 ===")
+    data = _backtest_frame()
+    equity = data['总资金'].to_numpy()
+    trough = int(np.argmin(equity / np.maximum.accumulate(equity)))
+    for method in ('lttb', 'minmax'):
+        for target in (3, 50, 500):
+            sampled = downsample_backtest_data(data, target, method=method)
+            positions = data.index.get_indexer(sampled.index)
+            assert len(sampled) <= target
+            assert sampled.index.is_monotonic_increasing
+            assert trough in positions
+            if target > 3:
+                assert positions[0] == 0 and positions[-1] == len(data) - 1
+            print(f"{method} 目标 {target} 点: 实际 {len(sampled)} 点")
+
+
+# 测试交易点较少时全部保留
+def test_downsample_keeps_sparse_trades():
+    print("\n=== 测试保留全部交易点 ===")
+    data = _backtest_frame(n_bars=5000, trade_every=250)
+    positions = data['持仓数量'].to_numpy()
+    trades = np.flatnonzero(np.diff(positions, prepend=positions[:1]) != 0)
+    sampled = downsample_backtest_data(data, 500)
+    assert len(sampled) <= 500
+    assert set(trades) <= set(data.index.get_indexer(sampled.index))
+
+
+# 测试多条曲线降采样的并集不超过目标点数（包括曲线数多于目标点数的三分之一时）
+def test_multi_series_bounded():
+    print("\n=== 测试多曲线降采样点数 ===")
+    rng = np.random.default_rng(0)
+    nav = np.cumprod(1 + rng.normal(0, 0.01, size=(50, 5000)), axis=1)
+    for n_curves, target_points in ((3, 300), (50, 1000), (50, 100), (50, 2)):
+        indices = multi_series_indices(nav[:n_curves], target_points)
+        assert len(indices) <= target_points
+        assert indices[0] == 0 and indices[-1] == nav.shape[1] - 1
+        assert (np.diff(indices) > 0).all()
+        print(f"{n_curves} 条曲线，目标 {target_points} 点，保留 {len(indices)} 点")
+
+
+if __name__ == "__main__":
+    test_downsample_bounded_and_keeps_trough()
+    test_downsample_keeps_sparse_trades()
+    test_multi_series_bounded()
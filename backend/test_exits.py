@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import EXIT_NONE, EXIT_STOP_LOSS, EXIT_TAKE_PROFIT, EXIT_TRAILING_STOP, BacktestEngine
+from conftest import make_prices
+
+COST, SLIPPAGE = 0.001, 0.0005
+
+
+def _gappy_prices(n_bars=1500, seed=3):
+    """开盘价相对前收盘大幅跳空的K线，止损止盈经常在开盘即被越过"""
+    data = make_prices(n_bars, seed=seed)
+    rng = np.random.default_rng(seed)
+    gap = np.exp(rng.normal(0, 0.04, n_bars))
+    data['开盘'] = data['收盘'].shift(1, fill_value=data['收盘'].iloc[0]) * gap
+    data['最高'] = np.maximum(data['最高'], data['开盘'])
+    data['最低'] = np.minimum(data['最低'], data['开盘'])
+    return data
+
+
+def _random_signals(index, seed=4):
+    rng = np.random.default_rng(seed)
+    signal = rng.choice([0, 1, -1], size=len(index), p=[0.9, 0.07, 0.03])
+    return pd.DataFrame({'信号': signal}, index=index)
+
+
+def _reference(data, signals, initial_capital=100000, stop_loss=None, take_profit=None, trailing_stop=None):
+    """逐K线的参考实现：每根K线先按开盘/最高/最低价检查离场，再按收盘价处理信号"""
+    opens, highs, lows, closes = (data[col].to_numpy() for col in ('开盘', '最高', '最低', '收盘'))
+    held, cash = 0, float(initial_capital)
+    entry = peak = None
+    totals, exits, exit_prices = [float(initial_capital)], [EXIT_NONE], [np.nan]
+    for i in range(1, len(data)):
+        code, price = EXIT_NONE, np.nan
+        if held > 0:
+            stop = entry * (1 - stop_loss) if stop_loss else -np.inf
+            trailing = peak * (1 - trailing_stop) if trailing_stop else -np.inf
+            level = max(stop, trailing)
+            take = entry * (1 + take_profit) if take_profit else np.inf
+            stop_hit, take_hit = lows[i] <= level, highs[i] >= take
+            # 同时触及时按止损处理，除非开盘已经跳空越过止盈价
+            if take_hit and (not stop_hit or opens[i] >= take):
+                code, price = EXIT_TAKE_PROFIT, max(opens[i], take)
+            elif stop_hit:
+                code = EXIT_TRAILING_STOP if trailing > stop else EXIT_STOP_LOSS
+                price = min(opens[i], level)
+            if code != EXIT_NONE:
+                sell = price * (1 - SLIPPAGE)
+                cash += held * sell * (1 - COST)
+                held, entry = 0, None
+            else:
+                peak = max(peak, highs[i])
+        signal = signals['信号'].iloc[i]
+        if signal == 1 and held == 0:
+            buy = closes[i] * (1 + SLIPPAGE)
+            held = int(cash / (buy * (1 + COST)))
+            if held > 0:
+                cash -= held * buy * (1 + COST)
+                entry = peak = buy
+        elif signal == -1 and held > 0:
+            cash += held * closes[i] * (1 - SLIPPAGE) * (1 - COST)
+            held, entry = 0, None
+        totals.append(held * closes[i] + cash)
+        exits.append(code)
+        exit_prices.append(price)
+    return np.array(totals), np.array(exits), np.array(exit_prices)
+
+
+# 测试跳空开盘时的止损、止盈和移动止损与逐K线参考实现一致（按开盘价成交）
+@pytest.mark.parametrize("exits", [
+    dict(stop_loss=0.03, take_profit=0.05),
+    dict(stop_loss=0.1, trailing_stop=0.04),
+    dict(take_profit=0.02, trailing_stop=0.02),
+])
+def test_gap_exits_match_reference(exits):
+    print(f"\n=== 测试跳空离场: {exits} ===")
+    data = _gappy_prices()
+    signals = _random_signals(data.index)
+    engine = BacktestEngine(data, signals=signals, transaction_cost=COST, slippage=SLIPPAGE, **exits)
+    engine.run()
+
+    totals, codes, prices = _reference(data, signals, **exits)
+    np.testing.assert_array_equal(engine.backtest_data['离场'].to_numpy(), codes)
+    np.testing.assert_allclose(engine.backtest_data['总资金'].to_numpy(), totals, rtol=1e-9)
+
+    # 确认确实出现了开盘跳空越过触发价、按开盘价成交的离场
+    hit = codes != EXIT_NONE
+    at_open = np.isclose(prices[hit], data['开盘'].to_numpy()[hit])
+    assert hit.sum() > 10
+    assert 0 < at_open.sum() < hit.sum()
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,31 @@
+import subprocess
+import sys
+
+import pytest
+
+from lazy import LazyModule
+
+
+# 测试导入main时不导入akshare和matplotlib（在子进程中检查，不受其他测试已导入的模块影响）
+def test_import_main_defers_heavy_modules():
+    print("\n=== 测试延迟导入 ===")
+    code = ("import sys, main; "
+            "print(','.join(name for name in ('akshare', 'matplotlib') if name in sys.modules) or 'none')")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip().splitlines()[-1] == "none"
+
+
+# 测试LazyModule在第一次访问属性时才导入，只导入一次
+def test_lazy_module_loads_on_first_access():
+    print("\n=== 测试LazyModule ===")
+    module = LazyModule("json")
+    assert not module.loaded
+    assert module.dumps([1]) == "[1]"
+    assert module.loaded and module.load_seconds is not None
+    assert module.load() is sys.modules["json"]
+    with pytest.raises(ModuleNotFoundError):
+        LazyModule("no_such_module_for_test").load()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
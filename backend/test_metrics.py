@@ -0,0 +1,85 @@
+import pandas as pd
+import numpy as np
+
+import metrics
+
+
+def _random_equity(n_curves=5, n_bars=300, seed=0):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0005, 0.02, size=(n_curves, n_bars - 1))
+    equity = np.ones((n_curves, n_bars))
+    equity[:, 1:] = np.cumprod(1 + returns, axis=1)
+    return equity * 100000
+
+
+# 测试批量指标与逐条pandas计算结果一致
+def test_batch_metrics_match_pandas():
+    print("\n=== 测试批量指标与pandas逐条计算一致 ===")
+    equity = _random_equity()
+    # 故意设置很小的内存预算，强制走分块路径
+    results = metrics.calculate_metrics(equity, memory_budget=1)
+
+    for i, curve in enumerate(equity):
+        total = pd.Series(curve)
+        returns = total.pct_change()
+        cumulative = (1 + returns).cumprod() - 1
+        ann_return = (1 + cumulative.iloc[-1]) ** (252 / len(total)) - 1
+        running_max = cumulative.cummax()
+        mdd = ((cumulative - running_max) / (1 + running_max)).min()
+        sharpe = ann_return / (returns.dropna().std() * np.sqrt(252))
+        print(f"曲线{i}: 年化收益率 {ann_return:.4%}, 最大回撤 {mdd:.4%}, 夏普比率 {sharpe:.4f}")
+
+        assert np.isclose(results['年化收益率'][i], ann_return)
+        assert np.isclose(results['最大回撤'][i], mdd)
+        assert np.isclose(results['夏普比率'][i], sharpe)
+
+
+# 测试回撤持续期
+def test_drawdown_duration():
+    print("\n=== 测试最大回撤持续期 ===")
+    equity = np.array([[1.0, 1.2, 1.1, 1.0, 1.3, 1.2, 1.25]])
+    duration = metrics.max_drawdown_duration(equity)
+    print(f"最大回撤持续期: {duration[0]}")
+    assert duration[0] == 2
+
+
+# 测试滚动夏普比率与pandas rolling一致
+def test_rolling_sharpe_match_pandas():
+    print("\n=== 测试滚动夏普比率与pandas rolling一致 ===")
+    returns = metrics.equity_to_returns(_random_equity(n_curves=3))
+    window = 60
+    rolling = metrics.rolling_sharpe(returns, window, memory_budget=1)
+
+    for i, row in enumerate(returns):
+        series = pd.Series(row)
+        expected = series.rolling(window).mean() / series.rolling(window).std() * np.sqrt(252)
+        assert np.allclose(rolling[i], expected.to_numpy(), equal_nan=True)
+
+
+# 测试相对基准指标与逐条pandas回归一致
+def test_relative_metrics_match_pandas():
+    print("\n=== 测试相对基准指标与pandas逐条计算一致 ===")
+    equity = _random_equity(n_curves=4)
+    benchmark = _random_equity(n_curves=1, seed=1)[0]
+    benchmark[:5] = np.nan
+    results = metrics.relative_metrics(equity, benchmark, memory_budget=1)
+
+    bench_returns = pd.Series(benchmark).pct_change()
+    for i, curve in enumerate(equity):
+        frame = pd.DataFrame({'策略': pd.Series(curve).pct_change(), '基准': bench_returns}).dropna()
+        beta = frame.cov().loc['策略', '基准'] / frame['基准'].var()
+        active = frame['策略'] - frame['基准']
+        tracking_error = active.std() * np.sqrt(252)
+        print(f"曲线{i}: 贝塔 {beta:.4f}, 跟踪误差 {tracking_error:.4%}")
+
+        assert np.isclose(results['贝塔'][i], beta)
+        assert np.isclose(results['阿尔法'][i], (frame['策略'].mean() - beta * frame['基准'].mean()) * 252)
+        assert np.isclose(results['跟踪误差'][i], tracking_error)
+        assert np.isclose(results['信息比率'][i], active.mean() * 252 / tracking_error)
+
+
+if __name__ == "__main__":
+    test_batch_metrics_match_pandas()
+    test_drawdown_duration()
+    test_rolling_sharpe_match_pandas()
+    test_relative_metrics_match_pandas()
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import optimizer
+from backtest import BacktestEngine
+from strategies import compute_signals
+
+ENGINE_KWARGS = dict(initial_capital=100000, transaction_cost=0.001, slippage=0.0005)
+
+
+def _direct_metrics(data, strategy_id, params):
+    engine = BacktestEngine(data, signals=compute_signals(data, strategy_id, **params), **ENGINE_KWARGS)
+    return engine.run(trade_logic='full')
+
+
+# 测试三种搜索方法：最优参数的绩效指标与直接回测一致，且不为最优参数额外回测
+@pytest.mark.parametrize("method", ["random", "halving", "tpe"])
+def test_search_methods(price_data, method, monkeypatch):
+    print(f"\n=== 测试参数优化: {method} ===")
+    n_bars = len(price_data)
+    calls = []
+    evaluate = optimizer._evaluate
+
+    def recording_evaluate(params, bars):
+        calls.append((tuple(sorted(params.items())), bars))
+        return evaluate(params, bars)
+
+    monkeypatch.setattr(optimizer, "_evaluate", recording_evaluate)
+    result = optimizer.optimize(price_data, 2, method=method, n_trials=12, n_workers=1, seed=0, **ENGINE_KWARGS)
+
+    # 同一组参数在同样长度的历史上只回测一次（最优参数不再重新回测）
+    assert len(calls) == len(set(calls)) == result['evaluations']
+    assert result['evaluated_bars'] == sum(bars for _, bars in calls)
+    full = [t for t in result['trials'] if t['bars'] == n_bars and np.isfinite(t['score'])]
+    assert result['best_score'] == max(t['score'] for t in full)
+    assert optimizer.PARAM_CONSTRAINTS[2](result['best_params'])
+
+    expected = _direct_metrics(price_data, 2, result['best_params'])
+    assert result['metrics'] == pytest.approx(expected, nan_ok=True)
+    assert result['best_score'] == pytest.approx(expected['夏普比率'])
+
+    if method == 'random':
+        assert result['evaluated_bars'] == 12 * n_bars
+    elif method == 'halving':
+        assert result['evaluated_bars'] < 12 * n_bars
+    else:
+        # 前缀得分较差的候选不在完整历史上评估
+        assert any(t.get('pruned') for t in result['trials'])
+
+
+# 测试相同随机种子得到相同的搜索结果
+def test_search_is_reproducible(price_data):
+    print("\n=== 测试参数优化可复现 ===")
+    first = optimizer.optimize(price_data, 3, method='tpe', n_trials=10, n_workers=1, seed=7, **ENGINE_KWARGS)
+    second = optimizer.optimize(price_data, 3, method='tpe', n_trials=10, n_workers=1, seed=7, **ENGINE_KWARGS)
+    assert first['best_params'] == second['best_params']
+    assert [t['params'] for t in first['trials']] == [t['params'] for t in second['trials']]
+    with pytest.raises(ValueError):
+        optimizer.optimize(price_data, 3, method='grid', n_workers=1)
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,97 @@
+import pandas as pd
+import numpy as np
+import pytest
+from pandas.testing import assert_frame_equal
+
+import batch
+import polars_backend
+import strategies
+from backtest import BacktestEngine, BacktestResults, run_backtest_batch
+from strategies import STRATEGY_FUNCTIONS
+
+pytest.importorskip("polars")
+
+
+def _random_prices(n_bars=1500, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, n_bars)))
+    return pd.DataFrame({'收盘': close, '最高': close * 1.01, '最低': close * 0.99},
+                        index=pd.bdate_range('2015-01-01', periods=n_bars))
+
+
+# 测试polars后端的信号和绩效指标与pandas实现一致
+def test_polars_matches_pandas():
+    print("\n=== 测试polars后端与pandas后端结果一致 ===")
+    cases = [(1, {'short_window': 5, 'long_window': 20}), (2, {}), (3, {'window': 10, 'num_std': 1.5})]
+    frames = {f"{i:06d}": _random_prices(seed=i) for i in range(3)}
+    combined = pd.concat([frame.assign(股票代码=symbol) for symbol, frame in frames.items()])
+
+    for strategy_id, params in cases:
+        grouped = polars_backend.strategy_signals(combined, strategy_id, by='股票代码', **params)
+        outputs = []
+        for symbol, frame in frames.items():
+            expected = STRATEGY_FUNCTIONS[strategy_id](frame, **params)
+            signals = grouped[combined['股票代码'].to_numpy() == symbol]
+            assert (signals['信号'].to_numpy() == expected['信号'].to_numpy()).all()
+            assert_frame_equal(signals, expected, check_exact=False, rtol=1e-10, check_freq=False)
+
+            engine = BacktestEngine(frame, signals=expected, stop_loss=0.05)
+            engine.run()
+            outputs.append((symbol, engine.results, engine.backtest_data.assign(股票代码=symbol)))
+
+        results = polars_backend.backtest_results(pd.concat([output for _, _, output in outputs]), by='股票代码')
+        for symbol, expected, _ in outputs:
+            print(f"策略{strategy_id} {symbol}: 夏普比率 {expected['夏普比率']:.4f}")
+            for key, value in expected.items():
+                assert np.isclose(results.loc[symbol, key], value, rtol=1e-10, equal_nan=True)
+
+
+def _assert_results_match(actual, expected):
+    for key in BacktestResults.FIELDS:
+        assert np.isclose(actual[key], expected[key], rtol=1e-10, equal_nan=True), (key, actual[key], expected[key])
+
+
+# 测试选择polars后端时批量回测（多策略对比）的绩效指标与pandas后端一致
+def test_batch_metrics_polars_matches_pandas():
+    print("\n=== 测试批量回测的polars绩效指标 ===")
+    data = _random_prices()
+    signal_matrix = [STRATEGY_FUNCTIONS[strategy_id](data)['信号'].to_numpy() for strategy_id in (1, 2, 3)]
+    expected, total, _ = run_backtest_batch(data, signal_matrix, backend='pandas')
+    actual, polars_total, _ = run_backtest_batch(data, signal_matrix, backend='polars')
+    np.testing.assert_array_equal(polars_total, total)
+    for results, reference in zip(actual, expected):
+        _assert_results_match(results, reference)
+
+
+# 测试QUANT_BACKEND=polars时批量回测命令行的任务指标（含止损离场）经polars计算且与pandas一致
+def test_campaign_metrics_polars_matches_pandas(monkeypatch):
+    print("\n=== 测试批量回测命令行的polars绩效指标 ===")
+    data = _random_prices().assign(开盘=lambda frame: frame['收盘'])
+    monkeypatch.setattr(batch, "get_stock_data", lambda **kwargs: data)
+    spec = {"symbols": ["000001"], "strategies": [{"id": 1, "params": [{"short_window": 5, "long_window": 20}]},
+                                                  {"id": 2}],
+            "engine": {"stop_loss": 0.03}}
+    tasks = batch.expand_tasks(spec)
+
+    calls = []
+    backtest_results = polars_backend.backtest_results
+
+    def spy(*args, **kwargs):
+        calls.append(kwargs)
+        return backtest_results(*args, **kwargs)
+
+    monkeypatch.setattr(polars_backend, "backtest_results", spy)
+    monkeypatch.setattr(strategies, "SIGNAL_BACKEND", "pandas")
+    expected = batch._run_group("000001", None, None, tasks, spec, False)
+    assert calls == []
+    monkeypatch.setattr(strategies, "SIGNAL_BACKEND", "polars")
+    actual = batch._run_group("000001", None, None, tasks, spec, False)
+    assert len(calls) == 1
+    for (_, row, _, error), (_, reference, _, _) in zip(actual, expected):
+        assert error is None
+        _assert_results_match(row, reference)
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
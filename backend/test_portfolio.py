@@ -0,0 +1,84 @@
+import pandas as pd
+import numpy as np
+
+import portfolio
+
+
+def _random_returns(n_assets=40, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range('2019-01-01', '2021-12-31')
+    factors = rng.normal(0, 0.01, size=(len(index), 2))
+    loadings = rng.normal(1, 0.5, size=(n_assets, 2))
+    returns = factors @ loadings.T + rng.normal(0, 0.015, size=(len(index), n_assets)) * rng.uniform(0.5, 2, n_assets)
+    returns[rng.random(returns.shape) < 0.01] = np.nan
+    return pd.DataFrame(returns, index=index, columns=[f"{i:06d}" for i in range(n_assets)])
+
+
+# 测试滚动协方差与直接按窗口计算的Ledoit-Wolf收缩协方差一致
+def test_rolling_covariance_matches_direct():
+    print("\n=== 测试滚动Ledoit-Wolf协方差 ===")
+    returns = _random_returns()
+    values = returns.to_numpy()
+    rolling = portfolio.RollingCovariance(values, portfolio.rebalance_positions(returns.index), lookback=6)
+    for position, mask, covariance in rolling:
+        start = rolling._blocks[0][0]
+        window = np.nan_to_num(values[start:position + 1])[:, mask]
+        centered = window - window.mean(axis=0)
+        fourth_moment = ((centered ** 2).sum(axis=1) ** 2).sum()
+        expected, _ = portfolio.ledoit_wolf(centered.T @ centered, len(window), fourth_moment)
+        assert np.allclose(covariance[np.ix_(mask, mask)], expected, rtol=1e-10, atol=0)
+    print("滚动协方差与直接计算一致")
+
+
+# 测试最小方差满足最优性条件、风险平价各股票风险贡献相等
+def test_weights_optimality():
+    print("\n=== 测试组合权重 ===")
+    returns = _random_returns()
+    min_variance = portfolio.optimize_portfolio(returns, method='min_variance')
+    risk_parity = portfolio.optimize_portfolio(returns, method='risk_parity')
+    assert np.allclose(min_variance.sum(axis=1), 1) and (min_variance.to_numpy() >= 0).all()
+    assert np.allclose(risk_parity.sum(axis=1), 1) and (risk_parity.to_numpy() >= 0).all()
+
+    *_, (_, mask, covariance) = portfolio.RollingCovariance(returns.to_numpy(),
+                                                           portfolio.rebalance_positions(returns.index))
+    weights = min_variance.iloc[-1].to_numpy()
+    gradient = covariance @ weights
+    held = weights > 0
+    variance = weights @ gradient
+    # 持仓股票的边际方差相等，未持仓股票的边际方差不低于组合方差
+    assert np.allclose(gradient[held], variance, rtol=1e-8)
+    assert (gradient[mask & ~held] >= variance * (1 - 1e-8)).all()
+
+    weights = risk_parity.iloc[-1].to_numpy()
+    contributions = weights * (covariance @ weights)
+    assert np.allclose(contributions[mask], contributions[mask].mean(), rtol=1e-6)
+    print(f"最小方差持仓 {held.sum()} 只，风险平价持仓 {mask.sum()} 只")
+
+
+# 测试低相关股票池上有效集法的迭代次数：冷启动每只持仓股票只加入一次，热启动几乎不需要迭代
+def test_min_variance_iterations_low_correlation():
+    print("\n=== 测试最小方差求解迭代次数 ===")
+    rng = np.random.default_rng(1)
+    index = pd.bdate_range('2019-01-01', '2021-12-31')
+    n_assets = 300
+    returns = rng.normal(0, 0.015, size=(len(index), n_assets)) * rng.uniform(0.5, 2, n_assets)
+    rolling = portfolio.RollingCovariance(returns, portfolio.rebalance_positions(index))
+    held = None
+    warm_updates = []
+    for _, mask, covariance in rolling:
+        sigma = covariance / np.trace(covariance) * n_assets
+        cold, cold_updates = portfolio._nonnegative_qp(sigma)
+        warm, updates = portfolio._nonnegative_qp(sigma, initial=held)
+        assert np.allclose(warm, cold, rtol=1e-10, atol=1e-12)
+        assert cold_updates <= (cold > 0).sum() + 5
+        if held is not None:
+            warm_updates.append(updates)
+        held = warm > 0
+    assert max(warm_updates) <= n_assets // 10
+    print(f"冷启动更新 {cold_updates} 次，热启动最多更新 {max(warm_updates)} 次")
+
+
+if __name__ == "__main__":
+    test_rolling_covariance_matches_direct()
+    test_weights_optimality()
+    test_min_variance_iterations_low_correlation()
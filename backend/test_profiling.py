@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+import pytest
+
+import profiling
+
+BODY = {"strategy_id": 1, "start_date": "20150101", "end_date": "20201231"}
+
+
+@pytest.fixture
+def profile_dir(monkeypatch, tmp_path):
+    """分析结果写入临时目录，测试结束后恢复PROFILE_DIR"""
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _busy_loop(seconds=0.3):
+    values = np.random.default_rng(0).normal(size=10000)
+    total = 0.0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        total += float(np.sort(values)[0])
+    return total
+
+
+# 测试性能分析结果包含热点函数、折叠调用栈和内存分配位置，并可以重新读取
+def test_profile_run_saves_results(profile_dir):
+    print("\n=== 测试按需性能分析 ===")
+    with profiling.profile_run('test', {"strategy_id": 1}, interval=0.002) as summary:
+        _busy_loop()
+    assert summary["samples"] > 10
+
+    profile = profiling.load_profile(summary["id"])
+    functions = {item["function"]: item for item in profile["top_functions"]}
+    assert functions["test_profiling.py:_busy_loop"]["total_percent"] > 90
+    assert profile["allocations"]
+    collapsed = profiling.load_collapsed(summary["id"])
+    assert "test_profiling.py:test_profile_run_saves_results;test_profiling.py:_busy_loop" in collapsed
+    assert [item["id"] for item in profiling.list_profiles()] == [summary["id"]]
+    print(f"采样 {summary['samples']} 次，峰值内存 {summary['peak_memory_kb']} KB")
+
+
+# 测试布置的分析次数用完后不再分析
+def test_arm_and_take():
+    print("\n=== 测试布置分析次数 ===")
+    assert profiling.arm(2, interval=0.01) == 2
+    assert profiling.take() == 0.01
+    assert profiling.take() == 0.01
+    assert profiling.take() is None
+    assert profiling.armed_runs() == 0
+
+
+# 测试未启用性能分析时忽略X-Profile-Token请求头，正常返回回测结果
+def test_token_header_ignored_when_disabled(api_client, profile_dir, monkeypatch):
+    print("\n=== 测试未启用时忽略分析令牌 ===")
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", None)
+    response = api_client.post("/api/backtest", json=BODY, headers={"X-Profile-Token": "anything"})
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+    assert not list(profile_dir.iterdir())
+
+
+# 测试启用性能分析时令牌无效返回403，令牌有效时分析本次回测
+def test_token_header_when_enabled(api_client, profile_dir, monkeypatch):
+    print("\n=== 测试启用时的分析令牌 ===")
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    assert api_client.post("/api/backtest", json=BODY, headers={"X-Profile-Token": "wrong"}).status_code == 403
+    response = api_client.post("/api/backtest", json=BODY, headers={"X-Profile-Token": "secret"})
+    assert response.status_code == 200
+    assert profiling.load_profile(response.headers["x-profile-id"])["samples"] > 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
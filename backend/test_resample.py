@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from resample import FIRST_BAR_COL, LAST_BAR_COL, TimeframeCache, align_to, resample_ohlcv
+from store import BarStore
+
+
+# 测试align_to只让每根基础K线看到截止时间不晚于自身的聚合K线
+def test_align_to_has_no_lookahead(price_data):
+    print("\n=== 测试聚合K线对齐 ===")
+    weekly = resample_ohlcv(price_data, 'weekly')
+    aligned = align_to(weekly, price_data.index, columns=['收盘'])
+    assert aligned.index.equals(price_data.index)
+    # 第一周走完之前没有可用的周线
+    first_week_end = weekly[LAST_BAR_COL].iloc[0]
+    assert aligned.loc[:first_week_end - pd.Timedelta(days=1), '收盘'].isna().all()
+    for timestamp in price_data.index[::97]:
+        visible = weekly[weekly[LAST_BAR_COL] <= timestamp]
+        if len(visible) > 0:
+            assert aligned.at[timestamp, '收盘'] == visible['收盘'].iloc[-1]
+    # 每周最后一根K线看到的就是本周的周线
+    assert (aligned.loc[weekly[LAST_BAR_COL], '收盘'].to_numpy() == weekly['收盘'].to_numpy()).all()
+
+
+# 测试TimeframeCache的增量更新、向前扩展和价格变化后的全量重建
+def test_timeframe_cache(tmp_path, price_data):
+    print("\n=== 测试聚合K线缓存 ===")
+    cache = TimeframeCache(BarStore(str(tmp_path)))
+
+    def check(base):
+        bars = cache.get('000001', 'daily', 'weekly', base)
+        expected = resample_ohlcv(base, 'weekly')
+        pd.testing.assert_frame_equal(bars[expected.columns], expected, check_freq=False)
+
+    check(price_data.iloc[200:800])
+    # 新增K线：最后一个未走完的周期被重新聚合
+    check(price_data.iloc[200:1003])
+    # 向前扩展：全量重建
+    check(price_data.iloc[100:1003])
+
+    # 重启后从磁盘读取
+    restarted = TimeframeCache(BarStore(str(tmp_path)))
+    pd.testing.assert_frame_equal(restarted.get('000001', 'daily', 'weekly', price_data.iloc[100:1003]),
+                                  cache.get('000001', 'daily', 'weekly', price_data.iloc[100:1003]),
+                                  check_freq=False)
+
+    # 前复权除权：较早的价格整体变化
+    adjusted = price_data.iloc[100:1003].copy()
+    adjusted.loc[:adjusted.index[500], ['开盘', '收盘', '最高', '最低']] *= 0.9
+    check(adjusted)
+
+    # 只有最近的K线变化（重叠部分的第一根不变），也要全量重建
+    revised = adjusted.copy()
+    revised.loc[revised.index[-20]:, ['开盘', '收盘', '最高', '最低']] *= 1.05
+    check(revised)
+
+
+# 测试不相连的请求范围不会在缓存中留下缺口：先后请求两段不相连的K线，再请求完整范围
+def test_timeframe_cache_gap(tmp_path, price_data):
+    print("\n=== 测试聚合K线缓存的缺口 ===")
+    cache = TimeframeCache(BarStore(str(tmp_path)))
+    cache.get('000001', 'daily', 'weekly', price_data.iloc[0:300])
+    cache.get('000001', 'daily', 'weekly', price_data.iloc[800:1000])
+    base = price_data.iloc[0:1000]
+    bars = cache.get('000001', 'daily', 'weekly', base)
+    expected = resample_ohlcv(base, 'weekly')
+    assert len(bars) == len(expected) == 201
+    pd.testing.assert_frame_equal(bars[expected.columns], expected, check_freq=False)
+    # 相邻聚合K线之间没有遗漏的基础K线
+    starts = base.index.get_indexer(bars[FIRST_BAR_COL])
+    ends = base.index.get_indexer(bars[LAST_BAR_COL])
+    assert (starts[1:] == ends[:-1] + 1).all()
+
+    restarted = TimeframeCache(BarStore(str(tmp_path)))
+    pd.testing.assert_frame_equal(restarted.get('000001', 'daily', 'weekly', base), bars, check_freq=False)
+
+
+# 测试不同复权方式分别缓存，复权因子版本变化时全量重建（包括重启后）
+def test_timeframe_cache_adjust_and_version(tmp_path, price_data):
+    print("\n=== 测试聚合K线缓存的复权方式和版本 ===")
+    cache = TimeframeCache(BarStore(str(tmp_path)))
+    raw = price_data.iloc[:600]
+    qfq = raw.copy()
+    qfq[['开盘', '收盘', '最高', '最低']] *= 0.8
+    for _ in range(2):
+        pd.testing.assert_frame_equal(cache.get('000001', 'daily', 'weekly', raw, 'none'),
+                                      resample_ohlcv(raw, 'weekly'), check_freq=False)
+        pd.testing.assert_frame_equal(cache.get('000001', 'daily', 'weekly', qfq, 'qfq', 'v1'),
+                                      resample_ohlcv(qfq, 'weekly'), check_freq=False)
+
+    # 只有中间K线的价格变化时比较首尾两根发现不了，由版本变化触发重建
+    revised = qfq.copy()
+    revised.iloc[100:500, revised.columns.get_loc('收盘')] *= 0.9
+    restarted = TimeframeCache(BarStore(str(tmp_path)))
+    pd.testing.assert_frame_equal(restarted.get('000001', 'daily', 'weekly', revised, 'qfq', 'v2'),
+                                  resample_ohlcv(revised, 'weekly'), check_freq=False)
+    assert BarStore(str(tmp_path)).version('000001', 'daily-qfq@weekly') == 'v2'
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
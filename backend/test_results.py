@@ -0,0 +1,72 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import BacktestEngine, BacktestResults, compact_frame
+from strategies import compute_signals, INTERMEDIATE_COLUMNS
+
+ENGINE_KWARGS = dict(initial_capital=100000, transaction_cost=0.001, slippage=0.0005, periods_per_year=252)
+
+
+@pytest.fixture
+def engine(price_data):
+    data = price_data.assign(股票代码="000001")
+    engine = BacktestEngine(data, signals=compute_signals(data, 1), **ENGINE_KWARGS)
+    engine.run()
+    return engine
+
+
+# 测试绩效指标按中文指标名的映射接口，与dict用法一致
+def test_results_mapping(engine):
+    print("\n=== 测试绩效指标映射接口 ===")
+    results = engine.results
+    assert isinstance(results, BacktestResults)
+    assert list(results) == list(BacktestResults.FIELDS)
+    assert len(results) == len(BacktestResults.FIELDS)
+    assert dict(results) == results.to_dict()
+    assert results['最终资金'] == results.final_capital
+    assert results.get('不存在的指标') is None
+    assert '夏普比率' in results and '不存在的指标' not in results
+    assert all(type(value) is float for value in results.values())
+    with pytest.raises(KeyError):
+        results['不存在的指标']
+    with pytest.raises(AttributeError):
+        results.extra = 1.0
+
+
+# 测试绩效指标经pickle往返（批量回测的进程间传递）后不变，NaN指标同样保留
+def test_results_pickle_round_trip(engine):
+    print("\n=== 测试绩效指标pickle往返 ===")
+    restored = pickle.loads(pickle.dumps(engine.results))
+    assert isinstance(restored, BacktestResults)
+    assert restored.to_dict() == engine.results.to_dict()
+
+    values = dict(engine.results.to_dict(), 盈亏比=np.nan)
+    results = BacktestResults(*values.values())
+    restored = pickle.loads(pickle.dumps(results))
+    assert np.isnan(restored['盈亏比'])
+    assert restored['夏普比率'] == results['夏普比率']
+
+
+# 测试紧凑回测数据不依赖完整回测数据，且与对完整数据做compact_frame的结果一致
+def test_compact_data_skips_full_frame(engine):
+    print("\n=== 测试紧凑回测数据 ===")
+    compact = engine.compact_data()
+    assert engine._backtest_data is None
+    pd.testing.assert_frame_equal(compact, compact_frame(engine.backtest_data))
+    assert '股票代码' not in compact.columns
+    assert not set(INTERMEDIATE_COLUMNS) & set(compact.columns)
+    assert compact['收盘'].dtype == np.float32 and compact['总资金'].dtype == np.float64
+    assert compact['信号'].dtype == np.int8
+
+    # 再次回测后完整回测数据重新拼接
+    first = engine.backtest_data
+    engine.run(trade_logic='percent', trade_param={'percent': 0.5})
+    assert engine.backtest_data is not first
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
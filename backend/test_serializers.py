@@ -0,0 +1,90 @@
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import serializers
+from backtest import BacktestResults
+
+pytest.importorskip("pyarrow")
+
+BODY = {"strategy_id": 2, "start_date": "20150101", "end_date": "20201231"}
+
+
+# 测试Accept-Encoding协商：按q值选择，q=0的编码被排除，q值相同时优先zstd
+def test_negotiate_compression():
+    print("\n=== 测试压缩方式协商 ===")
+    assert serializers.negotiate_compression(None) is None
+    assert serializers.negotiate_compression("gzip, zstd") == "zstd"
+    assert serializers.negotiate_compression("zstd;q=0.5, gzip") == "gzip"
+    assert serializers.negotiate_compression("zstd;q=0, gzip;q=0") is None
+    assert serializers.negotiate_compression("br, deflate") is None
+
+
+# 测试Arrow IPC在不压缩、zstd和gzip三种方式下都能还原原始数据
+def test_arrow_round_trip(price_data):
+    print("\n=== 测试Arrow IPC序列化往返 ===")
+    frame = price_data.astype({'收盘': np.float32}).assign(信号=np.int8(0))
+    for compression in (None, "zstd", "gzip"):
+        chunks = list(serializers.iter_arrow_ipc(frame, compression=compression, batch_rows=256))
+        assert len(chunks) > 2
+        payload = b"".join(chunks)
+        if compression == "gzip":
+            payload = gzip.decompress(payload)
+        restored = serializers.read_arrow_ipc(payload)
+        pd.testing.assert_frame_equal(restored, frame, check_freq=False)
+        print(f"{compression}: {len(b''.join(chunks))} 字节")
+
+
+# 测试/api/backtest/series按协商结果压缩，返回完整的紧凑回测数据
+def test_series_endpoint_compression(api_client):
+    print("\n=== 测试/api/backtest/series压缩协商 ===")
+    plain = api_client.post("/api/backtest/series", json=BODY)
+    assert plain.status_code == 200
+    assert plain.headers["content-type"] == serializers.ARROW_STREAM_MEDIA_TYPE
+    expected = serializers.read_arrow_ipc(plain.content)
+    assert len(expected) == 1500
+    assert expected['信号'].dtype == np.int8
+
+    zstd = api_client.post("/api/backtest/series", json=BODY, headers={"Accept-Encoding": "zstd"})
+    assert zstd.headers["x-arrow-compression"] == "zstd"
+    assert "content-encoding" not in zstd.headers
+    pd.testing.assert_frame_equal(serializers.read_arrow_ipc(zstd.content), expected)
+
+    # 测试客户端会自动解压Content-Encoding: gzip的响应
+    gzipped = api_client.post("/api/backtest/series", json={**BODY, "columns": ['总资金']},
+                              headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["content-encoding"] == "gzip"
+    pd.testing.assert_frame_equal(serializers.read_arrow_ipc(gzipped.content), expected[['总资金']])
+
+
+# 测试dumps_json将NaN和无穷大编码为null（orjson和标准库两种实现结果一致）
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_dumps_json_nan_to_null(monkeypatch, use_orjson):
+    print("\n=== 测试JSON编码NaN ===")
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(serializers, "orjson", None)
+    results = BacktestResults(100000, 120000, 0.2, 0.05, -0.1, np.nan, 0.5, np.inf)
+    content = {
+        "metrics": results,
+        "values": [1.5, float("nan"), float("-inf")],
+        "array": np.array([np.nan, 2.0]),
+        "scalar": np.float32("nan"),
+        "count": np.int64(3),
+    }
+    decoded = json.loads(serializers.dumps_json(content))
+    assert decoded["metrics"]["夏普比率"] is None and decoded["metrics"]["盈亏比"] is None
+    assert decoded["metrics"]["最终资金"] == 120000
+    assert decoded["values"] == [1.5, None, None]
+    assert decoded["array"] == [None, 2.0]
+    assert decoded["scalar"] is None
+    assert decoded["count"] == 3
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
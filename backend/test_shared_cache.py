@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+import main
+from shared_cache import SharedCache
+
+
+# 测试超过条目数上限时删除最早写入的条目，过期条目读不到并会被prune删除
+def test_eviction_and_expiry(tmp_path):
+    print("\n=== 测试共享缓存淘汰 ===")
+    cache = SharedCache(str(tmp_path / "cache.sqlite3"), max_entries=5)
+    for i in range(8):
+        cache.set('prices', ('000001', i), i)
+        time.sleep(0.002)
+    assert [cache.get('prices', ('000001', i)) for i in range(8)] == [None, None, None, 3, 4, 5, 6, 7]
+
+    cache.set('signals', 'stale', 'x', ttl=-1)
+    assert cache.get('signals', 'stale') is None
+    cache.prune()
+    count = cache._connect().execute("SELECT COUNT(*) FROM entries WHERE namespace = 'signals'").fetchone()[0]
+    assert count == 0
+
+    cache.clear('prices')
+    assert cache.get('prices', ('000001', 7)) is None
+
+
+# 测试跨进程锁：持有期间其他调用方等待，租约过期后可以获取，get_or_compute只计算一次
+def test_lock_and_get_or_compute(tmp_path):
+    print("\n=== 测试共享缓存锁 ===")
+    cache = SharedCache(str(tmp_path / "cache.sqlite3"))
+    events = []
+
+    def holder():
+        with cache.lock("bars:000001") as acquired:
+            events.append(("held", acquired))
+            time.sleep(0.3)
+            events.append(("released", True))
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    time.sleep(0.1)
+    with cache.lock("bars:000001") as acquired:
+        events.append(("second", acquired))
+    thread.join()
+    assert events == [("held", True), ("released", True), ("second", True)]
+
+    # 等待超时后不加锁继续执行
+    with cache.lock("other", lease=60):
+        with cache.lock("other", timeout=0.1) as acquired:
+            assert not acquired
+    # 持有者未释放（如进程崩溃）时，租约过期后即可获取
+    stuck = cache.lock("crashed", lease=0.1)
+    assert stuck.__enter__()
+    time.sleep(0.15)
+    with cache.lock("crashed", timeout=1) as acquired:
+        assert acquired
+
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return "value"
+
+    threads = [threading.Thread(target=cache.get_or_compute, args=('prices', 'key', compute)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert cache.get('prices', 'key') == "value"
+
+
+# 测试启动预热使用的参数与默认回测请求一致（命中同一个价格缓存键）
+def test_warm_up_matches_default_request(api_client, monkeypatch):
+    print("\n=== 测试启动预热参数 ===")
+    calls = []
+    fake = main.get_stock_data
+
+    def recording_get_stock_data(**kwargs):
+        calls.append(kwargs)
+        return fake(**kwargs)
+
+    monkeypatch.setattr(main, "get_stock_data", recording_get_stock_data)
+    monkeypatch.setattr(main, "WARMUP_SYMBOLS", ["000001"])
+    monkeypatch.setattr(main, "PREWARM", False)
+    main._warm_up()
+    assert api_client.post("/api/backtest", json={"strategy_id": 2}).status_code == 200
+    assert len(calls) == 2
+    assert calls[0] == calls[1]
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,48 @@
+import subprocess
+import sys
+
+import pandas as pd
+
+import data
+from backtest import BacktestEngine
+from resample import resample_ohlcv
+from strategies import STRATEGY_FUNCTIONS, SharedIndicators, compute_signals, trend_filter
+
+
+# 测试导入data模块即开启copy-on-write，批量回测、流式推送和参数优化等入口不依赖main.py
+def test_copy_on_write_enabled_for_all_entry_points():
+    print("\n=== 测试各入口开启copy-on-write ===")
+    assert pd.get_option("mode.copy_on_write") is True
+    for module in ("batch", "streaming"):
+        output = subprocess.run(
+            [sys.executable, "-c", f"import pandas as pd, {module}; print(pd.get_option('mode.copy_on_write'))"],
+            capture_output=True, text=True, check=True
+        ).stdout
+        assert output.strip().splitlines()[-1] == "True", module
+
+
+# 测试策略、趋势过滤和回测引擎都不修改共享的价格数据
+def test_strategies_and_engine_do_not_mutate_shared_frame(price_data):
+    print("\n=== 测试共享价格数据只读 ===")
+    key = ("000001", "20150101", "20201231", "qfq")
+    data._set_cached_frame(key, price_data)
+    shared = data._get_cached_frame(key)
+    original = shared.copy(deep=True)
+
+    indicators = SharedIndicators(shared['收盘'])
+    for strategy_id, strategy in STRATEGY_FUNCTIONS.items():
+        signals = compute_signals(shared, strategy_id, indicators=indicators)
+        signals = trend_filter(signals, resample_ohlcv(shared, 'weekly'))
+        engine = BacktestEngine(shared, signals=signals, stop_loss=0.05, trailing_stop=0.1)
+        engine.run(trade_logic='full')
+        engine.compact_data()
+        strategy(shared)
+
+    assert data._get_cached_frame(key) is shared
+    pd.testing.assert_frame_equal(shared, original, check_exact=True)
+    data.clear_cache()
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
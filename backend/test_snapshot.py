@@ -0,0 +1,158 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+from backtest import BacktestEngine
+from shared_cache import shared_cache
+from strategies import rsi_strategy, warmup_bars
+
+KEY = ("000001", "20150101", "daily", "qfq", 2, None, (("trailing_stop", 0.1),))
+ENGINE_KWARGS = {'trailing_stop': 0.1}
+WARMUP = warmup_bars(rsi_strategy)
+
+
+def _engine(data):
+    return BacktestEngine(data, signals=rsi_strategy(data), **ENGINE_KWARGS)
+
+
+def _assert_same_results(actual, expected):
+    # 收益率均值和标准差分段合并，与一次性计算只有浮点舍入上的差别
+    for key, value in expected.items():
+        assert np.isclose(actual[key], value, rtol=1e-12, equal_nan=True), key
+
+
+def _tail_signals(snapshot, data):
+    """用快照的K线窗口预热指标，只生成新增K线的信号"""
+    frame = pd.concat([snapshot.window, data.iloc[len(snapshot):]])
+    return rsi_strategy(frame).iloc[len(snapshot.window):]
+
+
+@pytest.fixture
+def signal_frames():
+    """清空快照并记录_run_with_snapshot每次生成信号的K线数"""
+    shared_cache.clear('snapshots')
+    frames = []
+
+    def signals_for(frame):
+        frames.append(len(frame))
+        return rsi_strategy(frame)
+
+    return frames, signals_for
+
+
+# 测试结束日期两次延长后从快照继续回测：输出列与完整回测逐位一致，快照不保存输出列
+def test_resume_from_snapshot():
+    print("\n=== 测试从快照继续回测 ===")
+    rng = np.random.default_rng(11)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, 1000)))
+    data = pd.DataFrame({'收盘': close, '最高': close * 1.01, '最低': close * 0.99},
+                        index=pd.bdate_range('2020-01-01', periods=1000))
+
+    partial = _engine(data.iloc[:600])
+    partial.run(trade_logic='full')
+    snapshot = partial.snapshot(window=WARMUP)
+    assert len(snapshot) == 600 and len(snapshot.window) == WARMUP
+    assert len(pickle.dumps(snapshot)) < len(pickle.dumps(partial.output)) / 5
+
+    middle = BacktestEngine(data.iloc[:800], signals=_tail_signals(snapshot, data.iloc[:800]), **ENGINE_KWARGS)
+    middle.resume(snapshot, trade_logic='full')
+    snapshot = middle.snapshot(window=WARMUP)
+
+    full = _engine(data)
+    expected = full.run(trade_logic='full')
+    signals = _tail_signals(snapshot, data)
+    pd.testing.assert_series_equal(signals['信号'], full.signals['信号'].iloc[800:])
+    resumed = BacktestEngine(data, signals=signals, **ENGINE_KWARGS)
+    results = resumed.resume(snapshot, trade_logic='full')
+
+    pd.testing.assert_frame_equal(resumed.output, full.output, check_exact=True)
+    _assert_same_results(results, expected)
+
+    # 只包含新增K线的信号不能用于完整回测，参数不同的快照不可用
+    with pytest.raises(ValueError, match="部分K线"):
+        resumed.run()
+    with pytest.raises(ValueError, match="回测参数"):
+        BacktestEngine(data, signals=signals, trailing_stop=0.2).resume(snapshot)
+
+
+# 测试_run_with_snapshot：延长时只为新增K线生成信号并保存更长的快照（带有效期），缩短或相同时完整回测且不覆盖快照
+def test_run_with_snapshot_extends_and_shrinks(price_data, signal_frames, monkeypatch):
+    print("\n=== 测试快照的保存和使用 ===")
+    frames, signals_for = signal_frames
+    ttls = []
+    set_entry = shared_cache.set
+
+    def recording_set(namespace, key, value, ttl=None):
+        ttls.append((namespace, ttl))
+        return set_entry(namespace, key, value, ttl=ttl)
+
+    monkeypatch.setattr(shared_cache, "set", recording_set)
+    main._run_with_snapshot(price_data.iloc[:700], KEY, signals_for, ENGINE_KWARGS, warmup=WARMUP)
+    assert shared_cache.get('snapshots', KEY).end == price_data.index[699]
+    assert ttls == [('snapshots', main.SNAPSHOT_TTL)]
+
+    engine = main._run_with_snapshot(price_data, KEY, signals_for, ENGINE_KWARGS, warmup=WARMUP)
+    assert frames == [700, WARMUP + len(price_data) - 700]
+    full = _engine(price_data)
+    _assert_same_results(engine.results, full.run())
+    pd.testing.assert_frame_equal(engine.output, full.output, check_exact=True)
+    assert shared_cache.get('snapshots', KEY).end == price_data.index[-1]
+
+    # 缩短结束日期：不使用也不覆盖覆盖范围更长的快照
+    shorter = main._run_with_snapshot(price_data.iloc[:900], KEY, signals_for, ENGINE_KWARGS, warmup=WARMUP)
+    assert frames[-1] == 900
+    _assert_same_results(shorter.results, _engine(price_data.iloc[:900]).run())
+    assert shared_cache.get('snapshots', KEY).end == price_data.index[-1]
+
+    # 相同结束日期：直接完整回测，快照保持不变
+    main._run_with_snapshot(price_data, KEY, signals_for, ENGINE_KWARGS, warmup=WARMUP)
+    assert frames[-1] == len(price_data)
+    assert len(ttls) == 2
+
+
+# 测试快照之前的价格变化（如除权后前复权价格整体调整）时退回完整回测并替换快照
+def test_run_with_snapshot_digest_mismatch(price_data, signal_frames):
+    print("\n=== 测试快照摘要不一致 ===")
+    frames, signals_for = signal_frames
+    main._run_with_snapshot(price_data.iloc[:700], KEY, signals_for, ENGINE_KWARGS, warmup=WARMUP)
+    old_digest = shared_cache.get('snapshots', KEY).digest
+
+    adjusted = price_data.copy()
+    adjusted.loc[:adjusted.index[300], ['开盘', '收盘', '最高', '最低']] *= 0.95
+    engine = main._run_with_snapshot(adjusted, KEY, signals_for, ENGINE_KWARGS, warmup=WARMUP)
+    assert frames == [700, len(adjusted)]
+    _assert_same_results(engine.results, _engine(adjusted).run())
+    snapshot = shared_cache.get('snapshots', KEY)
+    assert snapshot.end == adjusted.index[-1] and snapshot.digest != old_digest
+
+
+# 测试/api/backtest延长结束日期时从快照继续，指标与完整回测一致，图表覆盖完整区间
+def test_backtest_api_resumes(api_client, price_data, monkeypatch):
+    print("\n=== 测试回测接口从快照继续 ===")
+    resumed = []
+    resume = BacktestEngine.resume
+
+    def recording_resume(self, snapshot, **kwargs):
+        resumed.append(len(self.data) - len(snapshot))
+        return resume(self, snapshot, **kwargs)
+
+    monkeypatch.setattr(BacktestEngine, "resume", recording_resume)
+    body = {"strategy_id": 2, "start_date": "20150101", "trailing_stop": 0.1}
+    api_client.post("/api/backtest", json={**body, "end_date": "20181231"})
+    payload = api_client.post("/api/backtest", json={**body, "end_date": "20201231"}).json()
+    assert resumed == [len(price_data.loc['2019-01-01':'2020-12-31'])]
+
+    shared_cache.clear()
+    expected = api_client.post("/api/backtest", json={**body, "end_date": "20201231"}).json()
+    assert len(resumed) == 1
+    for key, value in expected["metrics"].items():
+        assert np.isclose(payload["metrics"][key], value, rtol=1e-12, equal_nan=True), key
+    assert payload["charts"] == expected["charts"]
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data
+from conftest import make_prices
+from store import BarStore
+
+
+def _minute_bars(start, days, period_minutes=30):
+    """模拟分钟线：每个交易日上午、下午各若干根"""
+    times = []
+    for day in pd.bdate_range(start, periods=days):
+        times.extend(pd.date_range(day + pd.Timedelta(hours=10), periods=4, freq=f"{period_minutes}min"))
+        times.extend(pd.date_range(day + pd.Timedelta(hours=13, minutes=30), periods=4, freq=f"{period_minutes}min"))
+    prices = make_prices(len(times), seed=1)
+    return prices.set_axis(pd.DatetimeIndex(times, name='日期'))
+
+
+# 测试BarStore的写入、合并去重、拉取区间记录、按月分块读取和截断
+def test_bar_store(tmp_path):
+    print("\n=== 测试本地K线存储 ===")
+    store = BarStore(str(tmp_path))
+    bars = _minute_bars('2024-01-02', 60)
+    assert store.coverage('000001', '30') is None
+    assert len(store.read('000001', '30')) == 0
+
+    store.write('000001', '30', bars.iloc[:300], start=pd.Timestamp('2024-01-01'), end=bars.index[299])
+    # 与已有数据重叠的部分以新数据为准
+    updated = bars.iloc[200:].assign(收盘=bars['收盘'].iloc[200:] * 2)
+    store.write('000001', '30', updated)
+    expected = pd.concat([bars.iloc[:200], updated])
+    pd.testing.assert_frame_equal(store.read('000001', '30'), expected, check_freq=False)
+    assert store.coverage('000001', '30') == (pd.Timestamp('2024-01-01'), bars.index[-1])
+    assert store.partitions('000001', '30') == ['2024-01', '2024-02', '2024-03']
+
+    chunks = list(store.iter_chunks('000001', '30', pd.Timestamp('2024-01-15'), pd.Timestamp('2024-02-20')))
+    assert [chunk.index[0].month for chunk in chunks] == [1, 2]
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected.loc[pd.Timestamp('2024-01-15'):pd.Timestamp('2024-02-20')], check_freq=False)
+
+    store.truncate('000001', '30', pd.Timestamp('2024-02-10'))
+    assert store.read('000001', '30').index[-1] < pd.Timestamp('2024-02-10')
+    assert store.partitions('000001', '30') == ['2024-01', '2024-02']
+
+    # 结束时间早于开始时间时只写数据，不记录拉取区间
+    store.write('000002', '30', bars.iloc[:10], start=bars.index[10], end=bars.index[0])
+    assert store.coverage('000002', '30') is None
+
+
+# 测试_ensure_bars只拉取未覆盖的区间，取数为空的交易日区间不记为已拉取
+def test_ensure_bars_skips_empty_fetch(tmp_path, monkeypatch):
+    print("\n=== 测试拉取区间记录 ===")
+    monkeypatch.setattr(data, "_bar_store", BarStore(str(tmp_path)))
+    bars = _minute_bars('2024-01-02', 40)
+    calls = []
+
+    def fetch(start, end):
+        calls.append((start, end))
+        return bars.loc[start:end] if len(calls) > 1 else pd.DataFrame()
+
+    start, end = pd.Timestamp('2024-01-02'), pd.Timestamp('2024-02-02 23:59:59')
+    data._ensure_bars('000001', '30', start, end, fetch)
+    assert data._bar_store.coverage('000001', '30') is None
+
+    # 上一次没有取到数据，重新拉取整个区间
+    data._ensure_bars('000001', '30', start, end, fetch)
+    assert calls[1] == (start, end)
+    assert data._bar_store.coverage('000001', '30') == (start, end)
+    assert len(data._bar_store.read('000001', '30')) == len(bars.loc[start:end])
+
+    # 已覆盖的区间不再拉取；周末没有数据属于正常情况，照常记录
+    data._ensure_bars('000001', '30', start, end, fetch)
+    assert len(calls) == 2
+    weekend_end = pd.Timestamp('2024-02-04 23:59:59')  # 2月2日为周五
+    data._ensure_bars('000001', '30', start, weekend_end, lambda s, e: pd.DataFrame())
+    assert data._bar_store.coverage('000001', '30') == (start, weekend_end)
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,196 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import streaming
+from main import BacktestRequest
+
+
+class RecordingChannel:
+    """记录计算线程发出的消息（代替StreamChannel）"""
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(message)
+
+    def progress(self, message):
+        pass
+
+
+@pytest.fixture
+def fake_prices(monkeypatch, price_data):
+    monkeypatch.setattr(streaming, "get_stock_data", lambda **kwargs: price_data)
+    monkeypatch.setattr(streaming, "factor_version", lambda *args, **kwargs: None)
+    return price_data
+
+
+# 测试排行榜排序：夏普比率为0的组合排在负值之前，缺失值和NaN排在最后
+def test_leaderboard_sort_keeps_zero():
+    print("\n=== 测试排行榜排序 ===")
+    entries = [{"metrics": {"夏普比率": value}} for value in (None, -0.5, 0.0, float('nan'), 1.2)]
+    entries.sort(key=lambda item: streaming._sort_value(item["metrics"], "夏普比率"), reverse=True)
+    ranked = [item["metrics"]["夏普比率"] for item in entries]
+    assert ranked[:3] == [1.2, 0.0, -0.5]
+    assert ranked[3] is None or np.isnan(ranked[3])
+
+
+# 测试参数扫描与单次流式回测一样使用高周期趋势过滤
+def test_sweep_honours_trend_timeframe(fake_prices):
+    print("\n=== 测试参数扫描的趋势过滤 ===")
+    request = BacktestRequest(strategy_id=2, start_date="20150101", trend_timeframe="weekly")
+    single = RecordingChannel()
+    streaming.run_backtest_stream(request, single)
+    expected = single.messages[-1]["metrics"]
+
+    sweep = RecordingChannel()
+    streaming.run_sweep_stream(request, {"rsi_period": [14]}, sweep)
+    assert sweep.messages[-1]["leaderboard"][0]["metrics"] == pytest.approx(expected, nan_ok=True)
+
+    unfiltered = RecordingChannel()
+    streaming.run_sweep_stream(request.model_copy(update={"trend_timeframe": None}), {"rsi_period": [14]}, unfiltered)
+    assert unfiltered.messages[-1]["leaderboard"][0]["metrics"] != sweep.messages[-1]["leaderboard"][0]["metrics"]
+
+
+@pytest.fixture
+def stream_client(api_client, monkeypatch, price_data):
+    """WebSocket测试客户端：流式回测的行情数据来自price_data"""
+    monkeypatch.setattr(streaming, "get_stock_data", lambda **kwargs: price_data)
+    return api_client
+
+
+def _receive_all(websocket):
+    """读取消息直到done或error"""
+    messages = []
+    while True:
+        message = websocket.receive_json()
+        messages.append(message)
+        if message["type"] in ("done", "error"):
+            return messages
+
+
+# 测试/api/ws/backtest的消息顺序：先进度，再按顺序的净值曲线分块，然后结果，最后done
+def test_ws_backtest_message_order(stream_client, price_data):
+    print("\n=== 测试流式回测消息顺序 ===")
+    with stream_client.websocket_connect("/api/ws/backtest") as websocket:
+        websocket.send_json({"type": "backtest", "strategy_id": 2, "start_date": "20150101"})
+        messages = _receive_all(websocket)
+
+    assert messages[0]["type"] == "progress"
+    data_messages = [message for message in messages if message["type"] != "progress"]
+    types = [message["type"] for message in data_messages]
+    n_chunks = -(-len(price_data) // streaming.DEFAULT_CHUNK_BARS)
+    assert types == ["equity_chunk"] * n_chunks + ["result", "done"]
+    offsets = [message["offset"] for message in data_messages[:n_chunks]]
+    assert offsets == list(range(0, len(price_data), streaming.DEFAULT_CHUNK_BARS))
+    assert sum(len(message["dates"]) for message in data_messages[:n_chunks]) == len(price_data)
+
+    expected = RecordingChannel()
+    streaming.run_backtest_stream(BacktestRequest(strategy_id=2, start_date="20150101"), expected)
+    assert data_messages[-2]["metrics"] == pytest.approx(expected.messages[-1]["metrics"], nan_ok=True)
+
+
+# 测试参数扫描的错误帧：缺少grid在开始前报错，无效的参数名在计算线程中报错，之后连接关闭
+def test_ws_sweep_error_frames(stream_client):
+    print("\n=== 测试参数扫描错误帧 ===")
+    with stream_client.websocket_connect("/api/ws/backtest") as websocket:
+        websocket.send_json({"type": "sweep", "strategy_id": 2, "start_date": "20150101"})
+        assert websocket.receive_json() == {"type": "error", "detail": "参数扫描需要提供grid"}
+
+    with stream_client.websocket_connect("/api/ws/backtest") as websocket:
+        websocket.send_json({"type": "sweep", "strategy_id": 2, "start_date": "20150101",
+                             "grid": {"no_such_param": [1, 2]}})
+        messages = _receive_all(websocket)
+    assert messages[-1]["type"] == "error" and messages[-1]["detail"]
+    assert all(message["type"] == "progress" for message in messages[:-1])
+
+    with stream_client.websocket_connect("/api/ws/backtest") as websocket:
+        websocket.send_json({"type": "sweep", "strategy_id": 2, "start_date": "20150101",
+                             "grid": {"rsi_period": list(range(1000))}})
+        assert "参数组合过多" in _receive_all(websocket)[-1]["detail"]
+
+
+# 测试客户端断开后计算线程停止，不再继续扫描剩余的参数组合
+def test_ws_disconnect_cancels_sweep(stream_client, monkeypatch):
+    print("\n=== 测试断开连接取消计算 ===")
+    calls = []
+    compute_signals = streaming.compute_signals
+
+    def slow_compute_signals(*args, **kwargs):
+        calls.append(kwargs)
+        time.sleep(0.02)
+        return compute_signals(*args, **kwargs)
+
+    monkeypatch.setattr(streaming, "compute_signals", slow_compute_signals)
+    grid = {"rsi_period": list(range(2, 300))}
+    with stream_client.websocket_connect("/api/ws/backtest") as websocket:
+        websocket.send_json({"type": "sweep", "strategy_id": 2, "start_date": "20150101", "grid": grid})
+        while websocket.receive_json()["type"] != "leaderboard":
+            pass
+    stopped_at = len(calls)
+    time.sleep(0.5)
+    assert len(calls) == stopped_at
+    assert stopped_at < len(grid["rsi_period"]) // 2
+    print(f"断开后停止，共计算 {stopped_at} 组参数")
+
+
+# 测试有界队列：数据消息在队列满时阻塞发送方，进度消息只保留最新一条，断开后阻塞的发送方退出
+def test_stream_channel_full_queue():
+    print("\n=== 测试消息通道背压 ===")
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        def get(channel):
+            return asyncio.run_coroutine_threadsafe(channel.get(), loop).result(timeout=5)
+
+        channel = streaming.StreamChannel(loop, maxsize=2)
+        channel.send({"n": 0})
+        channel.send({"n": 1})
+        sender = threading.Thread(target=channel.send, args=({"n": 2},))
+        sender.start()
+        sender.join(timeout=0.3)
+        assert sender.is_alive()
+
+        # 队列已满：进度消息不阻塞，只保留最新一条
+        channel.progress({"type": "progress", "completed": 1})
+        channel.progress({"type": "progress", "completed": 2})
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop).result(timeout=5)
+        received = [get(channel) for _ in range(4)]
+        sender.join(timeout=5)
+        assert not sender.is_alive()
+        assert received == [{"n": 0}, {"n": 1}, {"type": "progress", "completed": 2}, {"n": 2}]
+
+        # 阻塞中的发送方在客户端断开后抛出StreamCancelled
+        channel = streaming.StreamChannel(loop, maxsize=1)
+        channel.send({"n": 0})
+        errors = []
+
+        def blocked_send():
+            try:
+                channel.send({"n": 1})
+            except streaming.StreamCancelled as e:
+                errors.append(e)
+
+        sender = threading.Thread(target=blocked_send)
+        sender.start()
+        channel.cancel()
+        sender.join(timeout=5)
+        assert not sender.is_alive() and len(errors) == 1
+        with pytest.raises(streaming.StreamCancelled):
+            channel.progress({"type": "progress"})
+    finally:
+        # 让被取消的put完成取消后再停止事件循环
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))
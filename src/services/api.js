@@ -62,4 +62,37 @@ export const runBacktest = async (strategyId, stockCode = '000001', startDate =
     // 抛出错误，让前端处理
     throw new Error('回测失败，请检查股票代码是否正确或稍后重试');
   }
-};
\ No newline at end of file
+};
+
+// 以WebSocket流式运行回测或参数扫描，逐条回调服务器推送的消息
+// 消息类型：progress（阶段进度）、equity_chunk（净值曲线分块）、leaderboard（扫描排行榜）、result、error、done
+export const streamBacktest = (params, { onMessage, onError, onClose } = {}) => {
+  const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+  const socket = new WebSocket(`${protocol}//${window.location.host}/api/ws/backtest`);
+
+  socket.onopen = () => {
+    socket.send(JSON.stringify(params));
+  };
+  socket.onmessage = (event) => {
+    const message = JSON.parse(event.data);
+    if (message.type === 'error' && onError) {
+      onError(new Error(message.detail));
+    }
+    if (onMessage) {
+      onMessage(message);
+    }
+  };
+  socket.onerror = () => {
+    if (onError) {
+      onError(new Error('实时连接失败，请稍后重试'));
+    }
+  };
+  socket.onclose = () => {
+    if (onClose) {
+      onClose();
+    }
+  };
+
+  // 返回关闭函数，调用后服务器会停止计算
+  return () => socket.close();
+};
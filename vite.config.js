@@ -11,6 +11,7 @@ export default defineConfig({
         target: 'http://localhost:8081',
         changeOrigin: true,
         secure: false,
+        ws: true,
       }
     }
   }